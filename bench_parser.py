@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+"""Benchmark CSV ingest: regex parse_csv_rows vs bulk parse_csv_file."""
+
+import argparse
+import itertools
+import os
+import tempfile
+import time
+from typing import Callable
+
+import brin_parser
+from brin_lib import BlockRangeArray
+
+
+def _write_scaled_csv(src: str, dst: str, num_rows: int) -> None:
+    """Write a CSV with num_rows rows by repeating src's rows (with fresh
+    blknums)."""
+    with open(src) as f:
+        header, *rows = f.read().splitlines()
+    values = [row.split(",", 1)[1] for row in rows]
+    with open(dst, "w") as f:
+        f.write(header + "\n")
+        for i, value in zip(range(num_rows), itertools.cycle(values)):
+            f.write(f"{i * 128},{value}\n")
+
+
+def _time(fn: Callable[[], BlockRangeArray], repeat: int) -> tuple[float, int]:
+    """Returns best wall time of repeat runs, and number of rows parsed."""
+    best, num_rows = float("inf"), 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        num_rows = len(fn())
+        best = min(best, time.perf_counter() - t0)
+    return best, num_rows
+
+
+def _parse_rows(path: str) -> BlockRangeArray:
+    with open(path) as f:
+        return brin_parser.parse_csv_rows(f)
+
+
+def main() -> None:
+    p = argparse.ArgumentParser()
+    p.add_argument(
+        "-i",
+        dest="input",
+        default="examples/brinexport_large_example_full.csv",
+        help="export CSV to take row values from",
+    )
+    p.add_argument("-n", dest="num_rows", type=int, default=1_000_000)
+    p.add_argument("-r", dest="repeat", type=int, default=3)
+    args = p.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "brinexport_bench.csv")
+        _write_scaled_csv(args.input, path, args.num_rows)
+        size_mb = os.path.getsize(path) / 1e6
+        print(f"{args.num_rows} rows, {size_mb:.1f}MB")
+        results = {
+            "parse_csv_rows (regex)": _time(lambda: _parse_rows(path), args.repeat),
+            "parse_csv_file (bulk)": _time(
+                lambda: brin_parser.parse_csv_file(path), args.repeat
+            ),
+        }
+    for name, (secs, num_rows) in results.items():
+        print(f"{name:24s} {secs:7.3f}s  {num_rows / secs:12,.0f} rows/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+"""Benchmark each pipeline stage on synthetic exports (see brin_synth).
+
+Times and memory-profiles CSV writing/parsing, both overlap engines,
+filter_dt searches, the depth profile and the renderers, for each scenario
+and size. Results can be saved as JSON (-o) and compared against a previous
+run (-compare), exiting with status 1 if any stage regressed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable
+
+import numpy as np
+
+from brin_lib import from_micros
+from brin_overlap import compute_overlap, depth_profile
+from brin_parser import parse_csv_file, write_csv_file
+from brin_synth import SCENARIOS, generate
+from brin_viz import raster, svg, svg_stream
+from bro_relevant_blocks import filter_dt
+
+NUM_SEARCHES = 100
+
+# a stage gets the outputs of earlier stages (by stage name), and returns its
+# own output.
+Context = dict[str, Any]
+Stage = Callable[[Context], Any]
+
+
+def _stages(tmp: str) -> list[tuple[str, Stage]]:
+    csv_path = os.path.join(tmp, "brinexport_bench.csv")
+    svg_path = os.path.join(tmp, "viz.svg")
+
+    def searches(ctx: Context) -> int:
+        brs = ctx["parse_csv"]
+        times = np.linspace(brs.start.min(), brs.end.max(), NUM_SEARCHES)
+        return sum(len(filter_dt(brs, from_micros(int(t)), None)) for t in times)
+
+    return [
+        ("generate", lambda ctx: generate(ctx["num_ranges"], ctx["scenario"])),
+        ("write_csv", lambda ctx: write_csv_file(ctx["generate"], csv_path)),
+        ("parse_csv", lambda ctx: parse_csv_file(csv_path)),
+        ("overlap_sweep", lambda ctx: compute_overlap(ctx["parse_csv"], "sweep")),
+        ("overlap_first_fit", lambda ctx: compute_overlap(ctx["parse_csv"])),
+        ("filter_dt", searches),
+        ("depth_profile", lambda ctx: depth_profile(ctx["parse_csv"])),
+        ("svg_stream", lambda ctx: svg_stream(ctx["overlap_sweep"], svg_path)),
+        ("svg_drawsvg", lambda ctx: svg(ctx["overlap_sweep"], svg_path)),
+        ("raster", lambda ctx: raster(ctx["overlap_sweep"], max_height=2000)),
+    ]
+
+
+def run_benchmarks(
+    scenarios: list[str],
+    sizes: list[int],
+    measure_memory: bool = True,
+    max_first_fit: int = 100_000,
+    max_drawsvg: int = 100_000,
+) -> list[dict[str, Any]]:
+    """One result per (scenario, size, stage): wall time and, if
+    measure_memory, peak traced memory. The traced run is separate, since
+    tracing slows things down."""
+    # stages too slow for big inputs, and their size limit.
+    limits = {"overlap_first_fit": max_first_fit, "svg_drawsvg": max_drawsvg}
+    results = []
+    for scenario in scenarios:
+        for num_ranges in sizes:
+            with tempfile.TemporaryDirectory() as tmp:
+                ctx: Context = {"scenario": scenario, "num_ranges": num_ranges}
+                for name, stage in _stages(tmp):
+                    if num_ranges > limits.get(name, num_ranges):
+                        continue
+                    t0 = time.perf_counter()
+                    ctx[name] = stage(ctx)
+                    result = {
+                        "scenario": scenario,
+                        "num_ranges": num_ranges,
+                        "stage": name,
+                        "secs": round(time.perf_counter() - t0, 4),
+                    }
+                    if measure_memory:
+                        tracemalloc.start()
+                        stage(ctx)
+                        _, peak = tracemalloc.get_traced_memory()
+                        tracemalloc.stop()
+                        result["peak_mb"] = round(peak / 1e6, 2)
+                    print(format_result(result), file=sys.stderr)
+                    results.append(result)
+    return results
+
+
+def format_result(result: dict[str, Any]) -> str:
+    line = (
+        f"{result['scenario']:>8} {result['num_ranges']:>10,} "
+        f"{result['stage']:<18} {result['secs']:9.3f}s"
+    )
+    if "peak_mb" in result:
+        line += f"  peak {result['peak_mb']:9.1f}MB"
+    return line
+
+
+def _key(result: dict[str, Any]) -> tuple[str, int, str]:
+    return result["scenario"], result["num_ranges"], result["stage"]
+
+
+def compare_results(
+    previous: list[dict[str, Any]],
+    current: list[dict[str, Any]],
+    threshold: float = 1.25,
+    min_secs: float = 0.05,
+    min_mb: float = 1.0,
+) -> list[str]:
+    """Regressions of current against previous: stages at least threshold
+    times slower (or using threshold times more memory). Differences under
+    min_secs (min_mb) are ignored as noise."""
+    prev = {_key(r): r for r in previous}
+    regressions = []
+    for result in current:
+        if (old := prev.get(_key(result))) is None:
+            continue
+        for metric, floor, unit in [("secs", min_secs, "s"), ("peak_mb", min_mb, "MB")]:
+            if metric not in result or metric not in old:
+                continue
+            was, now = old[metric], result[metric]
+            if now - was >= floor and now >= was * threshold:
+                scenario, num_ranges, stage = _key(result)
+                regressions.append(
+                    f"{scenario} {num_ranges} {stage}: {metric} "
+                    f"{was}{unit} -> {now}{unit} ({now / max(was, 1e-9):.2f}x)"
+                )
+    return regressions
+
+
+def _meta() -> dict[str, Any]:
+    return {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def main() -> None:
+    p = argparse.ArgumentParser()
+    p.add_argument(
+        "-n",
+        dest="sizes",
+        type=int,
+        nargs="+",
+        default=[100_000, 1_000_000],
+        help="numbers of block ranges",
+    )
+    p.add_argument(
+        "-scenario", dest="scenarios", choices=SCENARIOS, nargs="+", default=SCENARIOS
+    )
+    p.add_argument("-no-mem", action="store_true", help="skip the memory profiling")
+    p.add_argument(
+        "-max-first-fit",
+        type=int,
+        default=100_000,
+        help="skip the first_fit engine above this size (it's O(n * levels))",
+    )
+    p.add_argument(
+        "-max-drawsvg",
+        type=int,
+        default=100_000,
+        help="skip the drawSvg renderer above this size",
+    )
+    p.add_argument("-o", dest="output", help="output JSON of results")
+    p.add_argument("-compare", help="JSON of a previous run to compare against")
+    p.add_argument(
+        "-threshold",
+        type=float,
+        default=1.25,
+        help="slowdown (or memory growth) ratio flagged as a regression",
+    )
+    args = p.parse_args()
+
+    results = run_benchmarks(
+        args.scenarios,
+        args.sizes,
+        not args.no_mem,
+        args.max_first_fit,
+        args.max_drawsvg,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"meta": _meta(), "results": results}, f, indent=1)
+            f.write("\n")
+        print(f"results in {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)["results"]
+        regressions = compare_results(previous, results, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
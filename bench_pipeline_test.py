@@ -0,0 +1,32 @@
+from bench_pipeline import compare_results, run_benchmarks
+
+
+def _result(stage: str, secs: float, peak_mb: float) -> dict[str, object]:
+    return {
+        "scenario": "jitter",
+        "num_ranges": 1000,
+        "stage": stage,
+        "secs": secs,
+        "peak_mb": peak_mb,
+    }
+
+
+def test_compare_results() -> None:
+    previous = [_result("parse_csv", 1.0, 100), _result("raster", 0.01, 1)]
+    current = [
+        _result("parse_csv", 1.3, 100),  # slower
+        _result("raster", 0.03, 1.5),  # 3x slower, but under the noise floors
+        _result("svg_stream", 9.0, 9),  # not in previous
+    ]
+    regressions = compare_results(previous, current, threshold=1.25)
+    assert len(regressions) == 1
+    assert regressions[0].startswith("jitter 1000 parse_csv: secs")
+    assert compare_results(previous, current, threshold=1.5) == []
+
+
+def test_run_benchmarks() -> None:
+    results = run_benchmarks(["stack"], [200], max_drawsvg=100)
+    stages = [r["stage"] for r in results]
+    assert stages[:3] == ["generate", "write_csv", "parse_csv"]
+    assert "svg_drawsvg" not in stages
+    assert all(r["secs"] >= 0 and r["peak_mb"] >= 0 for r in results)
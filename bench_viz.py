@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+"""Benchmark SVG rendering: drawSvg svg() vs streaming svg_stream()."""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Callable
+
+from brin_overlap import BrinOverlap, compute_overlap
+from brin_synth import generate
+from brin_viz import svg, svg_stream
+
+
+def _synthetic_overlap(num_ranges: int) -> BrinOverlap:
+    return compute_overlap(generate(num_ranges, "jitter"), engine="sweep")
+
+
+def _measure(fn: Callable[[], object], outfile: str) -> tuple[float, float, float]:
+    """Returns wall time, peak traced memory (MB) and output size (MB). Runs
+    fn twice, since tracing slows it down."""
+    t0 = time.perf_counter()
+    fn()
+    secs = time.perf_counter() - t0
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return secs, peak / 1e6, os.path.getsize(outfile) / 1e6
+
+
+def main() -> None:
+    p = argparse.ArgumentParser()
+    p.add_argument("-n", dest="num_ranges", type=int, default=100_000)
+    p.add_argument(
+        "-skip-drawsvg", action="store_true", help="skip the (slow) drawSvg renderer"
+    )
+    args = p.parse_args()
+
+    bro = _synthetic_overlap(args.num_ranges)
+    print(f"{args.num_ranges} block ranges, {len(bro.levels)} levels")
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, "viz.svg")
+        results = {}
+        if not args.skip_drawsvg:
+            results["svg (drawSvg)"] = _measure(lambda: svg(bro, out), out)
+        results["svg_stream"] = _measure(
+            lambda: svg_stream(bro, out, coalesce=False), out
+        )
+        results["svg_stream (coalesce)"] = _measure(lambda: svg_stream(bro, out), out)
+    for name, (secs, peak_mb, size_mb) in results.items():
+        print(
+            f"{name:24s} {secs:7.2f}s  peak {peak_mb:8.1f}MB  output {size_mb:7.1f}MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""Analyze many exports at once with a shared process pool.
+
+Each export (or each column of a multi-column export) gets its artifacts
+written to its own directory under the output directory: the overlap
+(.bro), a visualization and a histogram of block range spans. Its stats go
+in one row of a consolidated summary table. Workers are reused across
+exports, so interpreter startup and imports are paid once per worker.
+
+Exports at least large_bytes in size are "large": at most max_large of them
+are analyzed at a time, to cap memory use, while the other workers keep
+going with smaller ones. A failing export only fails its own rows. If it
+takes its worker process down with it (eg killed for running out of
+memory), the exports running alongside fail too, and the batch carries on
+with a new pool.
+"""
+
+from __future__ import annotations
+
+import csv
+import logging
+import os
+import time
+import traceback
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, Iterable, Literal, Optional, TextIO
+
+import numpy as np
+from matplotlib import pyplot as plt
+
+import brin_filenames
+from brin_cache import parse_csv_cached_by_attnum
+from brin_lib import BlockRangeArray
+from brin_overlap import Engine, compute_overlap, depth_profile, write_overlap
+from brin_viz import raster_png, svg_stream
+from bro_timespan_hist import plot_span_hist
+
+DEFAULT_LARGE_MB = 1024
+SUMMARY_CSV = "summary.csv"
+SUMMARY_JSON = "summary.json"
+SPAN_PERCENTILES = (50, 90, 99)
+SUMMARY_COLUMNS = [
+    "name",
+    "attnum",
+    "status",
+    "block_ranges",
+    "levels",
+    "depth_max",
+    "depth_p50",
+    "depth_p99",
+    "span_p50_hours",
+    "span_p90_hours",
+    "span_p99_hours",
+    "span_max_hours",
+    "worst_windows",
+    "secs",
+    "path",
+    "error",
+]
+
+Renderer = Literal["stream", "raster"]
+RENDERERS: tuple[Renderer, ...] = ("stream", "raster")
+
+
+@dataclass
+class BatchJob:
+    name: str  # unique, used for the artifact directory
+    path: str
+    size: int  # bytes
+
+
+@dataclass
+class BatchOptions:
+    out_dir: str
+    engine: Engine = "first_fit"
+    renderer: Renderer = "raster"
+    top_k: int = 3
+    window: timedelta = timedelta(days=1)
+    viz: bool = True
+    hist: bool = True
+
+
+def _job_name(relpath: str) -> str:
+    base = brin_filenames.strip_compression_ext(relpath)
+    base, _ = os.path.splitext(base)
+    return base.replace(os.sep, "__")
+
+
+def _job(path: str, root: str) -> BatchJob:
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        # missing or unreadable: analyze_export() fails it, with the reason.
+        size = 0
+    return BatchJob(_job_name(os.path.relpath(path, root)), path, size)
+
+
+def find_exports(directory: str, out_dir: Optional[str] = None) -> list[BatchJob]:
+    """Export CSVs (maybe compressed) anywhere under directory, except in a
+    batch's out_dir. Artifacts are named after their path relative to it, so
+    exports of different databases can share a file name."""
+    out = os.path.realpath(out_dir) if out_dir is not None else None
+    jobs = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames[:] = sorted(
+            d for d in dirnames if os.path.realpath(os.path.join(dirpath, d)) != out
+        )
+        at_out = os.path.realpath(dirpath) == out  # out_dir is directory
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            if at_out and filename == SUMMARY_CSV:
+                continue
+            if brin_filenames.is_export_csv(filename):
+                jobs.append(_job(path, directory))
+    return jobs
+
+
+def read_manifest(f: Iterable[str], root: str) -> list[BatchJob]:
+    """Export paths, one per line (blank lines and # comments are ignored).
+    Relative paths are relative to root, usually the manifest's directory."""
+    jobs = []
+    for line in f:
+        line = line.split("#", 1)[0].strip()
+        if line:
+            jobs.append(_job(os.path.join(root, line), root))
+    return jobs
+
+
+def find_jobs(source: str, out_dir: Optional[str] = None) -> list[BatchJob]:
+    """Jobs for a directory of exports (see find_exports), or a manifest file
+    listing them."""
+    if os.path.isdir(source):
+        return find_exports(source, out_dir)
+    with open(source) as f:
+        return read_manifest(f, os.path.dirname(source))
+
+
+def _span_stats(brs: BlockRangeArray) -> dict[str, float]:
+    hours = (brs.end - brs.start) / 3600e6
+    stats = {
+        f"span_p{q}_hours": round(float(p), 3)
+        for q, p in zip(SPAN_PERCENTILES, np.percentile(hours, SPAN_PERCENTILES))
+    }
+    stats["span_max_hours"] = round(float(hours.max()), 3)
+    return stats
+
+
+def _analyze_column(
+    brs: BlockRangeArray, out_dir: str, options: BatchOptions
+) -> dict[str, Any]:
+    row: dict[str, Any] = {"block_ranges": len(brs)}
+    if len(brs) == 0:
+        return row
+    os.makedirs(out_dir, exist_ok=True)
+    profile = depth_profile(brs)
+    overlap = compute_overlap(brs, options.engine)
+    write_overlap(
+        overlap, os.path.join(out_dir, "overlap" + brin_filenames.OVERLAP_BINARY_EXT)
+    )
+    row.update(
+        {
+            "levels": len(overlap.levels),
+            "depth_max": profile.max(),
+            "depth_p50": profile.percentile(50),
+            "depth_p99": profile.percentile(99),
+            "worst_windows": [
+                {"start": start.isoformat(), "end": end.isoformat(), "depth": depth}
+                for start, end, depth in profile.worst_windows(
+                    options.top_k, options.window
+                )
+            ],
+        }
+    )
+    row.update(_span_stats(brs))
+    if options.viz and options.renderer == "raster":
+        raster_png(overlap, os.path.join(out_dir, "vizoverlap.png"), max_height=2000)
+    elif options.viz:
+        svg_stream(overlap, os.path.join(out_dir, "vizoverlap.svg"))
+    if options.hist:
+        plot_span_hist(
+            brs, os.path.join(out_dir, "timespanhist.png"), False, None, None
+        )
+        plt.close("all")
+    return row
+
+
+def analyze_export(job: BatchJob, options: BatchOptions) -> list[dict[str, Any]]:
+    """Summary rows of an export, one per column. Errors are caught and
+    reported in the rows, so one bad export doesn't stop the batch."""
+    t0 = time.perf_counter()
+    base = {"name": job.name, "path": job.path}
+    try:
+        by_attnum = parse_csv_cached_by_attnum(job.path)
+        rows = []
+        for attnum, brs in by_attnum.items():
+            out_dir = os.path.join(options.out_dir, job.name)
+            if len(by_attnum) > 1:
+                out_dir = brin_filenames.with_attnum(out_dir, attnum)
+            row = {**base, "attnum": attnum, "status": "ok"}
+            row.update(_analyze_column(brs, out_dir, options))
+            rows.append(row)
+    except Exception as e:
+        logging.debug(traceback.format_exc())
+        rows = [{**base, "status": "failed", "error": f"{type(e).__name__}: {e}"}]
+    for row in rows:
+        row["secs"] = round(time.perf_counter() - t0, 3)
+    return rows
+
+
+def _failed(job: BatchJob, error: str) -> list[dict[str, Any]]:
+    return [{"name": job.name, "path": job.path, "status": "failed", "error": error}]
+
+
+def run_batch(
+    jobs: list[BatchJob],
+    options: BatchOptions,
+    workers: Optional[int] = None,
+    max_large: int = 1,
+    large_bytes: int = DEFAULT_LARGE_MB * 10**6,
+) -> list[dict[str, Any]]:
+    """Analyze every job in a pool of workers (None for the CPU count).
+    Returns the summary rows in job order."""
+    if max_large < 1:
+        raise ValueError(f"max_large must be at least 1, got {max_large}")
+    workers = workers or os.cpu_count() or 1
+    # largest first, so the big ones don't finish last.
+    by_size = sorted(range(len(jobs)), key=lambda i: -jobs[i].size)
+    large = deque(i for i in by_size if jobs[i].size >= large_bytes)
+    small = deque(i for i in by_size if jobs[i].size < large_bytes)
+    results: dict[int, list[dict[str, Any]]] = {}
+    while large or small:
+        executor = ProcessPoolExecutor(workers)
+        running: dict[Future[list[dict[str, Any]]], int] = {}
+        try:
+            while large or small or running:
+                num_large = sum(jobs[i].size >= large_bytes for i in running.values())
+                while len(running) < workers:
+                    if large and num_large < max_large:
+                        i = large.popleft()
+                        num_large += 1
+                    elif small:
+                        i = small.popleft()
+                    else:
+                        break
+                    running[executor.submit(analyze_export, jobs[i], options)] = i
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = running[future]
+                    results[i] = future.result()
+                    del running[future]
+                    logging.info(f"{jobs[i].name}: {results[i][0]['status']}")
+        except BrokenProcessPool:
+            # a worker died (eg killed for using too much memory), which
+            # breaks the pool. There's no telling which job it was running,
+            # so fail all the running ones and carry on with a new pool.
+            for i in running.values():
+                results[i] = _failed(jobs[i], "worker process died")
+                logging.warning(f"{jobs[i].name}: worker process died")
+        finally:
+            executor.shutdown(cancel_futures=True)
+    return [row for i in range(len(jobs)) for row in results[i]]
+
+
+def format_worst_windows(windows: list[dict[str, Any]]) -> str:
+    return " ".join(f"{w['start']}..{w['end']}:{w['depth']}" for w in windows)
+
+
+def write_summary(rows: list[dict[str, Any]], f: TextIO) -> None:
+    writer = csv.DictWriter(f, SUMMARY_COLUMNS)
+    writer.writeheader()
+    for row in rows:
+        row = dict(row)
+        row["worst_windows"] = format_worst_windows(row.get("worst_windows", []))
+        writer.writerow(row)
+
+
+def format_summary(rows: list[dict[str, Any]]) -> str:
+    lines = [
+        f"{'name':<40} {'status':<7} {'ranges':>10} {'levels':>7} "
+        f"{'depth':>6} {'p99':>5} {'span p50':>9} {'span p99':>9}"
+    ]
+    for row in rows:
+        name = row["name"] + (f" ({row['attnum']})" if "attnum" in row else "")
+        if row["status"] != "ok":
+            lines.append(f"{name:<40} {row['status']:<7} {row['error']}")
+        elif row["block_ranges"] == 0:
+            lines.append(f"{name:<40} {row['status']:<7} {0:>10}")
+        else:
+            lines.append(
+                f"{name:<40} {row['status']:<7} {row['block_ranges']:>10,} "
+                f"{row['levels']:>7} {row['depth_max']:>6} {row['depth_p99']:>5} "
+                f"{row['span_p50_hours']:>8.1f}h {row['span_p99_hours']:>8.1f}h"
+            )
+    return "\n".join(lines)
@@ -0,0 +1,132 @@
+import gzip
+import json
+import os
+import shutil
+from typing import Any
+
+import pytest
+
+import brin_batch
+from brin_batch import BatchJob, BatchOptions, find_jobs, run_batch, write_summary
+from brin_overlap import read_overlap
+
+NO_OVERLAPS = "testdata/brinexport_no_overlaps.csv"
+TEST_OVERLAPS = "testdata/brinexport_test_overlaps.csv"
+MULTI_ATTNUM = "testdata/brinexport_multi_attnum.csv"
+
+
+@pytest.fixture
+def exports(tmp_path: str, monkeypatch: pytest.MonkeyPatch) -> str:
+    monkeypatch.setenv("BRO_CACHE_DIR", os.path.join(tmp_path, "cache"))
+    root = os.path.join(tmp_path, "exports")
+    os.makedirs(os.path.join(root, "db1"))
+    os.makedirs(os.path.join(root, "db2"))
+    shutil.copy(NO_OVERLAPS, os.path.join(root, "db1", "brinexport.csv"))
+    with open(TEST_OVERLAPS, "rb") as f:
+        with gzip.open(os.path.join(root, "db2", "brinexport.csv.gz"), "wb") as g:
+            g.write(f.read())
+    shutil.copy(MULTI_ATTNUM, os.path.join(root, "multi.csv"))
+    with open(os.path.join(root, "broken.csv"), "w") as f:
+        f.write("not,an,export\n1,2\n")
+    with open(os.path.join(root, "notes.txt"), "w") as f:
+        f.write("not an export\n")
+    return root
+
+
+def test_find_jobs(exports: str) -> None:
+    names = ["broken", "multi", "db1__brinexport", "db2__brinexport"]
+    assert [job.name for job in find_jobs(exports)] == names
+    manifest = os.path.join(exports, "manifest.txt")
+    with open(manifest, "w") as f:
+        f.write("# nightly exports\nmulti.csv\n\ndb2/brinexport.csv.gz  # gzipped\n")
+    jobs = find_jobs(manifest)
+    assert [job.name for job in jobs] == ["multi", "db2__brinexport"]
+    assert jobs[1].size == os.path.getsize(
+        os.path.join(exports, "db2/brinexport.csv.gz")
+    )
+
+
+def test_find_jobs_skips_out_dir(exports: str) -> None:
+    names = ["broken", "multi", "db1__brinexport", "db2__brinexport"]
+    for out_dir in [os.path.join(exports, "out"), exports]:
+        os.makedirs(os.path.join(out_dir, "multi_attnum1"), exist_ok=True)
+        with open(os.path.join(out_dir, "summary.csv"), "w") as f:
+            f.write("name,status\n")
+        assert [job.name for job in find_jobs(exports, out_dir)] == names
+        os.remove(os.path.join(out_dir, "summary.csv"))
+    # notes.txt and names merely ending in "csv" aren't exports.
+    open(os.path.join(exports, "notacsv"), "w").close()
+    assert "notacsv" not in [job.name for job in find_jobs(exports)]
+
+
+def test_run_batch_bad_manifest_entry(exports: str, tmp_path: str) -> None:
+    manifest = os.path.join(exports, "manifest.txt")
+    with open(manifest, "w") as f:
+        f.write("missing.csv\ndb1/brinexport.csv\n")
+    jobs = find_jobs(manifest)
+    assert [(job.name, job.size) for job in jobs][0] == ("missing", 0)
+    rows = run_batch(jobs, BatchOptions(str(tmp_path), viz=False, hist=False), 1)
+    assert [(row["name"], row["status"]) for row in rows] == [
+        ("missing", "failed"),
+        ("db1__brinexport", "ok"),
+    ]
+    assert "FileNotFoundError" in rows[0]["error"]
+    with pytest.raises(ValueError):
+        run_batch(jobs, BatchOptions(str(tmp_path)), 1, max_large=0)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_run_batch(exports: str, tmp_path: str, workers: int) -> None:
+    out = os.path.join(tmp_path, "out")
+    jobs = find_jobs(exports)
+    # everything counts as large, so they run one at a time.
+    rows = run_batch(jobs, BatchOptions(out), workers, max_large=1, large_bytes=0)
+    statuses = [(row["name"], row.get("attnum"), row["status"]) for row in rows]
+    assert statuses == [
+        ("broken", None, "failed"),
+        ("multi", 1, "ok"),
+        ("multi", 3, "ok"),
+        ("db1__brinexport", 1, "ok"),
+        ("db2__brinexport", 1, "ok"),
+    ]
+    assert "ValueError" in rows[0]["error"]
+    by_name = {(row["name"], row.get("attnum")): row for row in rows}
+    # multi's columns are the other two exports.
+    for a, b in [
+        (("multi", 1), ("db1__brinexport", 1)),
+        (("multi", 3), ("db2__brinexport", 1)),
+    ]:
+        for key in ["block_ranges", "levels", "depth_max", "span_p99_hours"]:
+            assert by_name[a][key] == by_name[b][key]
+    assert by_name["db1__brinexport", 1]["depth_max"] == 1
+    assert by_name["db2__brinexport", 1]["depth_max"] > 1
+    for subdir in ["db1__brinexport", "multi_attnum1", "multi_attnum3"]:
+        files = sorted(os.listdir(os.path.join(out, subdir)))
+        assert files == ["overlap.bro", "timespanhist.png", "vizoverlap.png"]
+    bro = read_overlap(os.path.join(out, "db2__brinexport", "overlap.bro"))
+    assert len(bro.levels) == by_name["db2__brinexport", 1]["levels"]
+    # the summary is plain data.
+    json.dumps(rows)
+    with open(os.path.join(tmp_path, "summary.csv"), "w", newline="") as f:
+        write_summary(rows, f)
+
+
+def _die_on_broken(job: BatchJob, options: BatchOptions) -> list[dict[str, Any]]:
+    if job.name == "broken":
+        os._exit(1)
+    return [{"name": job.name, "status": "ok"}]
+
+
+def test_run_batch_worker_dies(
+    exports: str, tmp_path: str, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(brin_batch, "analyze_export", _die_on_broken)
+    jobs = find_jobs(exports)
+    rows = run_batch(jobs, BatchOptions(str(tmp_path)), workers=1)
+    assert [(row["name"], row["status"]) for row in rows] == [
+        ("broken", "failed"),
+        ("multi", "ok"),
+        ("db1__brinexport", "ok"),
+        ("db2__brinexport", "ok"),
+    ]
+    assert rows[0]["error"] == "worker process died"
@@ -0,0 +1,163 @@
+"""Cache of parsed exports, shared by the bro_*.py tools.
+
+Parsing a multi-GB export takes a while, and it's common to run several
+tools on the same one. parse_csv_cached() saves the parsed (unfiltered)
+columns in a cache directory, keyed by the export's path, size and mtime,
+so later runs just memory map them. Multi-column exports (ATTNUM=-1) are
+cached with their attnum column, so every column is loaded at once. Date
+filters are applied to the cached columns, so runs with different
+-after/-before share an entry.
+
+The cache lives in $BRO_CACHE_DIR (default ~/.cache/brin-overlap) and is
+kept under $BRO_CACHE_MAX_MB (default 4096) by evicting the least recently
+used entries. BRO_CACHE_MAX_MB=0 disables it.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+from datetime import datetime
+from typing import Literal, Optional
+
+import numpy as np
+
+from brin_filenames import STDIN
+from brin_lib import BlockRangeArray
+from brin_parser import (
+    DEFAULT_ATTNUM,
+    parse_csv_file_by_attnum,
+    select_attnum,
+    split_by_attnum,
+)
+
+CACHE_VERSION = 1  # bump when the parse output changes
+CACHE_EXT = ".npy"
+DEFAULT_MAX_MB = 4096
+
+
+def default_cache_dir() -> str:
+    if (path := os.environ.get("BRO_CACHE_DIR")) is not None:
+        return path
+    xdg_cache = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(xdg_cache, "brin-overlap")
+
+
+def default_max_bytes() -> int:
+    return int(float(os.environ.get("BRO_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1e6)
+
+
+def cache_key(filepath: str) -> str:
+    """Changes whenever the file is replaced or modified."""
+    st = os.stat(filepath)
+    identity = (
+        f"{CACHE_VERSION}\0{os.path.abspath(filepath)}\0{st.st_size}\0{st.st_mtime_ns}"
+    )
+    return hashlib.blake2b(identity.encode(), digest_size=16).hexdigest()
+
+
+# entries are blknum, start, end columns, with an attnum column first for
+# multi-column exports.
+def _load(path: str) -> Optional[dict[int, BlockRangeArray]]:
+    try:
+        cols = np.load(path, mmap_mode="r")
+    except (OSError, ValueError):
+        return None  # missing, or a partial write by an older version
+    if cols.dtype != np.int64 or cols.ndim != 2 or cols.shape[0] not in (3, 4):
+        return None
+    # mark as recently used, for eviction.
+    try:
+        os.utime(path)
+    except OSError:
+        pass  # eg a shared, read-only cache: still readable
+    if cols.shape[0] == 3:
+        return {DEFAULT_ATTNUM: BlockRangeArray(cols[0], cols[1], cols[2])}
+    return split_by_attnum(cols[0], BlockRangeArray(cols[1], cols[2], cols[3]))
+
+
+def _store(by_attnum: dict[int, BlockRangeArray], path: str) -> None:
+    brs = BlockRangeArray.concatenate(list(by_attnum.values()))
+    cols = [brs.blknum, brs.start, brs.end]
+    if list(by_attnum) != [DEFAULT_ATTNUM]:
+        lengths = [len(column) for column in by_attnum.values()]
+        cols.insert(0, np.repeat(np.array(list(by_attnum), np.int64), lengths))
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.stack(cols))
+    os.replace(tmp_path, path)
+
+
+def evict(cache_dir: str, max_bytes: int) -> list[str]:
+    """Remove the least recently used entries until the cache fits in
+    max_bytes. Returns the removed paths."""
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith(CACHE_EXT):
+            st = os.stat(os.path.join(cache_dir, name))
+            entries.append((st.st_mtime_ns, st.st_size, name))
+    total = sum(size for _, size, _ in entries)
+    removed = []
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        path = os.path.join(cache_dir, name)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass  # evicted by another process
+        total -= size
+        removed.append(path)
+    return removed
+
+
+def parse_csv_cached_by_attnum(
+    filepath: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    match_type: Literal["overlap", "within"] = "overlap",
+    cache_dir: Optional[str] = None,
+    max_bytes: Optional[int] = None,
+) -> dict[int, BlockRangeArray]:
+    """parse_csv_file_by_attnum, but reusing an earlier parse of the same
+    file. stdin isn't cached."""
+    cache_dir = default_cache_dir() if cache_dir is None else cache_dir
+    max_bytes = default_max_bytes() if max_bytes is None else max_bytes
+    if max_bytes <= 0 or filepath == STDIN:
+        return parse_csv_file_by_attnum(filepath, start, end, match_type)
+    path = os.path.join(cache_dir, cache_key(filepath) + CACHE_EXT)
+    by_attnum = _load(path)
+    if by_attnum is not None:
+        logging.info(f"using cached parse of {filepath}")
+    else:
+        by_attnum = parse_csv_file_by_attnum(filepath)
+        # up to four int64 columns, plus the .npy header.
+        if sum(len(brs) for brs in by_attnum.values()) * 8 * 4 < max_bytes:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                _store(by_attnum, path)
+                for removed in evict(cache_dir, max_bytes):
+                    logging.info(f"evicted {removed} from the parse cache")
+            except OSError as e:
+                # the cache is only an optimization.
+                logging.warning(f"couldn't cache parse of {filepath}: {e}")
+    return {
+        attnum: brs.filter_dates(match_type, start, end)
+        for attnum, brs in by_attnum.items()
+    }
+
+
+def parse_csv_cached(
+    filepath: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    match_type: Literal["overlap", "within"] = "overlap",
+    cache_dir: Optional[str] = None,
+    max_bytes: Optional[int] = None,
+    attnum: Optional[int] = None,
+) -> BlockRangeArray:
+    """parse_csv_file, but reusing an earlier parse of the same file."""
+    by_attnum = parse_csv_cached_by_attnum(
+        filepath, start, end, match_type, cache_dir, max_bytes
+    )
+    return select_attnum(by_attnum, attnum)
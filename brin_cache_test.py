@@ -0,0 +1,112 @@
+import os
+import shutil
+import time
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from brin_cache import (
+    CACHE_EXT,
+    cache_key,
+    evict,
+    parse_csv_cached,
+    parse_csv_cached_by_attnum,
+)
+from brin_parser import parse_csv_file, parse_csv_file_by_attnum
+
+EXAMPLE = "examples/brinexport_large_example_201903_to_202005.csv"
+MULTI_ATTNUM_EXAMPLE = "testdata/brinexport_multi_attnum.csv"
+
+
+def _entries(cache_dir: str) -> list[str]:
+    return sorted(n for n in os.listdir(cache_dir) if n.endswith(CACHE_EXT))
+
+
+def test_parse_csv_cached(tmp_path: str) -> None:
+    cache_dir = os.path.join(tmp_path, "cache")
+    expected = parse_csv_file(EXAMPLE)
+    first = parse_csv_cached(EXAMPLE, cache_dir=cache_dir)
+    assert len(_entries(cache_dir)) == 1
+    second = parse_csv_cached(EXAMPLE, cache_dir=cache_dir)
+    assert not second.blknum.flags.writeable  # memory mapped
+    for brs in [first, second]:
+        assert np.array_equal(brs.blknum, expected.blknum)
+        assert np.array_equal(brs.end, expected.end)
+    # date filters apply to the cached columns.
+    after = datetime(2019, 9, 1)
+    for match_type in ["overlap", "within"]:
+        filtered = parse_csv_cached(
+            EXAMPLE, after, None, match_type, cache_dir=cache_dir  # type: ignore
+        )
+        assert np.array_equal(
+            filtered.start,
+            parse_csv_file(EXAMPLE, after, None, match_type).start,  # type: ignore
+        )
+    assert len(_entries(cache_dir)) == 1
+    # disabled.
+    disabled = os.path.join(tmp_path, "disabled")
+    parse_csv_cached(EXAMPLE, cache_dir=disabled, max_bytes=0)
+    assert not os.path.exists(disabled)
+
+
+def test_parse_csv_cached_read_only(
+    tmp_path: str, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    cache_dir = os.path.join(tmp_path, "cache")
+    expected = parse_csv_cached(EXAMPLE, cache_dir=cache_dir)
+
+    def utime(path: str) -> None:
+        raise PermissionError(f"read-only: {path}")
+
+    monkeypatch.setattr(os, "utime", utime)
+    cached = parse_csv_cached(EXAMPLE, cache_dir=cache_dir)
+    assert not cached.blknum.flags.writeable  # still a cache hit
+    assert np.array_equal(cached.start, expected.start)
+
+
+def test_cache_key_changes_with_file(tmp_path: str) -> None:
+    path = os.path.join(tmp_path, "brinexport.csv")
+    shutil.copyfile(EXAMPLE, path)
+    key = cache_key(path)
+    assert cache_key(path) == key
+    with open(path, "a") as f:
+        f.write("999999999,{2021-01-01 00:00:00 .. 2021-01-02 00:00:00}\n")
+    assert cache_key(path) != key
+    cache_dir = os.path.join(tmp_path, "cache")
+    assert parse_csv_cached(path, cache_dir=cache_dir).blknum[-1] == 999999999
+
+
+def test_evict_lru(tmp_path: str) -> None:
+    for i, name in enumerate(["a", "b", "c"]):
+        path = os.path.join(tmp_path, name + CACHE_EXT)
+        with open(path, "wb") as f:
+            f.write(b"x" * 100)
+        # b is the most recently used, then c, then a.
+        mtime = time.time() + {"a": 0, "b": 20, "c": 10}[name]
+        os.utime(path, (mtime, mtime))
+    with open(os.path.join(tmp_path, "other.txt"), "w") as f:
+        f.write("not a cache entry" * 100)
+    assert evict(str(tmp_path), 300) == []
+    removed = evict(str(tmp_path), 150)
+    assert [os.path.basename(p) for p in removed] == ["a" + CACHE_EXT, "c" + CACHE_EXT]
+    assert _entries(str(tmp_path)) == ["b" + CACHE_EXT]
+
+
+def test_parse_csv_cached_by_attnum(tmp_path: str) -> None:
+    path = MULTI_ATTNUM_EXAMPLE
+    cache_dir = os.path.join(tmp_path, "cache")
+    expected = parse_csv_file_by_attnum(path)
+    parse_csv_cached_by_attnum(path, cache_dir=cache_dir)
+    cached = parse_csv_cached_by_attnum(path, cache_dir=cache_dir)
+    assert len(_entries(cache_dir)) == 1
+    assert list(cached) == list(expected) == [1, 3]
+    for attnum, brs in cached.items():
+        assert not brs.blknum.flags.writeable  # memory mapped
+        assert np.array_equal(brs.blknum, expected[attnum].blknum)
+        assert np.array_equal(brs.start, expected[attnum].start)
+    after = datetime(2000, 1, 3)
+    assert np.array_equal(
+        parse_csv_cached(path, after, cache_dir=cache_dir, attnum=3).end,
+        parse_csv_file(path, after, attnum=3).end,
+    )
@@ -0,0 +1,215 @@
+"""Compare two exports of the same BRIN index, eg before and after a VACUUM,
+bulk delete or brin_summarize_new_values().
+
+Exports are joined on blknum (see brin_lib.join_by_blknum), so the diff is a
+few vectorized passes over the columns: tens of millions of block ranges take
+seconds, mostly spent parsing.
+"""
+
+from __future__ import annotations
+
+import csv
+import heapq
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, Iterator, Literal, Optional, TextIO
+
+import numpy as np
+
+from brin_lib import (
+    BlockRange,
+    BlockRangeArray,
+    BlockRanges,
+    BoolArray,
+    Int64Array,
+    as_block_range_array,
+    from_micros,
+    join_by_blknum,
+)
+from brin_overlap import DepthProfile, depth_profile
+from brin_workload import Workload, count_matching
+
+Change = Literal["added", "removed", "widened", "narrowed", "shifted"]
+CHANGES: tuple[Change, ...] = ("added", "removed", "widened", "narrowed", "shifted")
+# change, blknum, old and new version (None if added or removed).
+ChangeRow = tuple[Change, int, Optional[BlockRange], Optional[BlockRange]]
+
+
+@dataclass(eq=False)
+class ExportDiff:
+    """Block ranges of old missing from new (removed), of new missing from
+    old (added), and the old and new versions of the changed ones (before[i]
+    became after[i])."""
+
+    removed: BlockRangeArray
+    added: BlockRangeArray
+    before: BlockRangeArray
+    after: BlockRangeArray
+    unchanged: int
+
+    def widened(self) -> BoolArray:
+        """Changed block ranges whose new span covers the old one."""
+        return (self.after.start <= self.before.start) & (
+            self.after.end >= self.before.end
+        )
+
+    def narrowed(self) -> BoolArray:
+        """Changed block ranges whose new span is within the old one."""
+        return (self.after.start >= self.before.start) & (
+            self.after.end <= self.before.end
+        )
+
+    def shifted(self) -> BoolArray:
+        """Changed block ranges that neither widened nor narrowed."""
+        return ~self.widened() & ~self.narrowed()
+
+    def counts(self) -> dict[str, int]:
+        return {
+            "unchanged": self.unchanged,
+            "added": len(self.added),
+            "removed": len(self.removed),
+            "widened": int(self.widened().sum()),
+            "narrowed": int(self.narrowed().sum()),
+            "shifted": int(self.shifted().sum()),
+        }
+
+    def changes(self) -> Iterator[ChangeRow]:
+        """Every difference, in blknum order."""
+        widened, narrowed = self.widened().tolist(), self.narrowed().tolist()
+
+        def changed() -> Iterator[ChangeRow]:
+            for before, after, w, n in zip(self.before, self.after, widened, narrowed):
+                change: Change = "widened" if w else "narrowed" if n else "shifted"
+                yield change, before.blknum, before, after
+
+        return heapq.merge(
+            (("added", br.blknum, None, br) for br in self.added),
+            (("removed", br.blknum, br, None) for br in self.removed),
+            changed(),
+            key=lambda row: row[1],
+        )
+
+
+def write_changes(diff: ExportDiff, f: TextIO) -> None:
+    """CSV of every difference, in blknum order."""
+    writer = csv.writer(f)
+    writer.writerow(
+        ["change", "blknum", "old_start", "old_end", "new_start", "new_end"]
+    )
+    for change, blknum, old, new in diff.changes():
+        writer.writerow(
+            [change, blknum]
+            + ([old.start.isoformat(), old.end.isoformat()] if old else ["", ""])
+            + ([new.start.isoformat(), new.end.isoformat()] if new else ["", ""])
+        )
+
+
+def diff_exports(old_export: BlockRanges, new_export: BlockRanges) -> ExportDiff:
+    old = as_block_range_array(old_export)
+    new = as_block_range_array(new_export)
+    old_idx, new_idx = join_by_blknum(old, new)
+    same = (old.start[old_idx] == new.start[new_idx]) & (
+        old.end[old_idx] == new.end[new_idx]
+    )
+    old_matched = np.zeros(len(old), np.bool_)
+    old_matched[old_idx] = True
+    new_matched = np.zeros(len(new), np.bool_)
+    new_matched[new_idx] = True
+    return ExportDiff(
+        removed=old[~old_matched].sorted_by_blknum(),
+        added=new[~new_matched].sorted_by_blknum(),
+        before=old[old_idx[~same]],
+        after=new[new_idx[~same]],
+        unchanged=int(same.sum()),
+    )
+
+
+def _depth_summary(profile: DepthProfile) -> dict[str, float]:
+    return {
+        "max": profile.max(),
+        "p99": profile.percentile(99),
+        "p50": profile.percentile(50),
+        "mean": round(profile.mean(), 2),
+    }
+
+
+def _span(*brss: BlockRangeArray) -> tuple[int, int]:
+    non_empty = [brs for brs in brss if len(brs)]
+    return (
+        min(int(brs.start.min()) for brs in non_empty),
+        max(int(brs.end.max()) for brs in non_empty),
+    )
+
+
+def window_costs(
+    old: BlockRangeArray, new: BlockRangeArray, span: timedelta
+) -> tuple[Workload, Int64Array, Int64Array]:
+    """Block ranges matching every window of length span over both exports,
+    in old and in new."""
+    first, last = _span(old, new)
+    workload = Workload.every(span, from_micros(first), from_micros(last))
+    return workload, count_matching(old, workload), count_matching(new, workload)
+
+
+def diff_report(
+    old_export: BlockRanges,
+    new_export: BlockRanges,
+    top_k: int = 5,
+    window: timedelta = timedelta(days=1),
+) -> dict[str, Any]:
+    """Change counts, overlap depth before and after, and the windows of
+    length `window` whose query cost (matching block ranges) grew most."""
+    old = as_block_range_array(old_export)
+    new = as_block_range_array(new_export)
+    diff = diff_exports(old, new)
+    report: dict[str, Any] = {
+        "old_block_ranges": len(old),
+        "new_block_ranges": len(new),
+        **diff.counts(),
+    }
+    if len(old) == 0 or len(new) == 0:
+        return report
+    report["depth_old"] = _depth_summary(depth_profile(old))
+    report["depth_new"] = _depth_summary(depth_profile(new))
+    workload, old_cost, new_cost = window_costs(old, new, window)
+    delta = new_cost - old_cost
+    report["windows_worse"] = int((delta > 0).sum())
+    report["windows_better"] = int((delta < 0).sum())
+    worst = np.argsort(-delta, kind="stable")[:top_k]
+    report["worse_windows"] = [
+        {
+            "start": from_micros(workload.start[i]).isoformat(),
+            "end": from_micros(workload.end[i]).isoformat(),
+            "old": int(old_cost[i]),
+            "new": int(new_cost[i]),
+        }
+        for i in worst.tolist()
+        if delta[i] > 0
+    ]
+    return report
+
+
+def format_report(report: dict[str, Any]) -> str:
+    lines = [
+        f"block ranges: {report['old_block_ranges']} -> {report['new_block_ranges']}",
+        "  ".join(f"{k} {report[k]}" for k in ["unchanged", *CHANGES]),
+    ]
+    if "depth_old" in report:
+        old, new = report["depth_old"], report["depth_new"]
+        lines.append(
+            "depth: "
+            + "  ".join(
+                f"{k} {old[k]} -> {new[k]}" for k in ("max", "p99", "p50", "mean")
+            )
+        )
+        lines.append(
+            f"windows: {report['windows_worse']} worse, "
+            f"{report['windows_better']} better"
+        )
+        if report["worse_windows"]:
+            lines.append("most worsened windows (matching block ranges):")
+            lines += [
+                f"  {w['old']:6d} -> {w['new']:6d}  {w['start']} .. {w['end']}"
+                for w in report["worse_windows"]
+            ]
+    return "\n".join(lines)
@@ -0,0 +1,71 @@
+import io
+from datetime import datetime, timedelta
+
+from brin_diff import diff_exports, diff_report, format_report, write_changes
+from brin_lib import BlockRange, BlockRangeArray, to_micros
+from brin_parser import parse_csv_file
+
+ts = datetime.fromtimestamp
+
+
+def test_diff_exports() -> None:
+    old = [
+        BlockRange(0, ts(0), ts(10)),
+        BlockRange(128, ts(10), ts(20)),
+        BlockRange(256, ts(20), ts(30)),
+        BlockRange(384, ts(30), ts(40)),
+        BlockRange(512, ts(40), ts(50)),
+    ]
+    new = [
+        BlockRange(0, ts(0), ts(10)),  # unchanged
+        BlockRange(128, ts(5), ts(20)),  # widened
+        BlockRange(384, ts(32), ts(38)),  # narrowed
+        BlockRange(512, ts(45), ts(55)),  # shifted
+        BlockRange(640, ts(50), ts(60)),  # added
+    ]  # 256 removed
+    diff = diff_exports(old, new)
+    assert diff.counts() == {
+        "unchanged": 1,
+        "added": 1,
+        "removed": 1,
+        "widened": 1,
+        "narrowed": 1,
+        "shifted": 1,
+    }
+    rows = [(change, blknum) for change, blknum, _, _ in diff.changes()]
+    assert rows == [
+        ("widened", 128),
+        ("removed", 256),
+        ("narrowed", 384),
+        ("shifted", 512),
+        ("added", 640),
+    ]
+    f = io.StringIO()
+    write_changes(diff, f)
+    lines = f.getvalue().splitlines()
+    assert lines[0] == "change,blknum,old_start,old_end,new_start,new_end"
+    assert lines[2].startswith("removed,256,") and lines[2].endswith(",,")
+    assert lines[5].startswith("added,640,,,")
+
+
+def test_diff_report_worse_windows() -> None:
+    brs = parse_csv_file("examples/brinexport_large_example_201903_to_202005.csv")
+    same = diff_report(brs, brs)
+    assert same["unchanged"] == len(brs)
+    assert same["windows_worse"] == 0
+    assert same["depth_old"] == same["depth_new"]
+    # widen a block range of 2019-03-26 20:00 to end on 2019-07-01.
+    assert brs[1].end < datetime(2019, 3, 27)
+    end = brs.end.copy()
+    end[1] = to_micros(datetime(2019, 7, 1))
+    new = BlockRangeArray(brs.blknum, brs.start, end)
+    report = diff_report(brs, new, top_k=3, window=timedelta(days=1))
+    assert report["widened"] == 1
+    # every day from 03-27 to 07-01 (inclusive) matches one more block range.
+    assert report["windows_worse"] == 97
+    assert report["windows_better"] == 0
+    assert len(report["worse_windows"]) == 3
+    for w in report["worse_windows"]:
+        assert w["new"] == w["old"] + 1
+    assert "windows:" in format_report(report)
+    assert diff_report([], brs)["added"] == len(brs)
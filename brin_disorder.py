@@ -0,0 +1,162 @@
+"""Where in the table did insertion order break down?
+
+A well correlated BRIN index has start times increasing with blknum. This
+splits the block ranges (in blknum order) into windows of a fixed number of
+block ranges and computes, for each window:
+
+- the Spearman rank correlation of blknum against start time (1 is
+  perfectly ordered, 0 is random, -1 is reversed),
+- how many block ranges are "backwards": start before the previous block
+  range's end, so the two overlap,
+- the median time span of its block ranges.
+
+Every statistic is a couple of sorts and bincounts over the whole array,
+O(n log n), so tens of millions of block ranges take seconds. The windows
+with the lowest correlation are the blknum regions worth re-clustering.
+"""
+
+from __future__ import annotations
+
+import csv
+from dataclasses import dataclass
+from typing import Any, TextIO
+
+import numpy as np
+import numpy.typing as npt
+
+from brin_lib import BlockRanges, Int64Array, as_block_range_array
+
+Float64Array = npt.NDArray[np.float64]
+
+DEFAULT_WINDOW = 1000  # block ranges
+
+
+@dataclass(eq=False)
+class DisorderSeries:
+    """Statistics of consecutive windows of block ranges in blknum order."""
+
+    first_blknum: Int64Array
+    last_blknum: Int64Array
+    num_ranges: Int64Array
+    correlation: Float64Array
+    backwards: Int64Array
+    median_span_secs: Float64Array
+
+    def __len__(self) -> int:
+        return len(self.first_blknum)
+
+    def worst(self, k: int) -> Int64Array:
+        """Indexes of the k windows with the lowest correlation."""
+        return np.argsort(self.correlation, kind="stable")[:k]
+
+    def summary(self) -> dict[str, Any]:
+        if len(self) == 0:
+            return {"windows": 0}
+        total = int(self.num_ranges.sum())
+        return {
+            "windows": len(self),
+            "block_ranges": total,
+            "correlation_min": round(float(self.correlation.min()), 4),
+            "correlation_p10": round(float(np.percentile(self.correlation, 10)), 4),
+            "correlation_median": round(float(np.median(self.correlation)), 4),
+            "backwards": int(self.backwards.sum()),
+            "backwards_fraction": round(float(self.backwards.sum()) / total, 4),
+            "median_span_secs": float(np.median(self.median_span_secs)),
+        }
+
+
+def _spearman(d2_sum: Float64Array, m: Float64Array) -> Float64Array:
+    """Spearman's rho from the sum of squared rank differences of m pairs.
+    A single pair counts as perfectly ordered."""
+    denom = m * (m * m - 1)
+    return np.where(m > 1, 1 - 6 * d2_sum / np.where(m > 1, denom, 1), 1.0)
+
+
+def rank_correlation(block_ranges: BlockRanges) -> float:
+    """Spearman rank correlation of blknum against start time over all block
+    ranges. Ties in start time are ranked in blknum order."""
+    brs = as_block_range_array(block_ranges).sorted_by_blknum()
+    n = len(brs)
+    start_rank = np.empty(n, np.int64)
+    start_rank[np.argsort(brs.start, kind="stable")] = np.arange(n)
+    d2_sum = ((np.arange(n) - start_rank).astype(np.float64) ** 2).sum()
+    return float(_spearman(np.array([d2_sum]), np.array([float(n)]))[0])
+
+
+def _sort_within(values: Int64Array, window: int) -> Int64Array:
+    """For each consecutive window of values, the stable argsort of the
+    window (indexes relative to the window start). Windows are sorted as
+    rows of a 2d array, which is much faster than one sort by (window,
+    value)."""
+    full = len(values) // window * window
+    rows = np.argsort(values[:full].reshape(-1, window), axis=1, kind="stable")
+    tail = np.argsort(values[full:], kind="stable")
+    return np.concatenate((rows.ravel(), tail))
+
+
+def disorder_series(
+    block_ranges: BlockRanges, window: int = DEFAULT_WINDOW
+) -> DisorderSeries:
+    """Disorder statistics of each window of block ranges (by blknum). The
+    last window may be smaller."""
+    if window < 1:
+        raise ValueError(f"window must be at least 1 block range, got {window}")
+    brs = as_block_range_array(block_ranges).sorted_by_blknum()
+    n = len(brs)
+    pos = np.arange(n)
+    group = pos // window
+    firsts = np.arange(0, n, window)
+    counts = np.minimum(window, n - firsts)
+    num_windows = len(firsts)
+
+    # within each window, the blknum rank is the position and the start rank
+    # comes from sorting the window by start. The sort is stable, so ties in
+    # start keep blknum order.
+    rank = pos % window
+    start_rank = np.empty(n, np.int64)
+    start_rank[pos - rank + _sort_within(brs.start, window)] = rank
+    d2 = ((rank - start_rank).astype(np.float64)) ** 2
+    d2_sum = np.bincount(group, weights=d2, minlength=num_windows).astype(np.float64)
+    correlation = _spearman(d2_sum, counts.astype(np.float64))
+
+    backwards = np.zeros(n, np.bool_)
+    backwards[1:] = brs.start[1:] < brs.end[:-1]
+    backwards_count = np.bincount(group, weights=backwards, minlength=num_windows)
+
+    span = brs.end - brs.start
+    sorted_span = span[pos - rank + _sort_within(span, window)]
+    lower = sorted_span[firsts + (counts - 1) // 2]
+    upper = sorted_span[firsts + counts // 2]
+    median_span_secs = (lower + upper) / 2 / 1e6
+
+    return DisorderSeries(
+        first_blknum=brs.blknum[firsts],
+        last_blknum=brs.blknum[firsts + counts - 1],
+        num_ranges=counts.astype(np.int64),
+        correlation=correlation,
+        backwards=backwards_count.astype(np.int64),
+        median_span_secs=median_span_secs,
+    )
+
+
+def write_series(series: DisorderSeries, f: TextIO) -> None:
+    writer = csv.writer(f)
+    writer.writerow(
+        [
+            "first_blknum",
+            "last_blknum",
+            "num_ranges",
+            "correlation",
+            "backwards",
+            "median_span_secs",
+        ]
+    )
+    rows = zip(
+        series.first_blknum.tolist(),
+        series.last_blknum.tolist(),
+        series.num_ranges.tolist(),
+        series.correlation.round(4).tolist(),
+        series.backwards.tolist(),
+        series.median_span_secs.tolist(),
+    )
+    writer.writerows(rows)
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from brin_disorder import disorder_series, rank_correlation
+from brin_lib import BlockRangeArray
+from brin_synth import generate
+
+
+def _naive_spearman(x: np.ndarray, y: np.ndarray) -> float:
+    if len(x) < 2:
+        return 1.0
+    rx = np.argsort(np.argsort(x, kind="stable"), kind="stable")
+    ry = np.argsort(np.argsort(y, kind="stable"), kind="stable")
+    return float(np.corrcoef(rx, ry)[0, 1])
+
+
+@pytest.mark.parametrize("window", [1, 7, 100, 1000])
+def test_disorder_series_matches_naive(window: int) -> None:
+    rng = np.random.default_rng(0)
+    n = 950
+    start = rng.permutation(n).astype(np.int64) * 1_000_000
+    brs = BlockRangeArray(
+        np.arange(n, dtype=np.int64) * 128,
+        start,
+        start + rng.integers(0, 5_000_000, n),
+    )
+    series = disorder_series(brs, window)
+    assert len(series) == -(-n // window)
+    for i, lo in enumerate(range(0, n, window)):
+        hi = min(lo + window, n)
+        assert series.first_blknum[i] == brs.blknum[lo]
+        assert series.last_blknum[i] == brs.blknum[hi - 1]
+        assert series.num_ranges[i] == hi - lo
+        expected = _naive_spearman(brs.blknum[lo:hi], brs.start[lo:hi])
+        assert series.correlation[i] == pytest.approx(expected)
+        prev_end = brs.end[max(lo - 1, 0) : hi - 1]
+        starts = brs.start[max(lo, 1) : hi]
+        assert series.backwards[i] == (starts < prev_end).sum()
+        span = (brs.end[lo:hi] - brs.start[lo:hi]) / 1e6
+        assert series.median_span_secs[i] == pytest.approx(np.median(span))
+    assert rank_correlation(brs) == pytest.approx(
+        _naive_spearman(brs.blknum, brs.start)
+    )
+
+
+def test_disorder_series_locates_backfill() -> None:
+    brs = generate(10_000, "backfill")
+    assert rank_correlation(generate(10_000, "append")) == 1.0
+    assert rank_correlation(brs) < 1.0
+    series = disorder_series(brs, 100)
+    worst = series.worst(1)[0]
+    # the refilled block ranges are the affected 10%, find them in the export.
+    refilled = np.flatnonzero(brs.end - brs.start > 2 * 3600 * 10**6)
+    assert refilled.min() * 128 <= series.last_blknum[worst]
+    assert series.first_blknum[worst] <= refilled.max() * 128
+    assert series.correlation[worst] < 0.9
+
+
+def test_disorder_series_empty() -> None:
+    series = disorder_series(BlockRangeArray.empty())
+    assert len(series) == 0
+    assert series.summary() == {"windows": 0}
+    with pytest.raises(ValueError):
+        disorder_series(BlockRangeArray.empty(), 0)
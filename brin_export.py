@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+
+"""Export BRIN index internals from a live database.
+
+Like export_brin_items.sh, but instead of running psql twice per page, a few
+pooled connections fetch batches of pages in parallel, each batch with a
+single generate_series query. The range of regular pages is read up front
+from the meta page and the relation size, instead of probing pages until
+one fails.
+
+Works with any DB-API 2.0 driver using the "pyformat" paramstyle. The CLI
+uses psycopg2 (an optional dependency), which reads the same
+PGHOST/PGUSER/PGDATABASE/PGPASSWORD environment variables as psql.
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing, contextmanager
+from datetime import datetime
+from typing import Any, Callable, Iterator
+
+import numpy as np
+
+from brin_filenames import brinexport_csv
+from brin_lib import BlockRangeArray, Int64Array
+from brin_parser import (
+    parse_item_rows,
+    split_by_attnum,
+    write_csv_file,
+    write_csv_file_by_attnum,
+)
+
+Connection = Any  # DB-API 2.0 connection
+Connect = Callable[[], Connection]
+
+DEFAULT_WORKERS = 4
+DEFAULT_BATCH_PAGES = 64
+ALL_ATTNUMS = -1  # like ATTNUM=-1 for export_brin_items.sh
+
+# Regular pages come after the revmap pages and run to the end of the index.
+PAGE_RANGE_QUERY = """
+SELECT m.lastrevmappage + 1,
+       pg_relation_size(%(idx)s::regclass) / current_setting('block_size')::int
+FROM brin_metapage_info(get_raw_page(%(idx)s, 0)) AS m
+"""
+
+# brin_page_items is strict, so the CASE skips pages that aren't regular (eg
+# a regular page that was since turned into a revmap page), instead of
+# failing the whole batch. All null block ranges and placeholder tuples have
+# a NULL value.
+ITEMS_QUERY = """
+SELECT i.blknum, i.attnum, i.value
+FROM generate_series(%(first)s::int, %(last)s::int) AS p(page)
+CROSS JOIN LATERAL (SELECT get_raw_page(%(idx)s, p.page) AS raw) AS r
+CROSS JOIN LATERAL brin_page_items(
+    CASE WHEN brin_page_type(r.raw) = 'regular' THEN r.raw END,
+    %(idx)s::regclass
+) AS i
+WHERE i.value IS NOT NULL AND (i.attnum = %(attnum)s OR %(attnum)s = -1)
+"""
+
+
+class ConnectionPool:
+    """Thread safe pool of connections, opened lazily. Holds at most as many
+    connections as were ever used at the same time."""
+
+    def __init__(self, connect: Connect) -> None:
+        self._connect = connect
+        self._idle: queue.SimpleQueue[Connection] = queue.SimpleQueue()
+        self._all: list[Connection] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self) -> Iterator[Connection]:
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+            with self._lock:
+                self._all.append(conn)
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def __len__(self) -> int:
+        return len(self._all)
+
+    def close(self) -> None:
+        for conn in self._all:
+            conn.close()
+
+
+def _query(conn: Connection, sql: str, params: dict[str, Any]) -> list[Any]:
+    with closing(conn.cursor()) as cur:
+        cur.execute(sql, params)
+        rows: list[Any] = cur.fetchall()
+    # end the transaction, so idle pooled connections don't hold one open.
+    conn.rollback()
+    return rows
+
+
+def page_range(conn: Connection, index: str) -> tuple[int, int]:
+    """Returns (first regular page, number of pages) of the index."""
+    ((first, num_pages),) = _query(conn, PAGE_RANGE_QUERY, {"idx": index})
+    return int(first), int(num_pages)
+
+
+def fetch_batch(
+    pool: ConnectionPool, index: str, attnum: int, first: int, last: int
+) -> tuple[Int64Array, BlockRangeArray]:
+    """Items of column attnum (or every column, with ALL_ATTNUMS) on pages
+    first..last (inclusive), and their attnums."""
+    params = {"idx": index, "attnum": attnum, "first": first, "last": last}
+    with pool.connection() as conn:
+        rows = _query(conn, ITEMS_QUERY, params)
+    return parse_item_rows(rows)
+
+
+def export_items_by_attnum(
+    connect: Connect,
+    index: str,
+    attnum: int = ALL_ATTNUMS,
+    workers: int = DEFAULT_WORKERS,
+    batch_pages: int = DEFAULT_BATCH_PAGES,
+) -> dict[int, BlockRangeArray]:
+    """Export block ranges of each column of a BRIN index (or just column
+    attnum), sorted by blknum. Requires the pageinspect extension."""
+    if batch_pages < 1:
+        raise ValueError(f"batch_pages must be positive, got {batch_pages}")
+    with closing(ConnectionPool(connect)) as pool:
+        with pool.connection() as conn:
+            first, num_pages = page_range(conn, index)
+        logging.info(f"exporting pages {first}..{num_pages - 1} of {index}...")
+        with ThreadPoolExecutor(workers) as executor:
+            futures = [
+                executor.submit(
+                    fetch_batch,
+                    pool,
+                    index,
+                    attnum,
+                    page,
+                    min(page + batch_pages, num_pages) - 1,
+                )
+                for page in range(first, num_pages, batch_pages)
+            ]
+            # parse each batch as it arrives, rather than holding all rows.
+            parts = [f.result() for f in as_completed(futures)]
+    attnums = np.concatenate([np.empty(0, np.int64)] + [a for a, _ in parts])
+    return split_by_attnum(attnums, BlockRangeArray.concatenate(b for _, b in parts))
+
+
+def export_items(
+    connect: Connect,
+    index: str,
+    attnum: int = 1,
+    workers: int = DEFAULT_WORKERS,
+    batch_pages: int = DEFAULT_BATCH_PAGES,
+) -> BlockRangeArray:
+    """Export block ranges of column attnum of a BRIN index, sorted by
+    blknum."""
+    by_attnum = export_items_by_attnum(connect, index, attnum, workers, batch_pages)
+    return by_attnum.get(attnum, BlockRangeArray.empty())
+
+
+def load_pageinspect(conn: Connection) -> bool:
+    """Create the pageinspect extension if needed. Returns whether it was
+    created (and so should be dropped afterwards)."""
+    rows = _query(
+        conn,
+        "SELECT 1 FROM pg_extension WHERE extname = %(name)s",
+        {"name": "pageinspect"},
+    )
+    if rows:
+        return False
+    with closing(conn.cursor()) as cur:
+        cur.execute("CREATE EXTENSION pageinspect")
+    conn.commit()
+    return True
+
+
+def unload_pageinspect(conn: Connection) -> None:
+    with closing(conn.cursor()) as cur:
+        cur.execute("DROP EXTENSION pageinspect")
+    conn.commit()
+
+
+#%%
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    p = argparse.ArgumentParser()
+    p.add_argument(
+        "-idx", default=os.environ.get("PGIDX"), help="BRIN index name (or $PGIDX)"
+    )
+    p.add_argument(
+        "-attnum",
+        type=int,
+        default=int(os.environ.get("ATTNUM", 1)),
+        help=f"indexed column number, {ALL_ATTNUMS} for all of them (or $ATTNUM)",
+    )
+    p.add_argument(
+        "-o",
+        dest="output",
+        default=os.environ.get("OUTFILE"),
+        help="output CSV (default: brinexport_<timestamp>.csv)",
+    )
+    p.add_argument("-workers", type=int, default=DEFAULT_WORKERS)
+    p.add_argument(
+        "-batch",
+        type=int,
+        default=DEFAULT_BATCH_PAGES,
+        help="pages fetched per query",
+    )
+    p.add_argument(
+        "-dsn",
+        default="",
+        help="libpq connection string (default: PGHOST, PGUSER, etc env vars)",
+    )
+    args = p.parse_args()
+    if not args.idx:
+        p.error("missing index name, pass -idx or set PGIDX")
+    output = args.output or brinexport_csv(datetime.now())
+
+    try:
+        import psycopg2
+    except ImportError:
+        p.error("brin_export.py needs psycopg2: pip install psycopg2-binary")
+
+    def connect() -> Connection:
+        return psycopg2.connect(args.dsn)
+
+    with closing(connect()) as conn:
+        created = load_pageinspect(conn)
+        try:
+            by_attnum = export_items_by_attnum(
+                connect, args.idx, args.attnum, args.workers, args.batch
+            )
+        finally:
+            if created:
+                logging.info("unloading pageinspect...")
+                unload_pageinspect(conn)
+    num_ranges = sum(len(brs) for brs in by_attnum.values())
+    logging.info(f"exported {num_ranges} block ranges, writing {output}...")
+    if args.attnum == ALL_ATTNUMS:
+        write_csv_file_by_attnum(by_attnum, output)
+    else:
+        write_csv_file(by_attnum.get(args.attnum, BlockRangeArray.empty()), output)
+    logging.info(f"result in {output} ✨")
@@ -0,0 +1,131 @@
+import os
+import threading
+from datetime import datetime
+from typing import Any, Optional
+
+import pytest
+
+from brin_export import (
+    ALL_ATTNUMS,
+    ITEMS_QUERY,
+    PAGE_RANGE_QUERY,
+    export_items,
+    export_items_by_attnum,
+)
+from brin_parser import parse_csv_file_by_attnum, write_csv_file_by_attnum
+
+# stand-in brin_page_items results: page -> [(blknum, attnum, value)]
+PAGES: dict[int, list[tuple[int, int, Optional[str]]]] = {
+    2: [
+        (0, 1, "{2021-04-01 00:00:00+00 .. 2021-04-01 01:00:00+00}"),
+        (0, 2, "{2021-05-01 00:00:00 .. 2021-05-01 01:00:00}"),
+        (256, 1, "{2021-04-01 02:00:00.123+00 .. 2021-04-01 03:00:00+00}"),
+    ],
+    3: [(128, 1, "{2021-04-01 01:00:00+00 .. 2021-04-01 02:00:00+00}")],
+    # an all null block range.
+    4: [(512, 1, None)],
+    5: [(384, 1, "{2021-04-01 03:00:00+00 .. 2021-04-01 04:00:00+00}")],
+}
+FIRST_REGULAR, NUM_PAGES = 2, 6
+
+
+class FakeCursor:
+    def __init__(self, conn: "FakeConnection") -> None:
+        self.conn = conn
+        self.rows: list[Any] = []
+
+    def execute(self, sql: str, params: dict[str, Any]) -> None:
+        assert params["idx"] == "test_idx"
+        if sql == PAGE_RANGE_QUERY:
+            self.rows = [(FIRST_REGULAR, NUM_PAGES)]
+        elif sql == ITEMS_QUERY:
+            pages = range(params["first"], params["last"] + 1)
+            with self.conn.lock:
+                self.conn.fetched_pages.extend(pages)
+            self.rows = [
+                (blknum, attnum, value)
+                for page in pages
+                for blknum, attnum, value in PAGES[page]
+                if value is not None and params["attnum"] in (attnum, ALL_ATTNUMS)
+            ]
+        else:
+            raise AssertionError(f"unexpected query {sql}")
+
+    def fetchall(self) -> list[Any]:
+        return self.rows
+
+    def close(self) -> None:
+        pass
+
+
+class FakeConnection:
+    def __init__(self, fetched_pages: list[int], lock: threading.Lock) -> None:
+        self.fetched_pages = fetched_pages
+        self.lock = lock
+        self.in_use: Optional[threading.Thread] = None
+        self.closed = False
+
+    def cursor(self) -> FakeCursor:
+        assert not self.closed
+        return FakeCursor(self)
+
+    def rollback(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class FakeDriver:
+    def __init__(self) -> None:
+        self.connections: list[FakeConnection] = []
+        self.fetched_pages: list[int] = []
+        self.lock = threading.Lock()
+
+    def connect(self) -> FakeConnection:
+        conn = FakeConnection(self.fetched_pages, self.lock)
+        with self.lock:
+            self.connections.append(conn)
+        return conn
+
+
+@pytest.mark.parametrize("workers,batch_pages", [(1, 1), (2, 1), (4, 3), (2, 100)])
+def test_export_items(workers: int, batch_pages: int) -> None:
+    driver = FakeDriver()
+    brs = export_items(driver.connect, "test_idx", 1, workers, batch_pages)
+    assert list(brs.blknum) == [0, 128, 256, 384]
+    assert brs[2].start == datetime(2021, 4, 1, 2)
+    assert brs[3].end == datetime(2021, 4, 1, 4)
+    # every regular page fetched exactly once.
+    assert sorted(driver.fetched_pages) == list(range(FIRST_REGULAR, NUM_PAGES))
+    assert 1 <= len(driver.connections) <= workers
+    assert all(conn.closed for conn in driver.connections)
+
+
+def test_export_items_attnum() -> None:
+    brs = export_items(FakeDriver().connect, "test_idx", attnum=2)
+    assert list(brs.blknum) == [0]
+    assert brs[0].start == datetime(2021, 5, 1)
+
+
+def test_export_items_all_attnums(tmp_path: str) -> None:
+    by_attnum = export_items_by_attnum(FakeDriver().connect, "test_idx")
+    assert {a: list(brs.blknum) for a, brs in by_attnum.items()} == {
+        1: [0, 128, 256, 384],
+        2: [0],
+    }
+    path = os.path.join(tmp_path, "brinexport.csv")
+    write_csv_file_by_attnum(by_attnum, path)
+    with open(path) as f:
+        assert f.readline() == "blknum,attnum,value\n"
+        assert f.readline().startswith("0,1,")
+        assert f.readline().startswith("0,2,")
+    parsed = parse_csv_file_by_attnum(path)
+    assert parsed.keys() == by_attnum.keys()
+    for a, brs in by_attnum.items():
+        assert list(parsed[a]) == list(brs)
+
+
+def test_export_items_bad_batch() -> None:
+    with pytest.raises(ValueError):
+        export_items(FakeDriver().connect, "test_idx", batch_pages=0)
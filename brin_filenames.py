@@ -5,6 +5,12 @@ from dataclasses import dataclass
 from datetime import datetime, time
 from typing import Optional
 
+OVERLAP_BINARY_EXT = ".bro"
+INDEX_EXT = ".npz"
+# eg brinexport_20210412_174650.csv.gz, see brin_parser.open_export.
+COMPRESSION_EXTS = (".gz", ".bz2", ".xz", ".zst")
+STDIN = "-"
+
 
 @dataclass
 class _PathParts:
@@ -13,7 +19,20 @@ class _PathParts:
     ext: str  # like ".csv" or ".json"
 
 
+def strip_compression_ext(path: str) -> str:
+    base, ext = os.path.splitext(path)
+    return base if ext.lower() in COMPRESSION_EXTS else path
+
+
+def is_export_csv(path: str) -> bool:
+    """Whether path is an export CSV (maybe compressed) or stdin."""
+    return path == STDIN or strip_compression_ext(path).lower().endswith(".csv")
+
+
 def _get_pathparts(inpath: str, expected_ext: Optional[str] = None) -> _PathParts:
+    if inpath == STDIN:
+        raise ValueError("can't infer an output path when reading stdin, pass -o")
+    inpath = strip_compression_ext(inpath)
     dirname, inbasename = os.path.dirname(inpath), os.path.basename(inpath)
     inbase, inext = os.path.splitext(inbasename)
     inext = inext.lower()
@@ -24,11 +43,25 @@ def _get_pathparts(inpath: str, expected_ext: Optional[str] = None) -> _PathPart
     return _PathParts(dirname, inbase, inext.lower())
 
 
+def with_attnum(path: str, attnum: int) -> str:
+    """Output path for one column of a multi-column export, eg
+    overlap_20210412_174650_attnum2.json."""
+    base, ext = os.path.splitext(path)
+    return f"{base}_attnum{attnum}{ext}"
+
+
 def _check_exists(path: str) -> None:
     if os.path.exists(path):
         raise ValueError(f"inferred output path already exists: {path}")
 
 
+def brinexport_csv(now: datetime) -> str:
+    """Default export filename, same as export_brin_items.sh."""
+    outpath = now.strftime("brinexport_%Y%m%d_%H%M%S.csv")
+    _check_exists(outpath)
+    return outpath
+
+
 def overlap_json_from_brinexport_csv(brinexport_csv: str) -> str:
     pathparts = _get_pathparts(brinexport_csv, ".csv")
     outbase = pathparts.base.replace("brinexport_", "overlap_")
@@ -37,28 +70,95 @@ def overlap_json_from_brinexport_csv(brinexport_csv: str) -> str:
     return outpath
 
 
-def viz_svg_from_overlap_json(overlap_json: str) -> str:
-    pathparts = _get_pathparts(overlap_json, ".json")
-    outbase = pathparts.base.replace("overlap_", "vizoverlap_")
-    outpath = os.path.join(pathparts.dirname, outbase + ".svg")
+def overlap_bin_from_brinexport_csv(brinexport_csv: str) -> str:
+    pathparts = _get_pathparts(brinexport_csv, ".csv")
+    outbase = pathparts.base.replace("brinexport_", "overlap_")
+    outpath = os.path.join(pathparts.dirname, outbase + OVERLAP_BINARY_EXT)
     _check_exists(outpath)
     return outpath
 
 
-def _after_part(after: Optional[datetime]) -> str:
-    """Return filename component for 'after' filter if present."""
-    if after is None:
+def index_from_brinexport_csv(brinexport_csv: str) -> str:
+    pathparts = _get_pathparts(brinexport_csv, ".csv")
+    outbase = pathparts.base.replace("brinexport_", "brinindex_")
+    outpath = os.path.join(pathparts.dirname, outbase + INDEX_EXT)
+    _check_exists(outpath)
+    return outpath
+
+
+def _date_part(name: str, dt: Optional[datetime]) -> str:
+    if dt is None:
         return ""
-    if after.time() == time.min:
-        return after.strftime("_after%Y%m%d")
+    if dt.time() == time.min:
+        return dt.strftime(f"_{name}%Y%m%d")
     else:
-        return after.strftime("_after%Y%m%d%H%M%S")
+        return dt.strftime(f"_{name}%Y%m%d%H%M%S")
+
+
+def _after_part(after: Optional[datetime]) -> str:
+    """Return filename component for 'after' filter if present."""
+    return _date_part("after", after)
+
+
+def _window_part(
+    after: Optional[datetime],
+    before: Optional[datetime],
+    min_blknum: Optional[int],
+    max_blknum: Optional[int],
+) -> str:
+    """Return filename component for date and blknum filters if present."""
+    res = _after_part(after) + _date_part("before", before)
+    if min_blknum is not None or max_blknum is not None:
+        lo = "" if min_blknum is None else min_blknum
+        hi = "" if max_blknum is None else max_blknum
+        res += f"_blk{lo}-{hi}"
+    return res
+
+
+def viz_svg_from_overlap_json(
+    overlap_json: str,
+    ext: str = ".svg",
+    after: Optional[datetime] = None,
+    before: Optional[datetime] = None,
+    min_blknum: Optional[int] = None,
+    max_blknum: Optional[int] = None,
+) -> str:
+    pathparts = _get_pathparts(overlap_json, ".json")
+    outbase = pathparts.base.replace("overlap_", "vizoverlap_")
+    window = _window_part(after, before, min_blknum, max_blknum)
+    outpath = os.path.join(pathparts.dirname, outbase + window + ext)
+    _check_exists(outpath)
+    return outpath
+
+
+def viz_svg_from_overlap_bin(
+    overlap_bin: str,
+    ext: str = ".svg",
+    after: Optional[datetime] = None,
+    before: Optional[datetime] = None,
+    min_blknum: Optional[int] = None,
+    max_blknum: Optional[int] = None,
+) -> str:
+    pathparts = _get_pathparts(overlap_bin, OVERLAP_BINARY_EXT)
+    outbase = pathparts.base.replace("overlap_", "vizoverlap_")
+    window = _window_part(after, before, min_blknum, max_blknum)
+    outpath = os.path.join(pathparts.dirname, outbase + window + ext)
+    _check_exists(outpath)
+    return outpath
 
 
-def viz_svg_from_brinexport_csv(brinexport_csv: str, after: Optional[datetime]) -> str:
+def viz_svg_from_brinexport_csv(
+    brinexport_csv: str,
+    after: Optional[datetime],
+    ext: str = ".svg",
+    before: Optional[datetime] = None,
+    min_blknum: Optional[int] = None,
+    max_blknum: Optional[int] = None,
+) -> str:
     pathparts = _get_pathparts(brinexport_csv, ".csv")
     outbase = pathparts.base.replace("brinexport_", "vizoverlap_")
-    outpath = os.path.join(pathparts.dirname, outbase + _after_part(after) + ".svg")
+    window = _window_part(after, before, min_blknum, max_blknum)
+    outpath = os.path.join(pathparts.dirname, outbase + window + ext)
     _check_exists(outpath)
     return outpath
 
@@ -0,0 +1,100 @@
+"""Interval index for looking up which block ranges match a time/time range."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+
+from brin_lib import (
+    BlockRangeArray,
+    BlockRanges,
+    Int64Array,
+    as_block_range_array,
+    to_micros,
+)
+
+_NO_END = np.iinfo(np.int64).min  # max_end of empty segment tree leaves
+
+
+@dataclass(eq=False)
+class BlockRangeIndex:
+    """Static interval index over block ranges.
+
+    Block ranges are sorted by start, so the ones starting before the end of
+    a query are a prefix found by binary search. max_end is a segment tree
+    (node i has children 2i and 2i+1, leaves start at len(max_end) // 2) of
+    the max end time in each subtree, which lets a query descend only into
+    subtrees that contain a block range ending after the query start. Each
+    query takes O(log n) vectorized steps and touches O(log n) nodes per
+    match, instead of scanning every block range like filter_dt.
+
+    Build once with BlockRangeIndex.build, and save/load to reuse it."""
+
+    brs: BlockRangeArray  # sorted by (start, blknum)
+    max_end: Int64Array
+
+    @staticmethod
+    def build(block_ranges: BlockRanges) -> BlockRangeIndex:
+        brs = as_block_range_array(block_ranges)
+        brs = brs[np.lexsort((brs.blknum, brs.start))]
+        num_leaves = 1 << max(len(brs) - 1, 0).bit_length()
+        max_end = np.full(2 * num_leaves, _NO_END, dtype=np.int64)
+        max_end[num_leaves : num_leaves + len(brs)] = brs.end
+        # fill in one tree level at a time, bottom up.
+        width = num_leaves
+        while width > 1:
+            children = max_end[width : 2 * width]
+            max_end[width // 2 : width] = np.maximum(children[::2], children[1::2])
+            width //= 2
+        return BlockRangeIndex(brs, max_end)
+
+    def __len__(self) -> int:
+        return len(self.brs)
+
+    def _positions(self, start_us: int, end_us: int) -> Int64Array:
+        """Positions in self.brs of block ranges overlapping [start_us, end_us]."""
+        num_leaves = len(self.max_end) // 2
+        # only block ranges starting at or before end_us can match.
+        hi = int(np.searchsorted(self.brs.start, end_us, side="right"))
+        if hi == 0 or self.max_end[1] < start_us:
+            return np.empty(0, np.int64)
+        nodes = np.array([1], dtype=np.int64)
+        depth, width = 0, num_leaves  # width: leaves under each node
+        while width > 1:
+            nodes = np.stack((2 * nodes, 2 * nodes + 1), axis=1).ravel()
+            depth, width = depth + 1, width // 2
+            first_leaf = (nodes - (1 << depth)) * width
+            nodes = nodes[(first_leaf < hi) & (self.max_end[nodes] >= start_us)]
+        return nodes - num_leaves
+
+    def query(self, dt: datetime, dt_end: Optional[datetime] = None) -> BlockRangeArray:
+        """Block ranges containing dt, or overlapping dt..dt_end if given. Same
+        semantics as bro_relevant_blocks.filter_dt. Sorted by blknum."""
+        start_us = to_micros(dt)
+        end_us = start_us if dt_end is None else to_micros(dt_end)
+        return self.brs[self._positions(start_us, end_us)].sorted_by_blknum()
+
+    def count(self, dt: datetime, dt_end: Optional[datetime] = None) -> int:
+        start_us = to_micros(dt)
+        end_us = start_us if dt_end is None else to_micros(dt_end)
+        return len(self._positions(start_us, end_us))
+
+    def save(self, path: str) -> None:
+        # open ourselves, np.savez would append .npz to other extensions.
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                blknum=self.brs.blknum,
+                start=self.brs.start,
+                end=self.brs.end,
+                max_end=self.max_end,
+            )
+
+    @staticmethod
+    def load(path: str) -> BlockRangeIndex:
+        with np.load(path) as data:
+            brs = BlockRangeArray(data["blknum"], data["start"], data["end"])
+            return BlockRangeIndex(brs, data["max_end"])
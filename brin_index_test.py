@@ -0,0 +1,61 @@
+import os
+import random
+from datetime import datetime
+from typing import Optional
+
+from brin_index import BlockRangeIndex
+from brin_lib import BlockRange
+from brin_parser import parse_csv_file
+from bro_relevant_blocks import filter_dt
+
+ts = datetime.fromtimestamp
+
+
+def _random_brs(n: int) -> list[BlockRange]:
+    rng = random.Random(n)
+    brs = []
+    for i in range(n):
+        start = rng.randint(0, 1000)
+        brs.append(BlockRange(i * 128, ts(start), ts(start + rng.randint(0, 100))))
+    return brs
+
+
+def _queries() -> list[tuple[datetime, Optional[datetime]]]:
+    queries: list[tuple[datetime, Optional[datetime]]] = []
+    for t in [-5, 0, 1, 50, 500, 1099, 1100, 2000]:
+        queries.append((ts(t), None))
+    for a, b in [(-10, -1), (0, 10), (100, 300), (0, 2000)]:
+        queries.append((ts(a), ts(b)))
+    return queries
+
+
+def test_query_matches_filter_dt() -> None:
+    for n in [0, 1, 2, 3, 100, 1000]:
+        brs = _random_brs(n)
+        index = BlockRangeIndex.build(brs)
+        assert len(index) == n
+        for dt, dt_end in _queries():
+            expected = filter_dt(brs, dt, dt_end).to_block_ranges()
+            assert index.query(dt, dt_end).to_block_ranges() == expected
+            assert index.count(dt, dt_end) == len(expected)
+
+
+def test_query_edges() -> None:
+    index = BlockRangeIndex.build([BlockRange(1, ts(10), ts(20))])
+    assert index.count(ts(10)) == 1
+    assert index.count(ts(20)) == 1
+    assert index.count(ts(9)) == 0
+    assert index.count(ts(21)) == 0
+    assert index.count(ts(5), ts(10)) == 1
+    assert index.count(ts(20), ts(25)) == 1
+
+
+def test_save_load(tmp_path: str) -> None:
+    brs = parse_csv_file("testdata/brinexport_test_overlaps.csv")
+    index = BlockRangeIndex.build(brs)
+    path = os.path.join(tmp_path, "brinindex_test.npz")
+    index.save(path)
+    loaded = BlockRangeIndex.load(path)
+    dt = datetime(2000, 1, 1, 7)
+    assert loaded.query(dt).to_block_ranges() == index.query(dt).to_block_ranges()
+    assert list(loaded.query(dt).blknum) == [128, 256]
@@ -1,9 +1,34 @@
+from __future__ import annotations
+
+import array
 from dataclasses import dataclass
-from datetime import datetime
-from typing import Literal, Optional
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Iterator, Literal, Optional, Sequence, Union, overload
 
+import numpy as np
+import numpy.typing as npt
 from dataclasses_json import dataclass_json
 
+Int64Array = npt.NDArray[np.int64]
+BoolArray = npt.NDArray[np.bool_]
+
+EPOCH = datetime(1970, 1, 1)
+_ONE_MICROSECOND = timedelta(microseconds=1)
+
+
+def to_micros(dt: datetime) -> int:
+    """Convert datetime to integer microseconds since the epoch. Naive
+    datetimes (what the parser produces) are used as-is, aware datetimes are
+    normalized to UTC first."""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return (dt - EPOCH) // _ONE_MICROSECOND
+
+
+def from_micros(us: int) -> datetime:
+    """Inverse of to_micros. Returns a naive datetime."""
+    return EPOCH + timedelta(microseconds=int(us))
+
 
 @dataclass_json
 @dataclass
@@ -45,3 +70,204 @@ def date_match(
     if match_type == "overlap":
         return overlaps_dates(br, start, end)
     return fully_within_dates(br, start, end)
+
+
+def _optional_micros(dt: Optional[datetime]) -> Optional[int]:
+    return None if dt is None else to_micros(dt)
+
+
+@dataclass(eq=False)
+class BlockRangeArray(Sequence[BlockRange]):
+    """Columnar storage for block ranges: parallel int64 arrays of blknum,
+    start and end (start/end in epoch microseconds, see to_micros).
+
+    This is what the parser produces and what the analysis functions operate
+    on, since a list of BlockRange objects costs a few hundred bytes per row.
+    Indexing with an int (or iterating) returns BlockRange views, indexing with
+    a slice or numpy index array returns another BlockRangeArray. The columns
+    may be read-only views, eg of a memory-mapped file."""
+
+    blknum: Int64Array
+    start: Int64Array
+    end: Int64Array
+
+    def __post_init__(self) -> None:
+        self.blknum = np.asarray(self.blknum, dtype=np.int64)
+        self.start = np.asarray(self.start, dtype=np.int64)
+        self.end = np.asarray(self.end, dtype=np.int64)
+        if not len(self.blknum) == len(self.start) == len(self.end):
+            raise ValueError(
+                "BlockRangeArray columns must have equal lengths, got "
+                f"{len(self.blknum)}, {len(self.start)}, {len(self.end)}"
+            )
+
+    @staticmethod
+    def empty() -> BlockRangeArray:
+        return BlockRangeArray(
+            np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.int64)
+        )
+
+    @staticmethod
+    def from_block_ranges(brs: Iterable[BlockRange]) -> BlockRangeArray:
+        blknums, starts, ends = array.array("q"), array.array("q"), array.array("q")
+        for br in brs:
+            blknums.append(br.blknum)
+            starts.append(to_micros(br.start))
+            ends.append(to_micros(br.end))
+        return BlockRangeArray(
+            np.frombuffer(blknums, np.int64),
+            np.frombuffer(starts, np.int64),
+            np.frombuffer(ends, np.int64),
+        )
+
+    @staticmethod
+    def concatenate(arrays: Iterable[BlockRangeArray]) -> BlockRangeArray:
+        arrays = list(arrays)
+        if not arrays:
+            return BlockRangeArray.empty()
+        return BlockRangeArray(
+            np.concatenate([a.blknum for a in arrays]),
+            np.concatenate([a.start for a in arrays]),
+            np.concatenate([a.end for a in arrays]),
+        )
+
+    def to_block_ranges(self) -> list[BlockRange]:
+        return list(self)
+
+    def __len__(self) -> int:
+        return len(self.blknum)
+
+    @overload
+    def __getitem__(self, key: int) -> BlockRange:
+        ...
+
+    @overload
+    def __getitem__(
+        self, key: Union[slice, Int64Array, BoolArray]
+    ) -> BlockRangeArray:
+        ...
+
+    def __getitem__(
+        self, key: Union[int, slice, Int64Array, BoolArray]
+    ) -> Union[BlockRange, BlockRangeArray]:
+        if isinstance(key, (int, np.integer)):
+            return BlockRange(
+                int(self.blknum[key]),
+                from_micros(self.start[key]),
+                from_micros(self.end[key]),
+            )
+        return BlockRangeArray(self.blknum[key], self.start[key], self.end[key])
+
+    def __iter__(self) -> Iterator[BlockRange]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def sorted_by_blknum(self) -> BlockRangeArray:
+        # exports are usually sorted already, or a concatenation of sorted
+        # runs (one per index page). The stable sort is timsort, which merges
+        # existing runs, so k runs cost O(n log k). Stable, so equal blknums
+        # keep their input order.
+        if (np.diff(self.blknum) >= 0).all():
+            return self
+        return self[np.argsort(self.blknum, kind="stable")]
+
+    def filter_blknums(
+        self, min_blknum: Optional[int] = None, max_blknum: Optional[int] = None
+    ) -> BlockRangeArray:
+        """Block ranges with min_blknum <= blknum <= max_blknum."""
+        keep = np.ones(len(self), np.bool_)
+        if min_blknum is not None:
+            keep &= self.blknum >= min_blknum
+        if max_blknum is not None:
+            keep &= self.blknum <= max_blknum
+        return self[keep]
+
+    def date_mask(
+        self,
+        match_type: Literal["overlap", "within"],
+        start: Optional[datetime],
+        end: Optional[datetime],
+    ) -> BoolArray:
+        """Vectorized date_match: which rows match the given dates."""
+        start_us, end_us = _optional_micros(start), _optional_micros(end)
+        mask = np.ones(len(self), dtype=np.bool_)
+        if match_type == "overlap":
+            if start_us is not None:
+                mask &= start_us <= self.end
+            if end_us is not None:
+                mask &= self.start <= end_us
+        else:
+            if start_us is not None:
+                mask &= start_us <= self.start
+            if end_us is not None:
+                mask &= self.end <= end_us
+        return mask
+
+    def filter_dates(
+        self,
+        match_type: Literal["overlap", "within"],
+        start: Optional[datetime],
+        end: Optional[datetime],
+    ) -> BlockRangeArray:
+        if start is None and end is None:
+            return self
+        return self[self.date_mask(match_type, start, end)]
+
+
+# Most functions accept a BlockRangeArray or any other sequence of
+# BlockRanges, see as_block_range_array.
+BlockRanges = Sequence[BlockRange]
+
+
+def as_block_range_array(brs: BlockRanges) -> BlockRangeArray:
+    if isinstance(brs, BlockRangeArray):
+        return brs
+    return BlockRangeArray.from_block_ranges(brs)
+
+
+def _unique_blknum_rows(brs: BlockRangeArray) -> tuple[Int64Array, Int64Array]:
+    """Indexes of the rows whose blknum appears once, and their blknums, in
+    blknum order."""
+    blknum = brs.blknum
+    if (np.diff(blknum) > 0).all():
+        return np.arange(len(brs)), blknum
+    order = np.argsort(blknum, kind="stable")
+    blknum = blknum[order]
+    dup = np.zeros(len(brs), np.bool_)
+    same_as_next = blknum[1:] == blknum[:-1]
+    dup[1:] |= same_as_next
+    dup[:-1] |= same_as_next
+    return order[~dup], blknum[~dup]
+
+
+def join_by_blknum(
+    a: BlockRangeArray, b: BlockRangeArray
+) -> tuple[Int64Array, Int64Array]:
+    """Sort-merge join of two exports on blknum. Returns the indexes (a_idx,
+    b_idx) of the rows with the same blknum, in blknum order. Rows of a
+    blknum that appears more than once in either export never join.
+    Already sorted exports (the usual case) skip the sort."""
+    a_rows, a_keys = _unique_blknum_rows(a)
+    b_rows, b_keys = _unique_blknum_rows(b)
+    if len(a_keys) == 0 or len(b_keys) == 0:
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    pos = np.minimum(np.searchsorted(a_keys, b_keys), len(a_keys) - 1)
+    hit = a_keys[pos] == b_keys
+    return a_rows[pos[hit]], b_rows[hit]
+
+
+def match_block_ranges(
+    old: BlockRangeArray, new: BlockRangeArray
+) -> tuple[BoolArray, BoolArray]:
+    """Diff two exports by blknum. Returns masks of the rows of old and of new
+    that are unchanged (same blknum, start and end in both). Rows of a
+    blknum that appears more than once in either export never match."""
+    old_idx, new_idx = join_by_blknum(old, new)
+    same = (old.start[old_idx] == new.start[new_idx]) & (
+        old.end[old_idx] == new.end[new_idx]
+    )
+    old_unchanged = np.zeros(len(old), np.bool_)
+    old_unchanged[old_idx[same]] = True
+    new_unchanged = np.zeros(len(new), np.bool_)
+    new_unchanged[new_idx[same]] = True
+    return old_unchanged, new_unchanged
@@ -1,6 +1,18 @@
 from datetime import datetime
 
-from brin_lib import BlockRange, date_match, fully_within_dates, overlaps_dates
+import numpy as np
+import pytest
+
+from brin_lib import (
+    BlockRange,
+    BlockRangeArray,
+    date_match,
+    from_micros,
+    fully_within_dates,
+    match_block_ranges,
+    overlaps_dates,
+    to_micros,
+)
 
 ts = datetime.fromtimestamp
 
@@ -74,3 +86,63 @@ def test_date_match() -> None:
 
     assert not date_match(br, "overlap", ts(100), ts(110))
     assert not date_match(br, "within", ts(100), ts(110))
+
+
+def test_micros_roundtrip() -> None:
+    dt = datetime(2016, 11, 2, 5, 41, 14, 537000)
+    assert from_micros(to_micros(dt)) == dt
+    assert to_micros(datetime(1970, 1, 1, 0, 0, 1)) == 1_000_000
+
+
+def test_block_range_array_views() -> None:
+    brs = [BlockRange(128, ts(30), ts(40)), BlockRange(0, ts(10), ts(20))]
+    arr = BlockRangeArray.from_block_ranges(brs)
+    assert len(arr) == 2
+    assert arr[0] == brs[0]
+    assert arr.to_block_ranges() == brs
+    assert list(arr.sorted_by_blknum().blknum) == [0, 128]
+    sliced = arr[1:]
+    assert isinstance(sliced, BlockRangeArray)
+    assert sliced.to_block_ranges() == brs[1:]
+
+
+def test_block_range_array_sorted_by_blknum() -> None:
+    # two sorted runs, with a duplicate blknum across them.
+    blknum = np.array([128, 256, 0, 128, 384])
+    arr = BlockRangeArray(blknum, np.arange(5), np.arange(5) + 1)
+    res = arr.sorted_by_blknum()
+    assert list(res.blknum) == [0, 128, 128, 256, 384]
+    assert list(res.start) == [2, 0, 3, 1, 4]  # stable
+    assert res.sorted_by_blknum() is res
+
+
+def test_block_range_array_date_mask() -> None:
+    # Same semantics as date_match, see test_date_match.
+    arr = BlockRangeArray.from_block_ranges([BlockRange(1, ts(10), ts(20))])
+    assert list(arr.date_mask("overlap", ts(5), ts(15))) == [True]
+    assert list(arr.date_mask("within", ts(5), ts(15))) == [False]
+    assert list(arr.date_mask("within", ts(1), ts(100))) == [True]
+    assert list(arr.date_mask("overlap", ts(100), ts(110))) == [False]
+    assert len(arr.filter_dates("within", None, None)) == 1
+    assert len(arr.filter_dates("overlap", ts(21), None)) == 0
+
+
+def test_block_range_array_mismatched_lengths() -> None:
+    with pytest.raises(ValueError):
+        BlockRangeArray(np.array([1, 2]), np.array([1]), np.array([1]))
+
+
+def test_match_block_ranges() -> None:
+    old = BlockRangeArray(
+        np.array([256, 0, 128, 384, 384]), np.arange(5), np.arange(5) + 1
+    )
+    # 0 unchanged, 128 changed, 256 deleted, 384 duplicated, 512 new.
+    new = BlockRangeArray(
+        np.array([0, 128, 384, 512]), np.array([1, 9, 3, 5]), np.array([2, 9, 4, 6])
+    )
+    old_unchanged, new_unchanged = match_block_ranges(old, new)
+    assert list(old_unchanged) == [False, True, False, False, False]
+    assert list(new_unchanged) == [True, False, False, False]
+    empty = BlockRangeArray.empty()
+    assert list(match_block_ranges(empty, new)[1]) == [False] * 4
+    assert list(match_block_ranges(old, empty)[0]) == [False] * 5
@@ -1,21 +1,41 @@
 #!/usr/bin/env python3
-#%%
+# %%
 
-"""Compute BrinOverlap object from list of BlockRanges."""
+"""Compute BrinOverlap object from BlockRanges."""
 
 from __future__ import annotations
 
 import argparse
+import heapq
 import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
-from datetime import datetime
-from typing import Optional
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, Literal, Optional, Sequence
 
+import numpy as np
 from dataclasses_json import dataclass_json
 
 import brin_filenames
-from brin_lib import BlockRange
-from brin_parser import parse_csv_file
+from brin_lib import (
+    BlockRange,
+    BlockRangeArray,
+    BlockRanges,
+    Int64Array,
+    as_block_range_array,
+    from_micros,
+    match_block_ranges,
+    to_micros,
+)
+from brin_cache import parse_csv_cached_by_attnum
+from brin_parser import iter_csv_batches, select_attnum
+
+# first_fit: insert in blknum order into the first level with room (the
+# original layout). sweep: interval partitioning by start time, which uses
+# the minimum possible number of levels in O(n log n).
+Engine = Literal["first_fit", "sweep"]
+ENGINES: tuple[Engine, ...] = ("first_fit", "sweep")
 
 
 # NOTE: there's some kooky timezone stuff happening when round-tripping JSON...
@@ -26,12 +46,61 @@ class BrinOverlap:
     max_val: datetime
     min_blknum: int
     max_blknum: int
-    levels: list[list[BlockRange]]
+    # Levels are lists when computed or read from JSON, and BlockRangeArray
+    # views when read from the binary format.
+    levels: Sequence[Sequence[BlockRange]]
 
     @staticmethod
     def initialize(br: BlockRange) -> BrinOverlap:
         return BrinOverlap(br.start, br.end, br.blknum, br.blknum, [[br]])
 
+    def block_ranges_by_level(self) -> BlockRangeArray:
+        """All block ranges, level by level."""
+        return BlockRangeArray.concatenate(
+            as_block_range_array(level) for level in self.levels
+        )
+
+    def block_ranges(self) -> BlockRangeArray:
+        """All block ranges in the levels, sorted by blknum."""
+        return self.block_ranges_by_level().sorted_by_blknum()
+
+    def window(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        match_type: Literal["overlap", "within"] = "overlap",
+        min_blknum: Optional[int] = None,
+        max_blknum: Optional[int] = None,
+    ) -> BrinOverlap:
+        """The block ranges matching the dates (like date_match) and blknum
+        bounds (inclusive), keeping their levels. Empty levels are dropped.
+
+        Block ranges on a level don't overlap, so sorting a level by start
+        also sorts it by end, and the date window is a slice found by
+        bisection: O(levels * log n). The blknum bounds need a scan of the
+        slices."""
+        levels: list[Sequence[BlockRange]] = []
+        for level in self.levels:
+            sliced = level_window(level, start, end, match_type)
+            if min_blknum is not None or max_blknum is not None:
+                sliced = as_block_range_array(sliced).filter_blknums(
+                    min_blknum, max_blknum
+                )
+            if len(sliced):
+                levels.append(sliced)
+        if not levels:
+            raise ValueError("no block ranges in window")
+        firsts = [level[0] for level in levels]
+        lasts = [level[-1] for level in levels]
+        blknums = [as_block_range_array(level).blknum for level in levels]
+        return BrinOverlap(
+            min_val=min(br.start for br in firsts),
+            max_val=max(br.end for br in lasts),
+            min_blknum=int(min(b.min() for b in blknums)),
+            max_blknum=int(max(b.max() for b in blknums)),
+            levels=levels,
+        )
+
 
 def read_overlap_file(filepath: str) -> BrinOverlap:
     with open(filepath) as f:
@@ -39,12 +108,137 @@ def read_overlap_file(filepath: str) -> BrinOverlap:
 
 
 def write_overlap_file(bro: BrinOverlap, path: str) -> None:
+    if any(isinstance(level, BlockRangeArray) for level in bro.levels):
+        levels = [list(level) for level in bro.levels]
+        bro = BrinOverlap(
+            bro.min_val, bro.max_val, bro.min_blknum, bro.max_blknum, levels
+        )
     with open(path, "w") as f:
         f.write(bro.to_json(indent=1))  # type: ignore
         f.write("\n")
 
 
-def find_position(xs: list[BlockRange], x: BlockRange) -> Optional[int]:
+# Binary format (".bro"): the magic bytes, followed by little-endian int64s:
+#   header: version, num block ranges (n), num levels (L), min_val, max_val,
+#           min_blknum, max_blknum (min_val/max_val in epoch microseconds)
+#   level offsets: L + 1 values, level i is rows offsets[i]:offsets[i+1]
+#   columns: n blknums, n starts, n ends, level by level
+# Everything is fixed width, so reading is just a memory map plus slicing.
+BINARY_MAGIC = b"BROVLAP\0"
+BINARY_VERSION = 1
+_BINARY_HEADER_LEN = 7
+_BINARY_DTYPE = np.dtype("<i8")
+
+
+def write_overlap_binary(bro: BrinOverlap, path: str) -> None:
+    levels = [as_block_range_array(level) for level in bro.levels]
+    offsets = np.cumsum([0] + [len(level) for level in levels])
+    header = [
+        BINARY_VERSION,
+        offsets[-1],
+        len(levels),
+        to_micros(bro.min_val),
+        to_micros(bro.max_val),
+        bro.min_blknum,
+        bro.max_blknum,
+    ]
+    # bro may be memory mapped from path (eg updating a .bro in place), so
+    # write elsewhere and swap the file in rather than truncating it.
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(BINARY_MAGIC)
+        f.write(np.asarray(header, _BINARY_DTYPE).tobytes())
+        f.write(offsets.astype(_BINARY_DTYPE).tobytes())
+        for col in ["blknum", "start", "end"]:
+            for level in levels:
+                f.write(getattr(level, col).astype(_BINARY_DTYPE).tobytes())
+    os.replace(tmp_path, path)
+
+
+def read_overlap_binary(filepath: str) -> BrinOverlap:
+    """Memory map a binary BrinOverlap. The levels are BlockRangeArray views
+    of the file, so this is fast regardless of the index size."""
+    with open(filepath, "rb") as f:
+        if f.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+            raise ValueError(f"{filepath} is not a binary BrinOverlap file")
+    data = np.memmap(filepath, _BINARY_DTYPE, mode="r", offset=len(BINARY_MAGIC))
+    header = data[:_BINARY_HEADER_LEN].tolist()
+    version, n, num_levels, min_val, max_val, min_blknum, max_blknum = header
+    if version != BINARY_VERSION:
+        raise ValueError(f"unsupported binary BrinOverlap version {version}")
+    offsets_end = _BINARY_HEADER_LEN + num_levels + 1
+    offsets = data[_BINARY_HEADER_LEN:offsets_end].tolist()
+    blknum, start, end = data[offsets_end : offsets_end + 3 * n].reshape(3, n)
+    levels = [
+        BlockRangeArray(blknum[lo:hi], start[lo:hi], end[lo:hi])
+        for lo, hi in zip(offsets, offsets[1:])
+    ]
+    return BrinOverlap(
+        from_micros(min_val), from_micros(max_val), min_blknum, max_blknum, levels
+    )
+
+
+def read_overlap(filepath: str) -> BrinOverlap:
+    """Read a BrinOverlap in either format, based on the file extension."""
+    if filepath.lower().endswith(brin_filenames.OVERLAP_BINARY_EXT):
+        return read_overlap_binary(filepath)
+    return read_overlap_file(filepath)
+
+
+def write_overlap(bro: BrinOverlap, path: str) -> None:
+    if path.lower().endswith(brin_filenames.OVERLAP_BINARY_EXT):
+        write_overlap_binary(bro, path)
+    else:
+        write_overlap_file(bro, path)
+
+
+def level_window(
+    level: Sequence[BlockRange],
+    start: Optional[datetime],
+    end: Optional[datetime],
+    match_type: Literal["overlap", "within"],
+) -> Sequence[BlockRange]:
+    """Slice of a level (sorted by start and end) matching the dates."""
+    # overlap: ends at/after start and starts at/before end.
+    # within: starts at/after start and ends at/before end.
+    lo_by_end = match_type == "overlap"
+    if isinstance(level, BlockRangeArray):
+        lo_keys = level.end if lo_by_end else level.start
+        hi_keys = level.start if lo_by_end else level.end
+        lo = 0 if start is None else int(np.searchsorted(lo_keys, to_micros(start)))
+        hi = (
+            len(level)
+            if end is None
+            else int(np.searchsorted(hi_keys, to_micros(end), side="right"))
+        )
+        return level[lo:hi]
+    lo_key = (lambda br: br.end) if lo_by_end else (lambda br: br.start)
+    hi_key = (lambda br: br.start) if lo_by_end else (lambda br: br.end)
+    lo = 0 if start is None else _bisect(level, start, lo_key, right=False)
+    hi = len(level) if end is None else _bisect(level, end, hi_key, right=True)
+    return level[lo:hi]
+
+
+def _bisect(
+    xs: Sequence[BlockRange],
+    x: datetime,
+    key: Callable[[BlockRange], datetime],
+    right: bool,
+) -> int:
+    """bisect.bisect_left (or bisect_right) with a key, which needs Python
+    3.10."""
+    lo, hi = 0, len(xs)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        k = key(xs[mid])
+        if k < x or (right and k == x):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def find_position(xs: Sequence[BlockRange], x: BlockRange) -> Optional[int]:
     """Returns index i in xs where x can be inserted (in between existing
     elements xs[i-1] and xs[i]."""
     # We binsearch for a valid spot based on just the start time, and
@@ -76,27 +270,352 @@ def try_insert(level: list[BlockRange], br: BlockRange) -> bool:
     return True
 
 
-def compute_overlap(block_ranges: list[BlockRange]) -> BrinOverlap:
-    bro: Optional[BrinOverlap] = None
+def _first_fit_insert(levels: list[list[BlockRange]], br: BlockRange) -> None:
+    for level in levels:
+        if try_insert(level, br):
+            return
+    levels.append([br])  # new level
+
+
+def _first_fit_levels(brs: BlockRangeArray) -> list[list[BlockRange]]:
+    levels: list[list[BlockRange]] = []
     # maybe sort by block range size?
-    for i, br in enumerate(block_ranges):
+    for i, br in enumerate(brs):
         if i % 5000 == 0:
-            logging.info(f"adding block range {i} {i/len(block_ranges)*100:.1f}%")
-        if bro is None:
-            bro = BrinOverlap.initialize(br)
-            continue
-        bro.min_val = min(bro.min_val, br.start)
-        bro.max_val = max(bro.max_val, br.end)
-        bro.min_blknum = min(bro.min_blknum, br.blknum)
-        bro.max_blknum = max(bro.max_blknum, br.blknum)
-        for level in bro.levels:
-            if try_insert(level, br):
-                break
+            logging.info(f"adding block range {i} {i/len(brs)*100:.1f}%")
+        _first_fit_insert(levels, br)
+    return levels
+
+
+def _sweep_levels(brs: BlockRangeArray) -> list[list[BlockRange]]:
+    # Visit block ranges by start time. Each level's last end is kept in a
+    # min-heap, so the level that frees up first is reused if possible. At
+    # equal starts the shortest go first, so zero width block ranges reuse a
+    # level before anything else starting at that instant takes it.
+    order = np.lexsort((brs.blknum, brs.end, brs.start))
+    starts, ends = brs.start[order].tolist(), brs.end[order].tolist()
+    level_ends: list[tuple[int, int]] = []  # heap of (end, level index)
+    levels: list[list[BlockRange]] = []
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        if level_ends and level_ends[0][0] <= start:
+            _, level_idx = heapq.heappop(level_ends)
         else:
-            bro.levels.append([br])  # new level
-    if bro is None:
+            level_idx = len(levels)
+            levels.append([])
+        levels[level_idx].append(brs[int(order[i])])
+        heapq.heappush(level_ends, (end, level_idx))
+    return levels
+
+
+# Parallel first_fit. Block ranges that don't transitively overlap in time
+# form independent components: sorted by start, a component ends where the
+# running max end is before the next start. A component never shares a
+# level slot with another, so first_fit run on any batch of consecutive
+# components (visiting in input order, as usual) puts every block range on
+# the same level as a serial run, and each serial level is the batches'
+# levels concatenated in time order.
+PARALLEL_MIN_RANGES = 20_000  # below this, a process pool costs more
+
+
+def component_bounds(brs: BlockRangeArray) -> tuple[Int64Array, Int64Array]:
+    """The order of the block ranges by start, and the positions in that
+    order where each component starts (the first is 0)."""
+    order = np.argsort(brs.start, kind="stable")
+    max_end = np.maximum.accumulate(brs.end[order])
+    gaps = np.flatnonzero(max_end[:-1] < brs.start[order][1:]) + 1
+    return order, np.append(0, gaps)
+
+
+def _first_fit_batch(brs: BlockRangeArray) -> list[BlockRangeArray]:
+    return [
+        BlockRangeArray.from_block_ranges(level) for level in _first_fit_levels(brs)
+    ]
+
+
+def _parallel_first_fit_levels(
+    brs: BlockRangeArray, workers: int
+) -> Sequence[Sequence[BlockRange]]:
+    order, starts = component_bounds(brs)
+    logging.info(f"{len(starts)} independent components")
+    # cut at the component starts closest after evenly spaced targets. A
+    # single huge component stays in one batch.
+    targets = np.linspace(0, len(brs), workers * 4 + 1)[:-1]
+    cuts = np.unique(
+        starts[np.minimum(np.searchsorted(starts, targets), len(starts) - 1)]
+    )
+    if len(cuts) == 1:
+        return _first_fit_levels(brs)  # nothing to split
+    bounds = np.append(cuts, len(brs))
+    # each batch in input order, which is the order first_fit visits.
+    batches = [brs[np.sort(order[lo:hi])] for lo, hi in zip(bounds[:-1], bounds[1:])]
+    with ProcessPoolExecutor(min(workers, len(batches))) as executor:
+        batch_levels = list(executor.map(_first_fit_batch, batches))
+    num_levels = max(len(levels) for levels in batch_levels)
+    return [
+        BlockRangeArray.concatenate(
+            [levels[i] for levels in batch_levels if i < len(levels)]
+        )
+        for i in range(num_levels)
+    ]
+
+
+def compute_overlap(
+    block_ranges: BlockRanges,
+    engine: Engine = "first_fit",
+    workers: Optional[int] = 1,
+) -> BrinOverlap:
+    """Assign block ranges to levels. With workers > 1 (None for the CPU
+    count), the first_fit engine runs independent time components in a
+    process pool, giving the same layout as a serial run (with
+    BlockRangeArray levels if it was split). sweep is O(n log n) and always
+    serial."""
+    brs = as_block_range_array(block_ranges)
+    if len(brs) == 0:
         raise ValueError("block_ranges was empty, couldn't compute BrinOverlap")
-    return bro
+    workers = workers or os.cpu_count() or 1
+    levels: Sequence[Sequence[BlockRange]]
+    if engine == "first_fit" and workers > 1 and len(brs) >= PARALLEL_MIN_RANGES:
+        levels = _parallel_first_fit_levels(brs, workers)
+    elif engine == "first_fit":
+        levels = _first_fit_levels(brs)
+    elif engine == "sweep":
+        levels = _sweep_levels(brs)
+    else:
+        raise ValueError(f"unknown overlap engine {engine!r}, expected {ENGINES}")
+    return BrinOverlap(
+        min_val=from_micros(brs.start.min()),
+        max_val=from_micros(brs.end.max()),
+        min_blknum=int(brs.blknum.min()),
+        max_blknum=int(brs.blknum.max()),
+        levels=levels,
+    )
+
+
+def compute_overlap_stream(batches: Iterable[BlockRangeArray]) -> BrinOverlap:
+    """compute_overlap(engine="first_fit") of block ranges arriving in
+    batches in blknum order, eg from iter_csv_batches, so levels are assigned
+    while the export is still being read."""
+    levels: list[list[BlockRange]] = []
+    bounds: list[tuple[int, int, int, int]] = []
+    for batch in batches:
+        if not len(batch):
+            continue
+        for br in batch:
+            _first_fit_insert(levels, br)
+        bounds.append(
+            (
+                int(batch.start.min()),
+                int(batch.end.max()),
+                int(batch.blknum[0]),
+                int(batch.blknum[-1]),
+            )
+        )
+        logging.info(f"added {sum(len(level) for level in levels)} block ranges")
+    if not bounds:
+        raise ValueError("block_ranges was empty, couldn't compute BrinOverlap")
+    min_vals, max_vals, min_blknums, max_blknums = zip(*bounds)
+    return BrinOverlap(
+        min_val=from_micros(min(min_vals)),
+        max_val=from_micros(max(max_vals)),
+        min_blknum=min(min_blknums),
+        max_blknum=max(max_blknums),
+        levels=levels,
+    )
+
+
+def update_overlap(existing: BrinOverlap, new_export: BlockRanges) -> BrinOverlap:
+    """Update an overlap computed from an older export to match new_export,
+    eg for a daily refresh. Block ranges are matched by blknum: unchanged
+    ones keep their place, changed and deleted ones are removed from their
+    levels, and new and changed ones are inserted first fit in blknum order
+    (like compute_overlap's first_fit engine).
+
+    The diff is a few numpy passes over both exports. Levels stay columnar:
+    levels losing block ranges are masked, and the block ranges inserted into
+    a level are collected and merged into its columns once at the end. Only
+    inserted block ranges go through the Python first fit loop, so the cost
+    is mostly proportional to the change rather than the index size. A level
+    emptied by deletions keeps its slot (unless it's the last), so the
+    levels above keep their index."""
+    new = as_block_range_array(new_export)
+    if len(new) == 0:
+        raise ValueError("new_export was empty, couldn't update BrinOverlap")
+    old = existing.block_ranges_by_level()
+    old_unchanged, new_unchanged = match_block_ranges(old, new)
+    offsets = np.cumsum([0] + [len(level) for level in existing.levels]).tolist()
+    levels: list[Sequence[BlockRange]] = []
+    for level, lo, hi in zip(existing.levels, offsets, offsets[1:]):
+        keep = old_unchanged[lo:hi]
+        if keep.all():
+            levels.append(level)
+        else:
+            levels.append(as_block_range_array(level)[keep])
+
+    added = new[~new_unchanged].sorted_by_blknum()
+    logging.info(
+        f"{len(old) - int(old_unchanged.sum())} block ranges removed, "
+        f"{len(added)} inserted"
+    )
+    # per level, the block ranges to insert (sorted like a level) and their
+    # positions in the level. Overlaps are pairwise, so a block range fits
+    # if it fits both the level and its insertions.
+    inserts: dict[int, list[BlockRange]] = {}
+    positions: dict[int, list[int]] = {}
+    for br in added:
+        for i, level in enumerate(levels):
+            pos = find_position(level, br)
+            if pos is None:
+                continue
+            level_inserts = inserts.setdefault(i, [])
+            insert_pos = find_position(level_inserts, br)
+            if insert_pos is None:
+                continue
+            level_inserts.insert(insert_pos, br)
+            positions.setdefault(i, []).insert(insert_pos, pos)
+            break
+        else:
+            inserts[len(levels)], positions[len(levels)] = [br], [0]
+            levels.append(BlockRangeArray.empty())  # new level
+    for i, level_inserts in inserts.items():
+        level = as_block_range_array(levels[i])
+        ins = BlockRangeArray.from_block_ranges(level_inserts)
+        at = np.array(positions[i], np.int64)
+        levels[i] = BlockRangeArray(
+            np.insert(level.blknum, at, ins.blknum),
+            np.insert(level.start, at, ins.start),
+            np.insert(level.end, at, ins.end),
+        )
+    while levels and len(levels[-1]) == 0:
+        levels.pop()
+    # every block range of new_export is now in a level.
+    return BrinOverlap(
+        min_val=from_micros(new.start.min()),
+        max_val=from_micros(new.end.max()),
+        min_blknum=int(new.blknum.min()),
+        max_blknum=int(new.blknum.max()),
+        levels=levels,
+    )
+
+
+@dataclass(eq=False)
+class DepthProfile:
+    """Overlap depth (number of block ranges covering each instant) as a step
+    function: depth[i] holds on [times[i], times[i+1]). Block ranges are
+    treated as half-open [start, end) like the level assignment, where a
+    block range can follow one ending at its start on the same level. A zero
+    width block range still needs a level at its instant, on top of the
+    block ranges covering it on both sides: that's a zero length segment
+    before the others at its time. So max() is the number of levels
+    compute_overlap(engine="sweep") needs."""
+
+    times: Int64Array  # epoch microseconds
+    depth: Int64Array
+
+    def _durations(self) -> Int64Array:
+        return np.diff(self.times)
+
+    def max(self) -> int:
+        return int(self.depth.max()) if len(self.depth) else 0
+
+    def depth_at(self, dt: datetime) -> int:
+        i = int(np.searchsorted(self.times, to_micros(dt), side="right")) - 1
+        return int(self.depth[i]) if i >= 0 else 0
+
+    def percentile(self, q: float) -> int:
+        """Time weighted percentile (0-100) of depth over the covered span,
+        eg percentile(50) is the depth at a typical instant."""
+        durations = self._durations()
+        if len(durations) == 0 or durations.sum() == 0:
+            return self.max()
+        depth = self.depth[:-1]
+        order = np.argsort(depth, kind="stable")
+        cum = np.cumsum(durations[order])
+        i = int(np.searchsorted(cum, q / 100 * cum[-1], side="left"))
+        return int(depth[order[min(i, len(order) - 1)]])
+
+    def mean(self) -> float:
+        durations = self._durations()
+        total = durations.sum()
+        if total == 0:
+            return float(self.max())
+        return float((self.depth[:-1] * durations).sum() / total)
+
+    def worst_windows(
+        self, k: int, span: timedelta
+    ) -> list[tuple[datetime, datetime, int]]:
+        """The k worst back-to-back windows of length span (aligned to
+        multiples of span since the epoch, eg whole days) by max depth, as
+        (start, end, max depth)."""
+        if len(self.times) == 0:
+            return []
+        span_us = span // timedelta(microseconds=1)
+        first = int(self.times[0]) // span_us * span_us
+        starts = np.arange(first, self.times[-1], span_us, dtype=np.int64)
+        # segments overlapping window i are lo[i] until hi[i] (exclusive):
+        # from the first segment at its start (maybe zero length), or else
+        # the one holding then.
+        lo = np.searchsorted(self.times, starts, side="left")
+        at_start = self.times[np.minimum(lo, len(self.times) - 1)] == starts
+        lo = np.maximum(np.where(at_start, lo, lo - 1), 0)
+        hi = np.searchsorted(self.times, starts + span_us, side="left")
+        window_max = np.maximum.reduceat(self.depth, lo)
+        # reduceat stops at the next window's lo, which may still overlap.
+        next_lo = np.append(lo[1:], len(self.depth))
+        straddles = hi > next_lo
+        straddling_depth = self.depth[np.minimum(next_lo, len(self.depth) - 1)]
+        window_max = np.where(
+            straddles, np.maximum(window_max, straddling_depth), window_max
+        )
+        order = np.argsort(-window_max, kind="stable")[:k]
+        return [
+            (
+                from_micros(starts[i]),
+                from_micros(starts[i] + span_us),
+                int(window_max[i]),
+            )
+            for i in order.tolist()
+        ]
+
+
+def depth_profile(block_ranges: BlockRanges) -> DepthProfile:
+    """Compute the overlap depth curve with one sort over start/end events,
+    without assigning levels. O(n log n)."""
+    brs = as_block_range_array(block_ranges)
+    wide = brs.end > brs.start
+    starts, ends = brs.start[wide], brs.end[wide]
+    times = np.concatenate((starts, ends))
+    deltas = np.concatenate(
+        (np.ones(len(starts), np.int64), np.full(len(ends), -1, np.int64))
+    )
+    # at equal times, ends (-1) sort before starts (+1).
+    order = np.lexsort((deltas, times))
+    times, depth = times[order], np.cumsum(deltas[order])
+    # keep the depth after the last event at each distinct time.
+    last_at_time = np.append(times[1:] != times[:-1], True)[: len(times)]
+    times, depth = times[last_at_time], depth[last_at_time]
+
+    points = np.unique(brs.start[~wide])
+    if len(points) == 0:
+        return DepthProfile(times, depth)
+    # a zero width block range at t needs one more level than the block
+    # ranges with start < t < end.
+    starts.sort()
+    ends.sort()
+    covering = np.searchsorted(starts, points, "left")
+    covering -= np.searchsorted(ends, points, "right")
+    after = np.append(0, depth)[np.searchsorted(times, points, "right")]
+    # (time, zero length first) order, dropping the repeated depth after
+    # each point where there already was an event.
+    all_times = np.concatenate((times, points, points))
+    all_depth = np.concatenate((depth, covering + 1, after))
+    kind = np.concatenate(
+        (np.ones(len(times)), np.zeros(len(points)), np.full(len(points), 2))
+    )
+    order = np.lexsort((kind, all_times))
+    all_times, all_depth, kind = all_times[order], all_depth[order], kind[order]
+    repeated = (kind == 2) & np.append(False, all_times[1:] == all_times[:-1])
+    repeated &= np.append(False, kind[:-1] == 1)
+    return DepthProfile(all_times[~repeated], all_depth[~repeated])
 
 
 def print_bro(bro: BrinOverlap) -> None:
@@ -107,19 +626,97 @@ def print_bro(bro: BrinOverlap) -> None:
         print(f"{i}:", [br.blknum for br in level])
 
 
-#%%
+# %%
 if __name__ == "__main__":
     import logging
 
     logging.basicConfig(level=logging.INFO)
     p = argparse.ArgumentParser()
-    p.add_argument("-i", dest="input", required=True, help="input CSV")
-    p.add_argument("-o", dest="output", help="output JSON (cached BrinOverlap data)")
+    p.add_argument(
+        "-i",
+        dest="input",
+        required=True,
+        help="input CSV (maybe compressed, - for stdin)",
+    )
+    p.add_argument(
+        "-o",
+        dest="output",
+        help="output JSON or binary .bro file (cached BrinOverlap data)",
+    )
+    p.add_argument(
+        "-bin",
+        action="store_true",
+        help="when inferring the output path, use the binary .bro format",
+    )
+    p.add_argument(
+        "-engine",
+        choices=ENGINES,
+        default="first_fit",
+        help="level assignment: first_fit (blknum order) or sweep (fewest levels)",
+    )
+    p.add_argument(
+        "-workers",
+        type=int,
+        help="processes for the first_fit engine (default: CPU count)",
+    )
+    p.add_argument(
+        "-update",
+        metavar="OVERLAP",
+        help="JSON or .bro overlap of an older export to update incrementally, "
+        "instead of computing from scratch (inserts are always first_fit)",
+    )
+    p.add_argument(
+        "-attnum",
+        type=int,
+        help="column of a multi-column export (default: every column, each "
+        "saved to its own _attnumN output)",
+    )
+    p.add_argument(
+        "-stream",
+        action="store_true",
+        help="assign first_fit levels while a single column export is read "
+        "(serial, and skips the parse cache), for exports too big to parse up "
+        "front",
+    )
     args = p.parse_args()
-    output = args.output or brin_filenames.overlap_json_from_brinexport_csv(args.input)
-    brs = parse_csv_file(args.input)
-    logging.info("computing overlap...")
-    overlap = compute_overlap(brs)
-    logging.info(f"saving to {output}...")
-    write_overlap_file(overlap, output)
+    if args.stream and (args.update or args.engine != "first_fit"):
+        p.error("-stream only computes first_fit from scratch")
+    if args.stream and args.attnum is not None:
+        p.error("-stream only reads single column exports")
+    if args.output:
+        output = args.output
+    elif args.bin:
+        output = brin_filenames.overlap_bin_from_brinexport_csv(args.input)
+    else:
+        output = brin_filenames.overlap_json_from_brinexport_csv(args.input)
+    if args.stream:
+        logging.info("computing overlap while reading the export...")
+        batches = iter_csv_batches(args.input)
+        overlap = compute_overlap_stream(batches)
+        logging.info(f"saving to {output}...")
+        write_overlap(overlap, output)
+    else:
+        by_attnum = parse_csv_cached_by_attnum(args.input)
+        # an inferred output name is the same with or without -attnum.
+        suffix_attnum = len(by_attnum) > 1 and not (
+            args.output and args.attnum is not None
+        )
+        if args.attnum is not None:
+            by_attnum = {args.attnum: select_attnum(by_attnum, args.attnum)}
+        if args.update and len(by_attnum) > 1:
+            p.error("-update needs -attnum for multi-column exports")
+        for attnum, brs in by_attnum.items():
+            if suffix_attnum:
+                logging.info(f"attnum {attnum}:")
+                attnum_output = brin_filenames.with_attnum(output, attnum)
+            else:
+                attnum_output = output
+            if args.update:
+                logging.info(f"updating overlap {args.update}...")
+                overlap = update_overlap(read_overlap(args.update), brs)
+            else:
+                logging.info("computing overlap...")
+                overlap = compute_overlap(brs, args.engine, args.workers)
+            logging.info(f"saving to {attnum_output}...")
+            write_overlap(overlap, attnum_output)
     logging.info("done✨")
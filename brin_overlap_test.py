@@ -1,15 +1,57 @@
 from __future__ import annotations
 
-from datetime import datetime
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Sequence
 
-from brin_lib import BlockRange
-from brin_overlap import compute_overlap, find_position, try_insert
+import numpy as np
+import pytest
 
+from brin_lib import BlockRange, BlockRangeArray, from_micros
+import brin_overlap
+import brin_parser
+from brin_overlap import (
+    ENGINES,
+    BrinOverlap,
+    component_bounds,
+    compute_overlap,
+    compute_overlap_stream,
+    depth_profile,
+    find_position,
+    level_window,
+    read_overlap,
+    read_overlap_binary,
+    try_insert,
+    update_overlap,
+    write_overlap,
+)
+from brin_parser import iter_csv_batches, parse_csv_file
+from brin_synth import SCENARIOS, generate
 
-def blknums(brs: list[BlockRange]) -> list[int]:
+
+def blknums(brs: Sequence[BlockRange]) -> list[int]:
     return [br.blknum for br in brs]
 
 
+def test_level_window_list_and_array() -> None:
+    level = compute_overlap(generate(200, "append")).levels[0]
+    array = BlockRangeArray.from_block_ranges(level)
+    assert isinstance(level, list)
+    rng = np.random.default_rng(0)
+    # block range boundaries, and times in between.
+    times = np.concatenate(
+        [array.start[::7], array.end[::5], rng.choice(array.end, 20) + 1]
+    )
+    for match_type in ["overlap", "within"]:
+        for start, end in zip(times, rng.permutation(times)):
+            start, end = from_micros(int(start)), from_micros(int(end))
+            for a, b in [(start, end), (None, end), (start, None)]:
+                assert list(level_window(level, a, b, match_type)) == list(  # type: ignore
+                    level_window(array, a, b, match_type)  # type: ignore
+                )
+
+
 def test_find_position() -> None:
     a = BlockRange(1, datetime.fromtimestamp(1), datetime.fromtimestamp(2))
     b = BlockRange(2, datetime.fromtimestamp(3), datetime.fromtimestamp(4))
@@ -107,3 +149,311 @@ def test_compute_overlap_overlap() -> None:
     assert len(bro.levels) == 2
     assert blknums(bro.levels[0]) == [1, 2]
     assert blknums(bro.levels[1]) == [4, 3]
+
+
+def assert_valid_levels(bro: BrinOverlap, brs: list[BlockRange]) -> None:
+    """Every block range appears exactly once, and levels are sorted and
+    non-overlapping."""
+    assert sorted(blknums([br for level in bro.levels for br in level])) == sorted(
+        blknums(brs)
+    )
+    for level in bro.levels:
+        for left, right in zip(level, level[1:]):
+            assert left.end <= right.start
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_compute_overlap_engines_valid(engine: str) -> None:
+    for path in [
+        "testdata/brinexport_test_overlaps.csv",
+        "examples/brinexport_large_example_201903_to_202005.csv",
+    ]:
+        brs = parse_csv_file(path).to_block_ranges()
+        assert_valid_levels(compute_overlap(brs, engine), brs)  # type: ignore
+
+
+def test_compute_overlap_sweep_minimal() -> None:
+    # first_fit in blknum order needs 3 levels here, but 2 suffice.
+    a = BlockRange(1, datetime.fromtimestamp(8), datetime.fromtimestamp(12))
+    b = BlockRange(2, datetime.fromtimestamp(1), datetime.fromtimestamp(5))
+    c = BlockRange(3, datetime.fromtimestamp(4), datetime.fromtimestamp(8))
+    d = BlockRange(4, datetime.fromtimestamp(7), datetime.fromtimestamp(9))
+    assert len(compute_overlap([a, b, c, d], "first_fit").levels) == 3
+    bro = compute_overlap([a, b, c, d], "sweep")
+    assert len(bro.levels) == 2
+    assert_valid_levels(bro, [a, b, c, d])
+
+
+def test_compute_overlap_unknown_engine() -> None:
+    a = BlockRange(1, datetime.fromtimestamp(1), datetime.fromtimestamp(2))
+    with pytest.raises(ValueError):
+        compute_overlap([a], "bogus")  # type: ignore
+
+
+def _levels(bro: BrinOverlap) -> list[list[BlockRange]]:
+    return [list(level) for level in bro.levels]
+
+
+def test_component_bounds() -> None:
+    t = datetime(2021, 1, 1)
+    h = timedelta(hours=1)
+    brs = BlockRangeArray.from_block_ranges(
+        [
+            BlockRange(0, t + 4 * h, t + 5 * h),
+            BlockRange(1, t, t + 2 * h),
+            BlockRange(2, t + h, t + 3 * h),
+            # touching the previous component's end: same component.
+            BlockRange(3, t + 3 * h, t + 3 * h),
+            BlockRange(4, t + 6 * h, t + 7 * h),
+        ]
+    )
+    order, starts = component_bounds(brs)
+    assert list(order) == [1, 2, 3, 0, 4]
+    assert list(starts) == [0, 3, 4]
+
+
+def _edge_case_block_ranges() -> BlockRangeArray:
+    # touching and zero width block ranges, in shuffled blknum order.
+    rng = random.Random(0)
+    t = datetime(2021, 1, 1)
+    brs = []
+    for i in range(300):
+        start = t + timedelta(minutes=rng.randrange(0, 3000, 10))
+        width = timedelta(minutes=rng.choice([0, 0, 10, 20, 45]))
+        brs.append(BlockRange(i * 128, start, start + width))
+    rng.shuffle(brs)
+    return BlockRangeArray.from_block_ranges(brs)
+
+
+@pytest.mark.parametrize("scenario", SCENARIOS + ("edge_cases",))
+def test_compute_overlap_parallel_same_layout(
+    monkeypatch: pytest.MonkeyPatch, scenario: str
+) -> None:
+    monkeypatch.setattr(brin_overlap, "PARALLEL_MIN_RANGES", 0)
+    if scenario == "edge_cases":
+        brs = _edge_case_block_ranges()
+    else:
+        brs = generate(3000, scenario)  # type: ignore
+    serial = compute_overlap(brs)
+    parallel = compute_overlap(brs, workers=3)
+    assert _levels(parallel) == _levels(serial)
+    assert parallel.min_val == serial.min_val
+    assert parallel.max_blknum == serial.max_blknum
+
+
+def test_compute_overlap_stream(monkeypatch: pytest.MonkeyPatch) -> None:
+    path = "examples/brinexport_large_example_201903_to_202005.csv"
+    expected = compute_overlap(parse_csv_file(path))
+    # small chunks, so levels are assigned over many batches.
+    monkeypatch.setattr(brin_parser, "CHUNK_SIZE", 1 << 12)
+    monkeypatch.setattr(brin_parser, "_MIN_RUN_CHUNK_SIZE", 1 << 12)
+    res = compute_overlap_stream(iter_csv_batches(path))
+    assert _levels(res) == _levels(expected)
+    assert (res.min_val, res.max_val) == (expected.min_val, expected.max_val)
+    assert (res.min_blknum, res.max_blknum) == (
+        expected.min_blknum,
+        expected.max_blknum,
+    )
+    with pytest.raises(ValueError):
+        compute_overlap_stream([BlockRangeArray.empty()])
+
+
+def test_overlap_binary_roundtrip(tmp_path: str) -> None:
+    brs = parse_csv_file("examples/brinexport_large_example_201903_to_202005.csv")
+    bro = compute_overlap(brs)
+    path = os.path.join(tmp_path, "overlap_test.bro")
+    write_overlap(bro, path)
+    bro2 = read_overlap(path)
+    assert (bro2.min_val, bro2.max_val) == (bro.min_val, bro.max_val)
+    assert (bro2.min_blknum, bro2.max_blknum) == (bro.min_blknum, bro.max_blknum)
+    assert _levels(bro2) == _levels(bro)
+    # binary levels can be written back out as JSON, and as binary again.
+    json_path = os.path.join(tmp_path, "overlap_test.json")
+    write_overlap(bro2, json_path)
+    assert blknums(read_overlap(json_path).levels[0]) == blknums(bro.levels[0])
+    path2 = os.path.join(tmp_path, "overlap_test2.bro")
+    write_overlap(bro2, path2)
+    assert _levels(read_overlap_binary(path2)) == _levels(bro)
+
+
+@pytest.mark.parametrize("match_type", ["overlap", "within"])
+def test_overlap_window(tmp_path: str, match_type: str) -> None:
+    brs = parse_csv_file("examples/brinexport_large_example_201903_to_202005.csv")
+    bro = compute_overlap(brs)
+    path = os.path.join(tmp_path, "overlap_test.bro")
+    write_overlap(bro, path)
+    after, before = datetime(2019, 6, 1), datetime(2019, 9, 1, 12)
+    for cached in [bro, read_overlap(path)]:
+        for window in [(after, None), (None, before), (after, before)]:
+            res = cached.window(*window, match_type)  # type: ignore
+            expected = brs.filter_dates(match_type, *window)  # type: ignore
+            assert_valid_levels(res, expected.to_block_ranges())
+            assert all(len(level) for level in res.levels)
+            assert res.min_val == from_micros(expected.start.min())
+            assert res.max_blknum == expected.blknum.max()
+        res = cached.window(after, before, min_blknum=45000, max_blknum=50000)
+        expected = brs.filter_dates("overlap", after, before).filter_blknums(
+            45000, 50000
+        )
+        assert_valid_levels(res, expected.to_block_ranges())
+        with pytest.raises(ValueError):
+            cached.window(datetime(2030, 1, 1))
+
+
+def test_update_overlap_appended() -> None:
+    # appending higher blknums continues first fit where it left off.
+    brs = parse_csv_file("examples/brinexport_large_example_201903_to_202005.csv")
+    old = compute_overlap(brs[: len(brs) // 2])
+    assert _levels(update_overlap(old, brs)) == _levels(compute_overlap(brs))
+
+
+def test_update_overlap_changed(tmp_path: str) -> None:
+    brs = parse_csv_file("examples/brinexport_large_example_201903_to_202005.csv")
+    bro = compute_overlap(brs)
+    path = os.path.join(tmp_path, "overlap_test.bro")
+    write_overlap(bro, path)
+    rng = np.random.default_rng(0)
+    n = len(brs)
+    # delete some block ranges, change others (widening them) and add more.
+    keep = rng.random(n) > 0.02
+    end = brs.end + np.where(rng.random(n) < 0.02, 10**10, 0)
+    new = BlockRangeArray.concatenate(
+        [
+            BlockRangeArray(brs.blknum, brs.start, end)[keep],
+            BlockRangeArray(brs.blknum[:50] + 10**7, brs.start[:50], brs.end[:50]),
+        ]
+    )
+    for cached in [bro, read_overlap(path)]:
+        res = update_overlap(cached, new)
+        assert_valid_levels(res, new.to_block_ranges())
+        assert res.min_val == from_micros(new.start.min())
+        assert res.max_val == from_micros(new.end.max())
+        assert res.max_blknum == new.blknum.max()
+        # updating to the same export is a no-op.
+        assert _levels(update_overlap(res, new)) == _levels(res)
+    with pytest.raises(ValueError):
+        update_overlap(bro, [])
+
+
+def test_update_overlap_keeps_level_slots() -> None:
+    brs = parse_csv_file("examples/brinexport_large_example_201903_to_202005.csv")
+    bro = compute_overlap(brs)
+    levels = [BlockRangeArray.from_block_ranges(level) for level in bro.levels]
+    cached = BrinOverlap(
+        bro.min_val, bro.max_val, bro.min_blknum, bro.max_blknum, levels
+    )
+    # delete every block range of level 1.
+    deleted = np.isin(brs.blknum, levels[1].blknum)
+    res = update_overlap(cached, brs[~deleted])
+    assert_valid_levels(res, brs[~deleted].to_block_ranges())
+    assert len(res.levels[1]) == 0
+    assert len(res.levels) == len(cached.levels)
+    for before, after in zip(cached.levels[2:], res.levels[2:]):
+        assert after is before  # untouched
+    # appended block ranges (overlapping the first ones) refill it.
+    appended = BlockRangeArray(brs.blknum[:5] + 10**7, brs.start[:5], brs.end[:5])
+    new = BlockRangeArray.concatenate([brs[~deleted], appended])
+    res = update_overlap(res, new)
+    assert_valid_levels(res, new.to_block_ranges())
+    assert isinstance(res.levels[1], BlockRangeArray)
+    refilled = {br.blknum for br in res.levels[1]}
+    assert refilled and refilled <= set(appended.blknum.tolist())
+
+
+def test_update_overlap_in_place(tmp_path: str) -> None:
+    # the daily refresh: update a .bro with a newer export, onto itself.
+    brs = parse_csv_file("examples/brinexport_large_example_201903_to_202005.csv")
+    path = os.path.join(tmp_path, "overlap_test.bro")
+    write_overlap(compute_overlap(brs[: len(brs) // 2]), path)
+    cached = read_overlap(path)
+    write_overlap(update_overlap(cached, brs), path)
+    assert _levels(read_overlap(path)) == _levels(compute_overlap(brs))
+    # rewriting a memory mapped overlap unchanged.
+    write_overlap(read_overlap(path), path)
+    assert _levels(read_overlap(path)) == _levels(compute_overlap(brs))
+    assert os.listdir(tmp_path) == ["overlap_test.bro"]
+
+
+def test_overlap_binary_bad_magic(tmp_path: str) -> None:
+    path = os.path.join(tmp_path, "overlap_test.bro")
+    with open(path, "w") as f:
+        f.write("{}")
+    with pytest.raises(ValueError):
+        read_overlap_binary(path)
+
+
+def test_depth_profile_simple() -> None:
+    ts = datetime.fromtimestamp
+    a = BlockRange(1, ts(0), ts(10))
+    b = BlockRange(2, ts(5), ts(15))
+    c = BlockRange(3, ts(10), ts(20))  # touches a, so doesn't overlap it
+    profile = depth_profile([a, b, c])
+    depths = [profile.depth_at(ts(t)) for t in [-1, 0, 5, 10, 15, 20]]
+    assert depths == [0, 1, 2, 2, 1, 0]
+    assert profile.max() == 2
+    # depth 1 for 10s, depth 2 for 10s.
+    assert profile.percentile(25) == 1
+    assert profile.percentile(75) == 2
+    assert profile.mean() == 1.5
+    assert depth_profile([]).max() == 0
+
+
+def test_depth_profile_max_is_sweep_levels() -> None:
+    brs = parse_csv_file("examples/brinexport_large_example_full.csv")
+    assert depth_profile(brs).max() == len(compute_overlap(brs, "sweep").levels)
+
+
+def test_depth_profile_zero_width() -> None:
+    ts = datetime.fromtimestamp
+    h = 3600
+    # several zero width block ranges at an instant share one level.
+    points = [BlockRange(i, ts(h), ts(h)) for i in range(3)]
+    assert depth_profile(points).max() == 1
+    assert len(compute_overlap(points, "sweep").levels) == 1
+    # ... or reuse the level of a block range ending or starting there.
+    touching = points + [BlockRange(3, ts(0), ts(h)), BlockRange(4, ts(h), ts(2 * h))]
+    assert depth_profile(touching).max() == 1
+    assert len(compute_overlap(touching, "sweep").levels) == 1
+    # but one covering the instant takes a level of its own.
+    covering = touching + [BlockRange(5, ts(h - 1), ts(h + 1))]
+    profile = depth_profile(covering)
+    assert profile.max() == 2
+    assert len(compute_overlap(covering, "sweep").levels) == 2
+    # the zero length segment counts in worst windows, not in durations.
+    assert profile.depth_at(ts(h)) == 2
+    assert profile.percentile(100) == 2
+    day = profile.worst_windows(2, timedelta(hours=1))
+    assert [(start, depth) for start, _, depth in day] == [(ts(0), 2), (ts(h), 2)]
+
+
+def test_depth_profile_max_is_sweep_levels_random() -> None:
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        n = 40
+        # a coarse grid, so start and end times often coincide.
+        start = rng.integers(0, 20, n) * 10**6
+        end = start + rng.choice([0, 0, 1, 2, 5], n) * 10**6
+        brs = BlockRangeArray(np.arange(n, dtype=np.int64) * 128, start, end)
+        bro = compute_overlap(brs, "sweep")
+        assert_valid_levels(bro, brs.to_block_ranges())
+        assert depth_profile(brs).max() == len(bro.levels)
+
+
+def test_depth_profile_worst_windows() -> None:
+    rng = random.Random(0)
+    t0 = datetime(2020, 1, 1)
+    brs = []
+    for i in range(200):
+        start = t0 + timedelta(minutes=rng.randint(0, 3000))
+        brs.append(BlockRange(i, start, start + timedelta(minutes=rng.randint(1, 90))))
+    profile = depth_profile(brs)
+    windows = profile.worst_windows(100, timedelta(hours=1))
+    assert len(windows) == 51
+    assert windows[0][2] == profile.max()
+    # compare with the depth sampled every minute (all times are whole minutes).
+    for start, end, max_depth in windows:
+        minutes = int((end - start) / timedelta(minutes=1))
+        sampled = [
+            profile.depth_at(start + timedelta(minutes=m)) for m in range(minutes)
+        ]
+        assert max(sampled) == max_depth
@@ -1,12 +1,46 @@
 #%%
 from __future__ import annotations
 
+import array
+import bz2
 import csv
+import gzip
+import heapq
+import io
+import lzma
+import mmap
 import re
+import sys
+from contextlib import ExitStack, contextmanager
 from datetime import datetime
-from typing import Iterable, Literal, Optional
+from typing import (
+    BinaryIO,
+    Iterable,
+    Iterator,
+    Literal,
+    Mapping,
+    Optional,
+    TextIO,
+    cast,
+)
+
+import numpy as np
+import numpy.typing as npt
+
+from brin_filenames import STDIN
+from brin_lib import (
+    BlockRange,
+    BlockRangeArray,
+    BlockRanges,
+    BoolArray,
+    Int64Array,
+    as_block_range_array,
+    date_match,
+    from_micros,
+    to_micros,
+)
 
-from brin_lib import BlockRange, date_match
+U8Array = npt.NDArray[np.uint8]
 
 
 DT_TUPLE_REX = re.compile(
@@ -26,26 +60,475 @@ def parse_datetime_tuple(s: str) -> tuple[datetime, datetime]:
         raise RuntimeError(f"failed to parse datetime tuple: {s}")
 
 
-def parse_csv_rows(
+def format_datetime(dt: datetime) -> str:
+    """Format like Postgres (no "T", trailing zeros of fractions dropped)."""
+    s = dt.strftime("%Y-%m-%d %H:%M:%S")
+    if dt.microsecond:
+        s += f".{dt.microsecond:06d}".rstrip("0")
+    return s
+
+
+def format_datetime_tuple(start: datetime, end: datetime) -> str:
+    """Inverse of parse_datetime_tuple."""
+    return f"{{{format_datetime(start)} .. {format_datetime(end)}}}"
+
+
+def write_csv_rows(block_ranges: BlockRanges, f: TextIO) -> None:
+    """Write block ranges in the same CSV format as export_brin_items.sh."""
+    brs = as_block_range_array(block_ranges)
+    f.write("blknum,value\n")
+    for blknum, start, end in zip(
+        brs.blknum.tolist(), brs.start.tolist(), brs.end.tolist()
+    ):
+        value = format_datetime_tuple(from_micros(start), from_micros(end))
+        f.write(f"{blknum},{value}\n")
+
+
+def write_csv_file(block_ranges: BlockRanges, filepath: str) -> None:
+    with open(filepath, "w") as f:
+        write_csv_rows(block_ranges, f)
+
+
+def write_csv_rows_by_attnum(by_attnum: Mapping[int, BlockRanges], f: TextIO) -> None:
+    """Write block ranges of each attnum in the same CSV format as
+    export_brin_items.sh with ATTNUM=-1."""
+    columns = {a: as_block_range_array(brs) for a, brs in by_attnum.items()}
+    attnum = np.concatenate(
+        [np.empty(0, np.int64)]
+        + [np.full(len(brs), a, np.int64) for a, brs in columns.items()]
+    )
+    brs = BlockRangeArray.concatenate(list(columns.values()))
+    order = np.lexsort((attnum, brs.blknum))
+    f.write("blknum,attnum,value\n")
+    for blknum, a, start, end in zip(
+        brs.blknum[order].tolist(),
+        attnum[order].tolist(),
+        brs.start[order].tolist(),
+        brs.end[order].tolist(),
+    ):
+        value = format_datetime_tuple(from_micros(start), from_micros(end))
+        f.write(f"{blknum},{a},{value}\n")
+
+
+def write_csv_file_by_attnum(
+    by_attnum: Mapping[int, BlockRanges], filepath: str
+) -> None:
+    with open(filepath, "w") as f:
+        write_csv_rows_by_attnum(by_attnum, f)
+
+
+# With ATTNUM=-1, export_brin_items.sh exports every indexed column, with an
+# extra attnum column. Those are parsed into separate block ranges for each
+# attnum. Single column exports don't record their attnum, and are returned
+# as DEFAULT_ATTNUM (the default ATTNUM of export_brin_items.sh).
+HEADER = ["blknum", "value"]
+ATTNUM_HEADER = ["blknum", "attnum", "value"]
+DEFAULT_ATTNUM = 1
+
+
+def _is_attnum_header(header: list[str]) -> bool:
+    if header not in (HEADER, ATTNUM_HEADER):
+        raise ValueError(f"not a BRIN export CSV, unexpected header: {header}")
+    return header == ATTNUM_HEADER
+
+
+def split_by_attnum(
+    attnum: Int64Array, brs: BlockRangeArray
+) -> dict[int, BlockRangeArray]:
+    """Block ranges of each attnum (in attnum order), sorted by blknum."""
+    ordered = np.all(
+        (attnum[1:] > attnum[:-1])
+        | ((attnum[1:] == attnum[:-1]) & (brs.blknum[1:] >= brs.blknum[:-1]))
+    )
+    if not ordered:
+        # lexsort is stable, like sorted_by_blknum.
+        order = np.lexsort((brs.blknum, attnum))
+        attnum, brs = attnum[order], brs[order]
+    attnums, firsts = np.unique(attnum, return_index=True)
+    bounds = np.append(firsts, len(attnum))
+    return {
+        int(a): brs[int(lo) : int(hi)]
+        for a, lo, hi in zip(attnums, bounds[:-1], bounds[1:])
+    }
+
+
+def _by_attnum(
+    attnum: Optional[Int64Array],
+    brs: BlockRangeArray,
+    start: Optional[datetime],
+    end: Optional[datetime],
+    match_type: Literal["overlap", "within"],
+) -> dict[int, BlockRangeArray]:
+    if attnum is None:
+        # note: not sorted because bug in export_brin_items.sh sorting
+        # different files. sorting makes viz look much nicer.
+        brs = brs.filter_dates(match_type, start, end).sorted_by_blknum()
+        return {DEFAULT_ATTNUM: brs}
+    return {
+        a: column.filter_dates(match_type, start, end)
+        for a, column in split_by_attnum(attnum, brs).items()
+    }
+
+
+def select_attnum(
+    by_attnum: dict[int, BlockRangeArray], attnum: Optional[int] = None
+) -> BlockRangeArray:
+    """Block ranges of one attnum. attnum can be None if there's only one."""
+    if attnum is None:
+        if len(by_attnum) > 1:
+            raise ValueError(
+                f"export has several columns (attnums {list(by_attnum)}), "
+                "pick one with -attnum"
+            )
+        return next(iter(by_attnum.values()), BlockRangeArray.empty())
+    if attnum not in by_attnum:
+        raise ValueError(
+            f"no attnum {attnum} in export, which has attnums {list(by_attnum)} "
+            f"(single column exports are read as attnum {DEFAULT_ATTNUM})"
+        )
+    return by_attnum[attnum]
+
+
+def parse_csv_rows_by_attnum(
     csv_rows: Iterable[str],
     start: Optional[datetime] = None,
     end: Optional[datetime] = None,
     match_type: Literal["overlap", "within"] = "overlap",
-) -> list[BlockRange]:
+) -> dict[int, BlockRangeArray]:
     reader = csv.reader(csv_rows)
-    brs = []
-    for i, row in enumerate(reader):
-        if i == 0:
-            assert row == ["blknum", "value"]
-            continue
-        blknum, value = row
-        br = BlockRange(int(blknum), *parse_datetime_tuple(value))
-        if date_match(br, match_type, start, end):
-            brs.append(br)
-    # note: not sorted because bug in export_brin_items.sh sorting different
-    # files. sorting makes viz look much nicer.
-    brs = sorted(brs, key=lambda br: br.blknum)
-    return brs
+    if (header := next(reader, None)) is None:
+        return {}
+    multi = _is_attnum_header(header)
+    # array.array keeps 8 bytes per value while reading, vs ~36 for list[int].
+    attnums, blknums = array.array("q"), array.array("q")
+    starts, ends = array.array("q"), array.array("q")
+    for row in reader:
+        if multi:
+            blknum, attnum, value = row
+            attnums.append(int(attnum))
+        else:
+            blknum, value = row
+        start_dt, end_dt = parse_datetime_tuple(value)
+        blknums.append(int(blknum))
+        starts.append(to_micros(start_dt))
+        ends.append(to_micros(end_dt))
+    brs = BlockRangeArray(
+        np.frombuffer(blknums, np.int64),
+        np.frombuffer(starts, np.int64),
+        np.frombuffer(ends, np.int64),
+    )
+    attnum_col = np.frombuffer(attnums, np.int64) if multi else None
+    return _by_attnum(attnum_col, brs, start, end, match_type)
+
+
+def parse_csv_rows(
+    csv_rows: Iterable[str],
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    match_type: Literal["overlap", "within"] = "overlap",
+    attnum: Optional[int] = None,
+) -> BlockRangeArray:
+    by_attnum = parse_csv_rows_by_attnum(csv_rows, start, end, match_type)
+    return select_attnum(by_attnum, attnum)
+
+
+# Bulk parser. Rows in the usual layout
+#   blknum,{YYYY-MM-DD HH:MM:SS[.fff][+TZ] .. YYYY-MM-DD HH:MM:SS[.fff][+TZ]}
+# are decoded with numpy over a whole chunk at a time. Like DT_TUPLE_REX, the
+# fractional seconds and timezone are dropped. Any row that doesn't fit the
+# layout falls back to csv + DT_TUPLE_REX (which raises on garbage).
+
+CHUNK_SIZE = 1 << 23  # 8MB
+_MAX_BLKNUM_DIGITS = 18  # fits in int64
+_DT_TEMPLATE = np.frombuffer(b"0000-00-00 00:00:00", np.uint8)
+_DT_LEN = len(_DT_TEMPLATE)
+_DT_IS_DIGIT = _DT_TEMPLATE == ord("0")
+# characters allowed between the seconds and " .. " or "}" (fraction and tz).
+_MAX_DT_SUFFIX = 16
+_IS_DT_SUFFIX_CHAR = np.zeros(256, np.bool_)
+_IS_DT_SUFFIX_CHAR[np.frombuffer(b"0123456789.+-:", np.uint8)] = True
+
+
+def _first_at_or_after(
+    positions: Int64Array, starts: Int64Array, default: int
+) -> Int64Array:
+    """For each start, the first element of sorted positions that is >= start
+    (or default if there is none)."""
+    padded = np.append(positions, default)
+    return padded[np.searchsorted(positions, starts)]
+
+
+def _gather(buf: U8Array, idx: Int64Array) -> U8Array:
+    """buf[idx] with out of bounds indexes clamped. Callers check bounds
+    separately. buf must be non-empty."""
+    return buf.take(idx, mode="clip")
+
+
+def _decode_datetimes(
+    buf: U8Array, offsets: Int64Array
+) -> tuple[Int64Array, BoolArray]:
+    """Decode "YYYY-MM-DD HH:MM:SS" at each offset of buf to epoch microseconds.
+    Also returns a mask of which offsets held a valid datetime."""
+    chars = _gather(buf, offsets[:, None] + np.arange(_DT_LEN))
+    digits = chars - np.uint8(ord("0"))  # non-digits wrap around to > 9
+    ok = (offsets >= 0) & (offsets + _DT_LEN <= len(buf))
+    ok &= np.all((chars == _DT_TEMPLATE) | (_DT_IS_DIGIT & (digits <= 9)), axis=1)
+
+    def num(lo: int, hi: int) -> Int64Array:
+        val = np.zeros(len(offsets), np.int64)
+        for i in range(lo, hi):
+            val = val * 10 + digits[:, i]
+        return np.where(ok, val, 0)
+
+    year, month, day = num(0, 4), num(5, 7), num(8, 10)
+    hour, minute, second = num(11, 13), num(14, 16), num(17, 19)
+    ok &= (year >= 1) & (month >= 1) & (month <= 12)
+    month_idx = np.where(ok, (year - 1970) * 12 + month - 1, 0)
+    month_start = month_idx.astype("datetime64[M]").astype("datetime64[D]")
+    month_end = (month_idx + 1).astype("datetime64[M]").astype("datetime64[D]")
+    days_in_month = (month_end - month_start).astype(np.int64)
+    ok &= (day >= 1) & (day <= days_in_month)
+    ok &= (hour <= 23) & (minute <= 59) & (second <= 59)
+    days = month_start.astype(np.int64) + day - 1
+    micros = (((days * 24 + hour) * 60 + minute) * 60 + second) * 1_000_000
+    return np.where(ok, micros, 0), ok
+
+
+def _skip_dt_suffix(buf: U8Array, offsets: Int64Array) -> tuple[Int64Array, BoolArray]:
+    """Skip fractional seconds/timezone starting at each offset. Returns the
+    offset of the following character, and whether the suffix was short
+    enough to be plausible."""
+    chars = _gather(buf, offsets[:, None] + np.arange(_MAX_DT_SUFFIX + 1))
+    is_suffix = _IS_DT_SUFFIX_CHAR[chars]
+    # argmin finds the first non-suffix char.
+    return offsets + np.argmin(is_suffix, axis=1), ~np.all(is_suffix, axis=1)
+
+
+def _split_lines(buf: U8Array) -> tuple[Int64Array, Int64Array]:
+    """Start and end offsets of the non-blank lines of buf, without their
+    line endings (\n or \r\n). buf must be non-empty."""
+    newlines = np.flatnonzero(buf == ord("\n"))
+    line_starts = np.concatenate(([0], newlines + 1))
+    line_ends = np.concatenate((newlines, [len(buf)]))
+    last = _gather(buf, line_ends - 1)
+    line_ends = line_ends - ((line_ends > line_starts) & (last == ord("\r")))
+    nonblank = line_ends > line_starts
+    return line_starts[nonblank], line_ends[nonblank]
+
+
+def _parse_ints(
+    buf: U8Array, line_starts: Int64Array, line_ends: Int64Array, num_ints: int
+) -> tuple[list[Int64Array], Int64Array, BoolArray]:
+    """The first num_ints comma terminated integer fields of each line. Also
+    returns the offset of the comma ending the last one, and a mask of the
+    lines that were parsed (the others need the slow path)."""
+    all_commas = np.flatnonzero(buf == ord(","))
+    ints = []
+    ok = np.ones(len(line_starts), np.bool_)
+    commas = line_starts - 1
+    for _ in range(num_ints):
+        field_starts = commas + 1
+        commas = _first_at_or_after(all_commas, field_starts, len(buf))
+        field_len = commas - field_starts
+        ok &= (commas < line_ends) & (field_len >= 1)
+        ok &= field_len <= _MAX_BLKNUM_DIGITS
+        val = np.zeros(len(line_starts), np.int64)
+        max_len = int(field_len[ok].max()) if ok.any() else 0
+        for k in range(max_len):
+            in_field = k < field_len
+            digits = _gather(buf, commas - 1 - k) - np.uint8(ord("0"))
+            ok &= ~in_field | (digits <= 9)
+            val += np.where(in_field, digits.astype(np.int64) * 10**k, 0)
+        ints.append(val)
+    return ints, commas, ok
+
+
+def _split_row(line: str, num_fields: int) -> list[str]:
+    (row,) = csv.reader([line])
+    if len(row) != num_fields:
+        raise ValueError(f"expected {num_fields} fields: {line}")
+    return row
+
+
+def _parse_rows(
+    chunk: bytes, num_ints: int
+) -> tuple[list[Int64Array], Int64Array, Int64Array]:
+    """Parse complete CSV lines (no header) of num_ints integer fields and a
+    value into the integer columns, and start and end columns."""
+    if not chunk:
+        empty = BlockRangeArray.empty()
+        return [empty.blknum] * num_ints, empty.start, empty.end
+    buf = np.frombuffer(chunk, np.uint8)
+    line_starts, line_ends = _split_lines(buf)
+    # blknum (and attnum): digits from the start of the field up to a comma.
+    ints, commas, ok = _parse_ints(buf, line_starts, line_ends, num_ints)
+
+    # {start .. end}
+    ok &= _gather(buf, commas + 1) == ord("{")
+    start, start_ok = _decode_datetimes(buf, commas + 2)
+    seps, sep_ok = _skip_dt_suffix(buf, commas + 2 + _DT_LEN)
+    ok &= start_ok & sep_ok
+    for offset, c in enumerate(b" .. "):
+        ok &= _gather(buf, seps + offset) == c
+    end, end_ok = _decode_datetimes(buf, seps + 4)
+    closing, closing_ok = _skip_dt_suffix(buf, seps + 4 + _DT_LEN)
+    ok &= end_ok & closing_ok & (closing == line_ends - 1)
+    ok &= _gather(buf, closing) == ord("}")
+
+    for i in np.flatnonzero(~ok):
+        line = chunk[line_starts[i] : line_ends[i]].decode()
+        row = _split_row(line, num_ints + 1)
+        for col, field in zip(ints, row):
+            col[i] = int(field)
+        start_dt, end_dt = parse_datetime_tuple(row[-1])
+        start[i], end[i] = to_micros(start_dt), to_micros(end_dt)
+    return ints, start, end
+
+
+def _parse_chunk(chunk: bytes) -> tuple[Int64Array, Int64Array, Int64Array]:
+    """Parse complete CSV lines (no header) into blknum, start, end columns."""
+    (blknum,), start, end = _parse_rows(chunk, 1)
+    return blknum, start, end
+
+
+def _parse_attnum_chunk(chunk: bytes) -> tuple[Int64Array, BlockRangeArray]:
+    """Parse complete blknum,attnum,value lines into attnum and block ranges."""
+    (blknum, attnum), start, end = _parse_rows(chunk, 2)
+    return attnum, BlockRangeArray(blknum, start, end)
+
+
+def _complete_lines(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Regroup arbitrary byte chunks into chunks that end on a line boundary."""
+    leftover = b""
+    for chunk in chunks:
+        chunk = leftover + chunk
+        cut = chunk.rfind(b"\n") + 1
+        leftover = chunk[cut:]
+        if cut:
+            yield chunk[:cut]
+    if leftover:
+        yield leftover
+
+
+def read_chunks(f: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    while chunk := f.read(chunk_size):
+        yield chunk
+
+
+def parse_csv_chunks_by_attnum(
+    chunks: Iterable[bytes],
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    match_type: Literal["overlap", "within"] = "overlap",
+) -> dict[int, BlockRangeArray]:
+    """Bulk version of parse_csv_rows_by_attnum for raw bytes of an export
+    CSV. Every column is parsed in the same pass."""
+    parts: list[BlockRangeArray] = []
+    attnums: list[Int64Array] = []
+    multi: Optional[bool] = None
+    for chunk in _complete_lines(chunks):
+        if multi is None:
+            header, _, chunk = chunk.partition(b"\n")
+            multi = _is_attnum_header(next(csv.reader([header.decode()])))
+        if multi:
+            attnum, brs = _parse_attnum_chunk(chunk)
+            attnums.append(attnum)
+            parts.append(brs)
+        else:
+            parts.append(BlockRangeArray(*_parse_chunk(chunk)))
+    if multi is None:
+        return {}
+    attnum_col = np.concatenate(attnums) if multi else None
+    brs = BlockRangeArray.concatenate(parts)
+    return _by_attnum(attnum_col, brs, start, end, match_type)
+
+
+def parse_csv_chunks(
+    chunks: Iterable[bytes],
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    match_type: Literal["overlap", "within"] = "overlap",
+    attnum: Optional[int] = None,
+) -> BlockRangeArray:
+    """Bulk version of parse_csv_rows for raw bytes of an export CSV."""
+    by_attnum = parse_csv_chunks_by_attnum(chunks, start, end, match_type)
+    return select_attnum(by_attnum, attnum)
+
+
+def parse_item_rows(
+    rows: Iterable[tuple[int, int, Optional[str]]],
+) -> tuple[Int64Array, BlockRangeArray]:
+    """Bulk parse (blknum, attnum, value) rows as returned by brin_page_items
+    into attnum and block ranges. Not filtered or sorted, except that rows
+    without a value (all null block ranges, placeholder tuples) are
+    skipped."""
+    chunk = "".join(
+        f"{blknum},{attnum},{value}\n"
+        for blknum, attnum, value in rows
+        if value is not None
+    ).encode()
+    return _parse_attnum_chunk(chunk)
+
+
+# Exports can be read compressed, and from stdin. The format is detected
+# from the first bytes rather than the file name, so it works for pipes too.
+COMPRESSION_MAGIC = {
+    "gzip": b"\x1f\x8b",
+    "bz2": b"BZh",
+    "xz": b"\xfd7zXZ\x00",
+    "zstd": b"\x28\xb5\x2f\xfd",
+}
+
+
+def detect_compression(f: BinaryIO) -> Optional[str]:
+    """Compression format of a buffered binary file, without consuming any
+    of it. None if uncompressed."""
+    head = cast(io.BufferedReader, f).peek(8)
+    for name, magic in COMPRESSION_MAGIC.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def _decompress(f: BinaryIO, compression: str) -> BinaryIO:
+    if compression == "gzip":
+        return cast(BinaryIO, gzip.GzipFile(fileobj=f))
+    if compression == "bz2":
+        return cast(BinaryIO, bz2.BZ2File(f))
+    if compression == "xz":
+        return cast(BinaryIO, lzma.LZMAFile(f))
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("reading zstd compressed exports needs: pip install zstandard")
+    reader = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+    return cast(BinaryIO, reader)
+
+
+@contextmanager
+def open_export(filepath: str) -> Iterator[BinaryIO]:
+    """Open an export CSV for reading bytes, decompressing gzip, bz2, xz or
+    zstd (with the zstandard package) as it's read. "-" reads stdin."""
+    with ExitStack() as stack:
+        if filepath == STDIN:
+            f: BinaryIO = sys.stdin.buffer
+        else:
+            f = stack.enter_context(open(filepath, "rb"))
+        if (compression := detect_compression(f)) is not None:
+            f = stack.enter_context(_decompress(f, compression))
+        yield f
+
+
+def parse_csv_file_by_attnum(
+    filepath: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    match_type: Literal["overlap", "within"] = "overlap",
+) -> dict[int, BlockRangeArray]:
+    """Parse every column of an export CSV, optionally compressed, or "-" for
+    stdin."""
+    with open_export(filepath) as f:
+        return parse_csv_chunks_by_attnum(read_chunks(f), start, end, match_type)
 
 
 def parse_csv_file(
@@ -53,9 +536,196 @@ def parse_csv_file(
     start: Optional[datetime] = None,
     end: Optional[datetime] = None,
     match_type: Literal["overlap", "within"] = "overlap",
-) -> list[BlockRange]:
-    with open(filepath) as f:
-        return parse_csv_rows(f, start, end, match_type)
+    attnum: Optional[int] = None,
+) -> BlockRangeArray:
+    """Parse an export CSV, optionally compressed, or "-" for stdin. attnum
+    picks a column of multi-column exports."""
+    by_attnum = parse_csv_file_by_attnum(filepath, start, end, match_type)
+    return select_attnum(by_attnum, attnum)
+
+
+# Streaming parser. export_brin_items.sh concatenates per-page files, each
+# sorted by blknum, so the CSV is a sequence of sorted runs. A first pass
+# over a memory map finds where each run starts, parsing only the blknum
+# column a chunk at a time. Then each run is parsed lazily, a chunk at a
+# time, and the buffered rows are merged in batches. Memory use is about a
+# chunk per run (runs smaller than that are read whole), and rows come out
+# long before the file is parsed, unless the runs are all tiny.
+_MIN_RUN_CHUNK_SIZE = 1 << 16  # 64KB
+
+
+def _line_cut(mm: mmap.mmap, pos: int, end: int, chunk_size: int) -> int:
+    """End of a piece of mm[pos:end] of about chunk_size bytes, on a line
+    boundary."""
+    cut = min(pos + chunk_size, end)
+    if cut < end:
+        newline = mm.rfind(b"\n", pos, cut)
+        if newline == -1:  # a line longer than chunk_size
+            newline = mm.find(b"\n", cut, end)
+        cut = end if newline == -1 else newline + 1
+    return cut
+
+
+def _line_blknums(chunk: bytes) -> tuple[Int64Array, Int64Array]:
+    """Start offsets and blknums of the non-blank lines of chunk."""
+    buf = np.frombuffer(chunk, np.uint8)
+    line_starts, line_ends = _split_lines(buf)
+    (blknum,), _, ok = _parse_ints(buf, line_starts, line_ends, 1)
+    for i in np.flatnonzero(~ok):
+        line = chunk[line_starts[i] : line_ends[i]].decode()
+        blknum[i] = int(_split_row(line, 2)[0])
+    return line_starts, blknum
+
+
+def _sorted_runs(mm: mmap.mmap, pos: int) -> list[tuple[int, int, int]]:
+    """The runs of rows sorted by blknum, as byte ranges [start, end) and
+    their number of rows."""
+    run_starts, row_starts = [pos], [0]
+    prev_blknum, num_rows = -1, 0
+    while pos < len(mm):
+        cut = _line_cut(mm, pos, len(mm), CHUNK_SIZE)
+        line_starts, blknum = _line_blknums(mm[pos:cut])
+        drops = np.flatnonzero(np.diff(blknum, prepend=prev_blknum) < 0)
+        run_starts.extend((pos + line_starts[drops]).tolist())
+        row_starts.extend((num_rows + drops).tolist())
+        if len(blknum):
+            prev_blknum = int(blknum[-1])
+        num_rows += len(blknum)
+        pos = cut
+    return list(
+        zip(
+            run_starts,
+            run_starts[1:] + [len(mm)],
+            np.diff(row_starts + [num_rows]).tolist(),
+        )
+    )
+
+
+def _parse_range(mm: mmap.mmap, pos: int, end: int) -> BlockRangeArray:
+    parts = []
+    while pos < end:
+        cut = _line_cut(mm, pos, end, CHUNK_SIZE)
+        parts.append(BlockRangeArray(*_parse_chunk(mm[pos:cut])))
+        pos = cut
+    return BlockRangeArray.concatenate(parts)
+
+
+def _merge_runs(
+    mm: mmap.mmap, runs: list[tuple[int, int, int]]
+) -> Iterator[BlockRangeArray]:
+    """Batches of the rows of all runs in blknum order. Ties keep file order,
+    like a stable sort."""
+    chunk_size = max(CHUNK_SIZE // len(runs), _MIN_RUN_CHUNK_SIZE)
+    pos = [lo for lo, _, _ in runs]
+    ends = [hi for _, hi, _ in runs]
+    buffers = [BlockRangeArray.empty()] * len(runs)
+    # (first buffered blknum, run) of the runs with buffered rows.
+    heads: list[tuple[int, int]] = []
+    # (last buffered blknum, run) of the runs with more to read. Every
+    # unread row is after the smallest in (blknum, run) order, so buffered
+    # rows up to it can go.
+    unread: list[tuple[int, int]] = []
+
+    def read(i: int) -> None:
+        while pos[i] < ends[i] and not len(buffers[i]):
+            cut = _line_cut(mm, pos[i], ends[i], chunk_size)
+            buffers[i] = BlockRangeArray(*_parse_chunk(mm[pos[i] : cut]))
+            pos[i] = cut
+        if len(buffers[i]):
+            heapq.heappush(heads, (int(buffers[i].blknum[0]), i))
+            if pos[i] < ends[i]:
+                heapq.heappush(unread, (int(buffers[i].blknum[-1]), i))
+
+    # runs that fit in a chunk are read whole. Parse consecutive ones
+    # together, there may be one per index page.
+    i = 0
+    while i < len(runs):
+        j = i
+        while j < len(runs) and ends[j] - pos[j] <= chunk_size:
+            j += 1
+        if j == i:
+            read(i)
+            i += 1
+            continue
+        brs = _parse_range(mm, pos[i], ends[j - 1])
+        row_starts = np.cumsum([0] + [rows for _, _, rows in runs[i:j]]).tolist()
+        for k, lo, hi in zip(range(i, j), row_starts, row_starts[1:]):
+            buffers[k], pos[k] = brs[lo:hi], ends[k]
+            read(k)
+        i = j
+    while heads:
+        limit = unread[0] if unread else None
+        parts = []
+        while heads and (limit is None or heads[0] <= limit):
+            _, i = heapq.heappop(heads)
+            brs = buffers[i]
+            if limit is None:
+                n = len(brs)
+            else:
+                side: Literal["left", "right"] = "right" if i <= limit[1] else "left"
+                n = int(np.searchsorted(brs.blknum, limit[0], side=side))
+            parts.append((i, brs[:n]))
+            buffers[i] = brs[n:]
+            if len(buffers[i]):
+                heapq.heappush(heads, (int(buffers[i].blknum[0]), i))
+        # the limiting run is the only one with more to read that's now
+        # empty.
+        if limit is not None:
+            heapq.heappop(unread)
+            read(limit[1])
+        parts.sort(key=lambda part: part[0])
+        yield BlockRangeArray.concatenate(brs for _, brs in parts).sorted_by_blknum()
+
+
+def _can_mmap(filepath: str) -> bool:
+    """Whether iter_csv_file can memory map filepath: an uncompressed single
+    column export."""
+    if filepath == STDIN:
+        return False
+    with open(filepath, "rb") as f:
+        if detect_compression(f) is not None:
+            return False
+        return f.readline().rstrip(b"\r\n") != ",".join(ATTNUM_HEADER).encode()
+
+
+def iter_csv_batches(
+    filepath: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    match_type: Literal["overlap", "within"] = "overlap",
+    attnum: Optional[int] = None,
+) -> Iterator[BlockRangeArray]:
+    """Streaming version of parse_csv_file: yields batches of the matching
+    block ranges, in blknum order (stable, like sorted_by_blknum), with a
+    k-way merge of the file's sorted runs. Compressed files, stdin and
+    multi-column exports aren't memory mapped, those are parsed with
+    parse_csv_file into one batch."""
+    if not _can_mmap(filepath):
+        yield parse_csv_file(filepath, start, end, match_type, attnum)
+        return
+    with open(filepath, "rb") as f:
+        if f.readline().rstrip(b"\r\n") != b"blknum,value":
+            raise ValueError(f"{filepath} is not a BRIN export CSV")
+        # a single column export is DEFAULT_ATTNUM, raise like parse_csv_file.
+        select_attnum({DEFAULT_ATTNUM: BlockRangeArray.empty()}, attnum)
+        header_end = f.tell()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for batch in _merge_runs(mm, _sorted_runs(mm, header_end)):
+                batch = batch.filter_dates(match_type, start, end)
+                if len(batch):
+                    yield batch
+
+
+def iter_csv_file(
+    filepath: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    match_type: Literal["overlap", "within"] = "overlap",
+    attnum: Optional[int] = None,
+) -> Iterator[BlockRange]:
+    """iter_csv_batches, one block range at a time."""
+    for batch in iter_csv_batches(filepath, start, end, match_type, attnum):
+        yield from batch
 
 
 #%%
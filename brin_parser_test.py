@@ -1,5 +1,29 @@
-from datetime import datetime
-from brin_parser import parse_datetime_tuple
+import bz2
+import gzip
+import io
+import lzma
+import random
+import sys
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+import pytest
+
+import brin_parser
+from brin_lib import BlockRangeArray
+from brin_parser import (
+    detect_compression,
+    iter_csv_batches,
+    iter_csv_file,
+    parse_csv_chunks,
+    parse_csv_chunks_by_attnum,
+    parse_csv_file,
+    parse_csv_file_by_attnum,
+    parse_csv_rows,
+    parse_csv_rows_by_attnum,
+    parse_datetime_tuple,
+    parse_item_rows,
+)
 
 
 def test_parse_datetime_tuple_millis_tz() -> None:
@@ -10,6 +34,20 @@ def test_parse_datetime_tuple_millis_tz() -> None:
     assert res[1] == datetime(2019, 1, 20, 22, 59, 6)
 
 
+def test_parse_item_rows_skips_nulls() -> None:
+    attnum, brs = parse_item_rows(
+        [
+            (0, 1, "{2021-04-01 00:00:00+00 .. 2021-04-01 01:00:00+00}"),
+            (128, 1, None),  # all nulls
+            (128, 2, "{2021-04-01 01:00:00 .. 2021-04-01 02:00:00}"),
+        ]
+    )
+    assert list(attnum) == [1, 2]
+    assert list(brs.blknum) == [0, 128]
+    assert brs[1].end == datetime(2021, 4, 1, 2)
+    assert len(parse_item_rows([])[1]) == 0
+
+
 def test_parse_datetime_tuple_millis_no_tz() -> None:
     res = parse_datetime_tuple("{2016-11-02 05:41:14.537 .. 2019-01-20 22:59:06.511}")
     assert res[0] == datetime(2016, 11, 2, 5, 41, 14)
@@ -20,3 +58,268 @@ def test_parse_datetime_tuple_no_millis_no_tz() -> None:
     res = parse_datetime_tuple("{2016-11-02 05:41:14 .. 2019-01-20 22:59:06}")
     assert res[0] == datetime(2016, 11, 2, 5, 41, 14)
     assert res[1] == datetime(2019, 1, 20, 22, 59, 6)
+
+
+def test_parse_csv_rows_sorted_array() -> None:
+    rows = [
+        "blknum,value",
+        "128,{2000-01-01 06:34:40 .. 2000-01-01 13:09:19}",
+        "0,{2000-01-01 00:00:00 .. 2000-01-01 06:34:39}",
+    ]
+    brs = parse_csv_rows(rows)
+    assert isinstance(brs, BlockRangeArray)
+    assert list(brs.blknum) == [0, 128]
+    assert brs[1].start == datetime(2000, 1, 1, 6, 34, 40)
+
+
+def test_parse_csv_rows_filter() -> None:
+    rows = [
+        "blknum,value",
+        "0,{2000-01-01 00:00:00 .. 2000-01-01 06:34:39}",
+        "128,{2000-01-01 06:34:40 .. 2000-01-01 13:09:19}",
+    ]
+    after = datetime(2000, 1, 1, 6)
+    assert list(parse_csv_rows(rows, after).blknum) == [0, 128]
+    assert list(parse_csv_rows(rows, after, match_type="within").blknum) == [128]
+
+
+def _assert_same(a: BlockRangeArray, b: BlockRangeArray) -> None:
+    assert list(a.blknum) == list(b.blknum)
+    assert list(a.start) == list(b.start)
+    assert list(a.end) == list(b.end)
+
+
+def test_parse_csv_file_matches_parse_csv_rows() -> None:
+    for path in [
+        "testdata/brinexport_no_overlaps.csv",
+        "testdata/brinexport_test_overlaps.csv",
+        "examples/brinexport_large_example_full.csv",
+    ]:
+        with open(path) as f:
+            expected = parse_csv_rows(f)
+        _assert_same(parse_csv_file(path), expected)
+
+
+def test_parse_csv_chunks_fallback_rows() -> None:
+    rows = [
+        "blknum,value",
+        "0,{2016-11-02 05:41:14.537+00 .. 2019-01-20 22:59:06.511+00}",
+        # quoted value and odd spacing don't fit the fast layout.
+        '128,"{2016-11-02 05:41:14 .. 2019-01-20 22:59:06}"',
+        "256, {2016-11-02 05:41:14 .. 2019-01-20 22:59:06}",
+        "384,{2016-11-02 05:41:14 .. 2019-01-20 22:59:06}",
+    ]
+    data = "\r\n".join(rows).encode()
+    expected = parse_csv_rows(rows)
+    # tiny chunks to exercise lines split across chunk boundaries.
+    chunks = [data[i : i + 7] for i in range(0, len(data), 7)]
+    _assert_same(parse_csv_chunks(chunks), expected)
+    assert parse_csv_chunks(chunks)[0].start == datetime(2016, 11, 2, 5, 41, 14)
+
+
+def test_parse_csv_chunks_invalid() -> None:
+    data = b"blknum,value\n0,{2016-02-30 05:41:14 .. 2019-01-20 22:59:06}\n"
+    with pytest.raises(ValueError):
+        parse_csv_chunks([data])
+    with pytest.raises(RuntimeError):
+        parse_csv_chunks([b"blknum,value\n0,{garbage}\n"])
+
+
+def test_parse_csv_chunks_empty() -> None:
+    assert len(parse_csv_chunks([b"blknum,value\n"])) == 0
+    assert len(parse_csv_chunks([])) == 0
+
+
+def _write_runs(path: str, num_runs: int) -> list[str]:
+    """Export-like CSV of shuffled sorted runs, with some duplicate blknums."""
+    rng = random.Random(0)
+    rows = []
+    for blknum in range(0, 128 * 200, 128):
+        start = datetime(2021, 1, 1) + timedelta(minutes=rng.randrange(10000))
+        end = start + timedelta(minutes=rng.randrange(100))
+        rows.append(f"{blknum},{{{start} .. {end}}}")
+    rows += rng.sample(rows, 10)
+    rows.sort(key=lambda row: int(row.split(",")[0]))
+    cuts = sorted(rng.sample(range(1, len(rows)), num_runs - 1))
+    runs = [rows[i:j] for i, j in zip([0] + cuts, cuts + [len(rows)])]
+    rng.shuffle(runs)
+    lines = ["blknum,value"] + [row for run in runs for row in run]
+    with open(path, "w") as f:
+        f.write("\r\n".join(lines))
+    return lines
+
+
+@pytest.mark.parametrize("num_runs", [1, 2, 17])
+@pytest.mark.parametrize("chunk_size", [None, 200])
+def test_iter_csv_file(
+    tmp_path: str,
+    monkeypatch: pytest.MonkeyPatch,
+    num_runs: int,
+    chunk_size: Optional[int],
+) -> None:
+    if chunk_size is not None:
+        # runs are read a few lines at a time, and merged in many batches.
+        monkeypatch.setattr(brin_parser, "CHUNK_SIZE", chunk_size)
+        monkeypatch.setattr(brin_parser, "_MIN_RUN_CHUNK_SIZE", chunk_size)
+    path = f"{tmp_path}/brinexport_runs.csv"
+    lines = _write_runs(path, num_runs)
+    expected = parse_csv_rows(lines)
+    res = BlockRangeArray.from_block_ranges(iter_csv_file(path))
+    _assert_same(res, expected)
+    batches = list(iter_csv_batches(path))
+    _assert_same(BlockRangeArray.concatenate(batches), expected)
+    if chunk_size is not None:
+        assert len(batches) > num_runs
+    after = datetime(2021, 1, 4)
+    res = BlockRangeArray.from_block_ranges(iter_csv_file(path, after))
+    _assert_same(res, parse_csv_rows(lines, after))
+
+
+def test_iter_csv_file_invalid(tmp_path: str) -> None:
+    path = f"{tmp_path}/brinexport_invalid.csv"
+    row = "0,{2021-01-01 00:00:00 .. 2021-01-01 01:00:00}"
+    for bad in ["garbage", "x,{2021-01-01 00:00:00 .. 2021-01-01 01:00:00}"]:
+        with open(path, "w", newline="") as f:
+            f.write(f"blknum,value\n{row}\n{bad}\n{row}\n")
+        with pytest.raises(ValueError):
+            list(iter_csv_file(path))
+    # a blank \r\n line is skipped, like the bulk parser does.
+    with open(path, "w", newline="") as f:
+        f.write(f"blknum,value\n{row}\n\r\n{row}\n")
+    res = BlockRangeArray.from_block_ranges(iter_csv_file(path))
+    _assert_same(res, parse_csv_file(path))
+    assert len(res) == 2
+
+
+def test_iter_csv_batches_attnum() -> None:
+    path = "testdata/brinexport_test_overlaps.csv"
+    res = BlockRangeArray.concatenate(iter_csv_batches(path, attnum=1))
+    _assert_same(res, parse_csv_file(path))
+    with pytest.raises(ValueError) as expected:
+        parse_csv_file(path, attnum=2)
+    with pytest.raises(ValueError) as e:
+        next(iter_csv_batches(path, attnum=2))
+    assert str(e.value) == str(expected.value)
+
+
+def test_iter_csv_file_examples() -> None:
+    for path in [
+        "testdata/brinexport_test_overlaps.csv",
+        "examples/brinexport_large_example_201903_to_202005.csv",
+    ]:
+        res = BlockRangeArray.from_block_ranges(iter_csv_file(path))
+        _assert_same(res, parse_csv_file(path))
+
+
+def test_iter_csv_file_empty(tmp_path: str) -> None:
+    path = f"{tmp_path}/brinexport_empty.csv"
+    with open(path, "w") as f:
+        f.write("blknum,value\n")
+    assert list(iter_csv_file(path)) == []
+
+
+EXAMPLE_PATH = "testdata/brinexport_test_overlaps.csv"
+Compress = Callable[[bytes], bytes]
+
+
+@pytest.mark.parametrize(
+    "compress,ext",
+    [(gzip.compress, ".gz"), (bz2.compress, ".bz2"), (lzma.compress, ".xz")],
+)
+def test_parse_csv_file_compressed(tmp_path: str, compress: Compress, ext: str) -> None:
+    with open(EXAMPLE_PATH, "rb") as f:
+        data = f.read()
+    # named .csv: the format comes from the contents, not the name.
+    for name in [f"brinexport{ext}", "brinexport.csv"]:
+        path = f"{tmp_path}/{name}"
+        with open(path, "wb") as f:
+            f.write(compress(data))
+        _assert_same(parse_csv_file(path), parse_csv_file(EXAMPLE_PATH))
+        res = BlockRangeArray.from_block_ranges(iter_csv_file(path))
+        _assert_same(res, parse_csv_file(EXAMPLE_PATH))
+
+
+def test_parse_csv_file_zstd(tmp_path: str) -> None:
+    zstandard = pytest.importorskip("zstandard")
+    with open(EXAMPLE_PATH, "rb") as f:
+        data = zstandard.ZstdCompressor().compress(f.read())
+    path = f"{tmp_path}/brinexport.csv.zst"
+    with open(path, "wb") as f:
+        f.write(data)
+    _assert_same(parse_csv_file(path), parse_csv_file(EXAMPLE_PATH))
+
+
+@pytest.mark.parametrize("compress", [lambda data: data, gzip.compress])
+def test_parse_csv_file_stdin(
+    monkeypatch: pytest.MonkeyPatch, compress: Compress
+) -> None:
+    with open(EXAMPLE_PATH, "rb") as f:
+        data = compress(f.read())
+    stdin = io.TextIOWrapper(io.BufferedReader(io.BytesIO(data)))
+    monkeypatch.setattr(sys, "stdin", stdin)
+    _assert_same(parse_csv_file("-"), parse_csv_file(EXAMPLE_PATH))
+
+
+def test_detect_compression() -> None:
+    assert detect_compression(io.BufferedReader(io.BytesIO(b"blknum,value"))) is None
+    data = gzip.compress(b"blknum,value")
+    assert detect_compression(io.BufferedReader(io.BytesIO(data))) == "gzip"
+    assert detect_compression(io.BufferedReader(io.BytesIO(b""))) is None
+
+
+MULTI_ATTNUM_PATH = "testdata/brinexport_multi_attnum.csv"
+# the single column exports it was made from.
+MULTI_ATTNUM_COLUMNS = {
+    1: "testdata/brinexport_no_overlaps.csv",
+    3: "testdata/brinexport_test_overlaps.csv",
+}
+
+
+def test_parse_csv_file_by_attnum() -> None:
+    path = MULTI_ATTNUM_PATH
+    after = datetime(2000, 1, 3)
+    res = parse_csv_file_by_attnum(path)
+    with open(path) as f:
+        rows = parse_csv_rows_by_attnum(f)
+    assert list(res) == list(rows) == [1, 3]
+    for attnum, column_path in MULTI_ATTNUM_COLUMNS.items():
+        _assert_same(res[attnum], parse_csv_file(column_path))
+        _assert_same(rows[attnum], parse_csv_file(column_path))
+        _assert_same(
+            parse_csv_file(path, after, attnum=attnum),
+            parse_csv_file(column_path, after),
+        )
+        streamed = BlockRangeArray.from_block_ranges(iter_csv_file(path, attnum=attnum))
+        _assert_same(streamed, parse_csv_file(column_path))
+    # single column exports are read as attnum 1.
+    plain = parse_csv_file_by_attnum(MULTI_ATTNUM_COLUMNS[1])
+    assert list(plain) == [1]
+
+
+def test_parse_csv_file_attnum_errors() -> None:
+    path = MULTI_ATTNUM_PATH
+    with pytest.raises(ValueError, match="several columns"):
+        parse_csv_file(path)
+    with pytest.raises(ValueError, match="no attnum 2"):
+        parse_csv_file(path, attnum=2)
+    with pytest.raises(ValueError, match="header"):
+        parse_csv_chunks([b"blknum,attnum,value,extra\n"])
+
+
+def test_parse_csv_chunks_attnum_fallback_rows() -> None:
+    rows = [
+        "blknum,attnum,value",
+        "128,2,{2016-11-02 05:41:14 .. 2019-01-20 22:59:06}",
+        '0,2,"{2016-11-02 05:41:14 .. 2019-01-20 22:59:06}"',
+        "0, 1,{2016-11-02 05:41:14.537+00 .. 2019-01-20 22:59:06.511+00}",
+    ]
+    data = "\n".join(rows).encode()
+    chunks = [data[i : i + 5] for i in range(0, len(data), 5)]
+    res = parse_csv_chunks_by_attnum(chunks)
+    expected = parse_csv_rows_by_attnum(rows)
+    assert list(res) == list(expected) == [1, 2]
+    for attnum in res:
+        _assert_same(res[attnum], expected[attnum])
+    assert list(res[2].blknum) == [0, 128]
+    with pytest.raises(ValueError):
+        parse_csv_chunks_by_attnum([b"blknum,attnum,value\n0,{garbage}\n"])
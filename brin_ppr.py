@@ -0,0 +1,111 @@
+"""Predict how a BRIN index would look with a coarser pages_per_range.
+
+Rebuilding an index with pages_per_range * k summarizes each run of k
+adjacent block ranges as one, covering min(start)..max(end) of the run.
+That can be simulated from an export at the current granularity, without
+touching the database: coarsen() merges the runs, and what_if() reports the
+levels, depth profile and workload cost of each candidate k.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Iterable
+
+import numpy as np
+
+from brin_lib import BlockRangeArray, BlockRanges, as_block_range_array
+from brin_overlap import depth_profile
+from brin_workload import (
+    DEFAULT_BLOCK_SIZE,
+    DEFAULT_PAGES_PER_RANGE,
+    Workload,
+    simulate,
+)
+
+DEFAULT_FACTORS = (2, 4, 8, 16, 32)
+
+
+def coarsen(
+    block_ranges: BlockRanges,
+    factor: int,
+    pages_per_range: int = DEFAULT_PAGES_PER_RANGE,
+) -> BlockRangeArray:
+    """Block ranges of the same table indexed with pages_per_range * factor:
+    each run of factor block ranges (by blknum) merged into one. Sorted by
+    blknum."""
+    if factor < 1:
+        raise ValueError(f"coarsening factor must be positive, got {factor}")
+    brs = as_block_range_array(block_ranges).sorted_by_blknum()
+    if len(brs) == 0:
+        return brs
+    width = pages_per_range * factor
+    group = brs.blknum // width
+    firsts = np.flatnonzero(np.append(True, group[1:] != group[:-1]))
+    return BlockRangeArray(
+        group[firsts] * width,
+        np.minimum.reduceat(brs.start, firsts),
+        np.maximum.reduceat(brs.end, firsts),
+    )
+
+
+def coarsen_all(
+    block_ranges: BlockRanges,
+    factors: Iterable[int],
+    pages_per_range: int = DEFAULT_PAGES_PER_RANGE,
+) -> dict[int, BlockRangeArray]:
+    """coarsen() for every factor. Each factor is coarsened from the largest
+    smaller one dividing it (the merged runs nest), so 2, 4, 8, ... cost
+    n + n/2 + n/4 + ... rather than n per factor."""
+    results = {1: as_block_range_array(block_ranges).sorted_by_blknum()}
+    for factor in sorted(set(factors)):
+        base = max(f for f in results if factor % f == 0)
+        results[factor] = coarsen(results[base], factor // base, pages_per_range * base)
+    return results
+
+
+def what_if(
+    block_ranges: BlockRanges,
+    workload: Workload,
+    factors: Iterable[int] = DEFAULT_FACTORS,
+    pages_per_range: int = DEFAULT_PAGES_PER_RANGE,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+) -> list[dict[str, Any]]:
+    """One row per candidate pages_per_range (including the current one):
+    block ranges, levels (the max depth, which is what the sweep engine
+    needs), depth percentiles and the workload's estimated heap reads."""
+    rows = []
+    for factor, brs in coarsen_all(block_ranges, factors, pages_per_range).items():
+        profile = depth_profile(brs)
+        cost = simulate(brs, workload, pages_per_range * factor, block_size)
+        summary = cost.summary()
+        rows.append(
+            {
+                "factor": factor,
+                "pages_per_range": pages_per_range * factor,
+                "block_ranges": len(brs),
+                "levels": profile.max(),
+                "depth_p50": profile.percentile(50),
+                "depth_p99": profile.percentile(99),
+                "depth_mean": round(profile.mean(), 2),
+                "matching_mean": round(summary.get("matching_mean", 0.0), 2),
+                "total_mb_read": round(summary.get("total_mb_read", 0.0), 2),
+                "excess_fraction": round(summary.get("excess_fraction", 0.0), 4),
+            }
+        )
+    return rows
+
+
+def format_report(rows: list[dict[str, Any]]) -> str:
+    header = (
+        f"{'ppr':>7} {'ranges':>10} {'levels':>7} {'p50':>5} {'p99':>5} "
+        f"{'mean':>8} {'matching':>9} {'MB read':>12} {'excess':>7}"
+    )
+    lines = [header]
+    for row in rows:
+        lines.append(
+            f"{row['pages_per_range']:>7} {row['block_ranges']:>10,} "
+            f"{row['levels']:>7} {row['depth_p50']:>5} {row['depth_p99']:>5} "
+            f"{row['depth_mean']:>8.2f} {row['matching_mean']:>9.2f} "
+            f"{row['total_mb_read']:>12,.1f} {row['excess_fraction']:>7.1%}"
+        )
+    return "\n".join(lines)
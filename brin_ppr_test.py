@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from brin_lib import BlockRangeArray, to_micros
+from brin_overlap import compute_overlap
+from brin_ppr import coarsen, coarsen_all, what_if
+from brin_synth import SCENARIOS, generate
+from brin_workload import Workload
+
+
+def _assert_same(a: BlockRangeArray, b: BlockRangeArray) -> None:
+    assert list(a.blknum) == list(b.blknum)
+    assert list(a.start) == list(b.start)
+    assert list(a.end) == list(b.end)
+
+
+def test_coarsen() -> None:
+    t = to_micros(datetime(2021, 1, 1))
+    hour = to_micros(datetime(2021, 1, 1, 1)) - t
+    # blknum 256 is missing (not summarized), and the input isn't sorted.
+    brs = BlockRangeArray(
+        np.array([128, 0, 384, 512]),
+        np.array([t + 5 * hour, t, t + hour, t + 2 * hour]),
+        np.array([t + 6 * hour, t + hour, t + 9 * hour, t + 3 * hour]),
+    )
+    res = coarsen(brs, 2, pages_per_range=128)
+    assert list(res.blknum) == [0, 256, 512]
+    assert list(res.start) == [t, t + hour, t + 2 * hour]
+    assert list(res.end) == [t + 6 * hour, t + 9 * hour, t + 3 * hour]
+    _assert_same(coarsen(brs, 1), brs.sorted_by_blknum())
+    assert len(coarsen(BlockRangeArray.empty(), 4)) == 0
+    with pytest.raises(ValueError):
+        coarsen(brs, 0)
+
+
+@pytest.mark.parametrize("scenario", SCENARIOS)
+def test_coarsen_all_matches_coarsen(scenario: str) -> None:
+    brs = generate(1000, scenario)  # type: ignore
+    results = coarsen_all(brs, [2, 3, 4, 6, 8, 12])
+    assert list(results) == [1, 2, 3, 4, 6, 8, 12]
+    for factor, res in results.items():
+        _assert_same(res, coarsen(brs, factor))
+
+
+def test_what_if() -> None:
+    brs = generate(2000, "backfill")
+    workload = Workload.every_over(timedelta(days=1), brs)
+    rows = what_if(brs, workload, [2, 4])
+    assert [row["pages_per_range"] for row in rows] == [128, 256, 512]
+    assert [row["block_ranges"] for row in rows] == [2000, 1000, 500]
+    for row in rows:
+        # levels is the sweep engine's level count.
+        coarse = coarsen(brs, row["factor"])
+        assert row["levels"] == len(compute_overlap(coarse, "sweep").levels)
+    # coarser ranges can only cover more of each window.
+    mb_read = [row["total_mb_read"] for row in rows]
+    assert mb_read == sorted(mb_read)
+
+
+def test_what_if_zero_width_and_touching() -> None:
+    # bulk now() inserts give zero width block ranges, and consecutive ones
+    # touch. Levels must still be the sweep engine's, not an overcount.
+    rng = np.random.default_rng(0)
+    n = 400
+    start = to_micros(datetime(2021, 1, 1)) + rng.integers(0, 50, n) * 3600 * 10**6
+    end = start + rng.choice([0, 0, 3600, 7200], n) * 10**6
+    brs = BlockRangeArray(np.arange(n, dtype=np.int64) * 128, start, end)
+    workload = Workload.every_over(timedelta(days=1), brs)
+    for row in what_if(brs, workload, [2, 4]):
+        coarse = coarsen(brs, row["factor"])
+        assert row["levels"] == len(compute_overlap(coarse, "sweep").levels)
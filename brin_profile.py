@@ -0,0 +1,158 @@
+"""Stage-level instrumentation for the bro_*.py tools.
+
+Each pipeline stage (parse, filter, overlap, serialize, render, ...) runs in
+a Profiler.stage block, which records its wall and CPU time, the peak RSS of
+the process so far and, if the stage reports how many items it handled,
+items per second. Pass -profile out.json to any bro_*.py tool to save the
+stages as JSON, and -cprofile STAGE or -tracemalloc STAGE to also dump a
+cProfile (out.json.<stage>.prof, for pstats or snakeviz) or the top memory
+allocations (out.json.<stage>.tracemalloc.txt) of one stage. Without
+-profile, those go to profile.<stage>.prof and
+profile.<stage>.tracemalloc.txt in the current directory.
+"""
+
+from __future__ import annotations
+
+import argparse
+import cProfile
+import json
+import logging
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Any, Iterator, Optional
+
+TRACEMALLOC_TOP = 25
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS.
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+@dataclass
+class StageStats:
+    name: str
+    wall_secs: float = 0.0
+    cpu_secs: float = 0.0
+    peak_rss_mb: float = 0.0
+    # set by the stage, eg the number of block ranges parsed.
+    items: Optional[int] = None
+    items_per_sec: Optional[float] = None
+    traced_peak_mb: Optional[float] = None  # with -tracemalloc
+
+
+class Profiler:
+    """Records stats of each stage. Stages are always timed (it's cheap), and
+    written out by save() if an output path was given."""
+
+    def __init__(
+        self,
+        output: Optional[str] = None,
+        cprofile_stage: Optional[str] = None,
+        tracemalloc_stage: Optional[str] = None,
+    ) -> None:
+        self.output = output
+        self.cprofile_stage = cprofile_stage
+        self.tracemalloc_stage = tracemalloc_stage
+        self.stages: list[StageStats] = []
+
+    def _dump_path(self, stage: str, suffix: str) -> str:
+        return f"{self.output or 'profile'}.{stage}.{suffix}"
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageStats]:
+        stats = StageStats(name)
+        profile = cProfile.Profile() if name == self.cprofile_stage else None
+        tracing = name == self.tracemalloc_stage
+        if tracing:
+            tracemalloc.start()
+        if profile is not None:
+            profile.enable()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield stats
+        finally:
+            stats.wall_secs = round(time.perf_counter() - wall, 4)
+            stats.cpu_secs = round(time.process_time() - cpu, 4)
+            if profile is not None:
+                profile.disable()
+                profile.dump_stats(self._dump_path(name, "prof"))
+            if tracing:
+                self._dump_tracemalloc(stats)
+            stats.peak_rss_mb = peak_rss_mb()
+            if stats.items is not None and stats.wall_secs > 0:
+                stats.items_per_sec = round(stats.items / stats.wall_secs, 1)
+            self.stages.append(stats)
+            logging.debug(f"stage {name}: {stats}")
+
+    def _dump_tracemalloc(self, stats: StageStats) -> None:
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        stats.traced_peak_mb = round(peak / 1e6, 2)
+        with open(self._dump_path(stats.name, "tracemalloc.txt"), "w") as f:
+            f.write(f"peak traced memory: {stats.traced_peak_mb}MB\n")
+            f.write(f"top {TRACEMALLOC_TOP} allocations still held at the end:\n")
+            for stat in snapshot.statistics("lineno")[:TRACEMALLOC_TOP]:
+                f.write(f"{stat}\n")
+
+    def report(self) -> dict[str, Any]:
+        return {
+            "argv": sys.argv,
+            "wall_secs": round(sum(s.wall_secs for s in self.stages), 4),
+            "cpu_secs": round(sum(s.cpu_secs for s in self.stages), 4),
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": [asdict(s) for s in self.stages],
+        }
+
+    def save(self) -> None:
+        """Write the report, if there's an output path. Call it at the end,
+        it also warns about dumps that were asked for but never made."""
+        ran = [s.name for s in self.stages]
+        for kind, stage in [
+            ("cProfile", self.cprofile_stage),
+            ("tracemalloc", self.tracemalloc_stage),
+        ]:
+            if stage is not None and stage not in ran:
+                logging.warning(
+                    f"no {kind} dump: stage {stage!r} never ran "
+                    f"(stages: {', '.join(ran) or 'none'})"
+                )
+        if self.output is None:
+            return
+        with open(self.output, "w") as f:
+            json.dump(self.report(), f, indent=1)
+            f.write("\n")
+        logging.info(f"profile in {self.output}")
+
+
+def add_profile_args(p: argparse.ArgumentParser) -> None:
+    p.add_argument(
+        "-profile",
+        metavar="OUT.json",
+        help="save wall/CPU time, peak RSS and throughput of each stage",
+    )
+    p.add_argument(
+        "-cprofile",
+        metavar="STAGE",
+        help="dump a cProfile of this stage to OUT.json.<stage>.prof "
+        "(profile.<stage>.prof without -profile)",
+    )
+    p.add_argument(
+        "-tracemalloc",
+        metavar="STAGE",
+        help="dump the top allocations of this stage to "
+        "OUT.json.<stage>.tracemalloc.txt (profile.<stage>.tracemalloc.txt "
+        "without -profile, slows the stage down)",
+    )
+
+
+def profiler_from_args(args: Any) -> Profiler:
+    """Profiler for the arguments added by add_profile_args."""
+    return Profiler(args.profile, args.cprofile, args.tracemalloc)
@@ -0,0 +1,56 @@
+import json
+import logging
+import os
+import pstats
+
+import pytest
+
+from brin_profile import Profiler
+
+
+def test_profiler(tmp_path: str) -> None:
+    out = os.path.join(tmp_path, "profile.json")
+    profiler = Profiler(out, cprofile_stage="work", tracemalloc_stage="alloc")
+    with profiler.stage("work") as stage:
+        total = sum(i * i for i in range(100_000))
+        stage.items = 100_000
+    with profiler.stage("alloc"):
+        held = [bytearray(1000) for _ in range(1000)]
+    assert total and held
+    profiler.save()
+
+    with open(out) as f:
+        report = json.load(f)
+    work, alloc = report["stages"]
+    assert work["name"] == "work"
+    assert work["wall_secs"] > 0 and work["cpu_secs"] > 0
+    assert work["items_per_sec"] == round(100_000 / work["wall_secs"], 1)
+    assert work["peak_rss_mb"] > 0
+    assert alloc["items"] is None and alloc["traced_peak_mb"] >= 1.0
+    assert report["wall_secs"] >= work["wall_secs"]
+    stats = pstats.Stats(f"{out}.work.prof")
+    assert stats.total_calls > 0  # type: ignore
+    with open(f"{out}.alloc.tracemalloc.txt") as f:
+        assert "brin_profile_test.py" in f.read()
+
+
+def test_profiler_no_output() -> None:
+    profiler = Profiler()
+    with profiler.stage("work"):
+        pass
+    profiler.save()  # no-op
+    assert [s.name for s in profiler.stages] == ["work"]
+
+
+def test_profiler_dump_without_output(
+    tmp_path: str, monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    profiler = Profiler(cprofile_stage="work", tracemalloc_stage="pasre")
+    with profiler.stage("work"):
+        pass
+    with caplog.at_level(logging.WARNING):
+        profiler.save()
+    assert os.listdir(tmp_path) == ["profile.work.prof"]
+    assert "stage 'pasre' never ran (stages: work)" in caplog.text
+    assert "cProfile" not in caplog.text
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+
+"""Decode a BRIN minmax index straight from its relation files.
+
+Reads a copy of the index's relation file (and its .1, .2, ... segments) with
+mmap, without any database access. Produces the same blknum/value data as
+export_brin_items.sh. Only minmax opclasses over timestamp/timestamptz
+columns are supported.
+
+On-disk layout (see src/include/access/brin_page.h, brin_tuple.h):
+- block 0 is the meta page, with pagesPerRange and lastRevmapPage.
+- blocks 1..lastRevmapPage are the revmap: an array of item pointers, one per
+  block range, to the range's summary tuple.
+- the rest are regular pages holding BrinTuples: a 4 byte heap block number,
+  a 1 byte info (data offset and flags), an optional nulls bitmap, then the
+  min and max datums of each indexed column.
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import mmap
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from types import TracebackType
+from typing import Optional, Type
+
+import numpy as np
+import numpy.typing as npt
+
+from brin_lib import BlockRangeArray, BoolArray, Int64Array, to_micros
+from brin_parser import write_csv_file
+
+U8Array = npt.NDArray[np.uint8]
+
+RELSEG_SIZE = 131072  # blocks per segment file, Postgres default
+PAGE_HEADER_SIZE = 24  # MAXALIGN(SizeOfPageHeaderData)
+SPECIAL_SIZE = 8  # MAXALIGN(sizeof(BrinSpecialSpace))
+ITEM_ID_SIZE = 4
+ITEM_POINTER_SIZE = 6
+LP_NORMAL = 1
+
+BRIN_META_MAGIC = 0xA8109CFA
+BRIN_PAGETYPE_META = 0xF091
+BRIN_PAGETYPE_REVMAP = 0xF092
+BRIN_PAGETYPE_REGULAR = 0xF093
+
+SIZE_OF_BRIN_TUPLE = 5
+BRIN_OFFSET_MASK = 0x1F
+BRIN_EMPTY_RANGE_MASK = 0x20
+BRIN_PLACEHOLDER_MASK = 0x40
+BRIN_NULLS_MASK = 0x80
+
+INVALID_BLOCK_NUMBER = 0xFFFFFFFF
+TIMESTAMP_SIZE = 8
+# Postgres timestamps count microseconds since 2000-01-01.
+POSTGRES_EPOCH_MICROS = to_micros(datetime(2000, 1, 1))
+
+
+@dataclass
+class BrinMeta:
+    pages_per_range: int
+    last_revmap_page: int
+
+
+class RelationFile:
+    """Memory mapped relation file and its segments. Pass the path of the
+    first segment, eg a copy of $PGDATA/base/<db oid>/<relfilenode>."""
+
+    def __init__(self, path: str, block_size: Optional[int] = None) -> None:
+        paths = [path]
+        while os.path.exists(f"{path}.{len(paths)}"):
+            paths.append(f"{path}.{len(paths)}")
+        self._files = [open(p, "rb") for p in paths]
+        self._maps = [
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) for f in self._files
+        ]
+        self._segments: list[U8Array] = [np.frombuffer(m, np.uint8) for m in self._maps]
+        if block_size is None:
+            # pd_pagesize_version: high byte is the page size.
+            block_size = int(self._segments[0][18:20].view("<u2")[0]) & 0xFF00
+        self.block_size = block_size
+        if len(self._segments) > 1:
+            self.segment_blocks = len(self._segments[0]) // block_size
+        else:
+            self.segment_blocks = RELSEG_SIZE
+        total_bytes = sum(len(seg) for seg in self._segments)
+        self.num_blocks = total_bytes // block_size
+
+    def close(self) -> None:
+        del self._segments
+        for m in self._maps:
+            m.close()
+        for f in self._files:
+            f.close()
+
+    def __enter__(self) -> RelationFile:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        tb: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+    def read(self, addrs: Int64Array, width: int) -> U8Array:
+        """Bytes addrs[i]:addrs[i]+width of the relation, shape (n, width).
+        Addresses are relative to the start of the first segment."""
+        segment_bytes = self.segment_blocks * self.block_size
+        segs, offsets = np.divmod(addrs, segment_bytes)
+        res = np.zeros((len(addrs), width), np.uint8)
+        for seg in np.unique(segs).tolist():
+            if not 0 <= seg < len(self._segments):
+                raise ValueError(f"address past the end of the relation: {addrs}")
+            in_seg = segs == seg
+            idx = offsets[in_seg, None] + np.arange(width)
+            if idx.size and idx.max() >= len(self._segments[seg]):
+                raise ValueError("read past the end of a relation segment")
+            res[in_seg] = self._segments[seg][idx]
+        return res
+
+    def _u16(self, addrs: Int64Array) -> Int64Array:
+        return self.read(addrs, 2).view("<u2")[:, 0].astype(np.int64)
+
+    def _u32(self, addrs: Int64Array) -> Int64Array:
+        return self.read(addrs, 4).view("<u4")[:, 0].astype(np.int64)
+
+    def _i64(self, addrs: Int64Array) -> Int64Array:
+        return self.read(addrs, 8).view("<i8")[:, 0].astype(np.int64)
+
+    def page_types(self, blknos: Int64Array) -> Int64Array:
+        # the page type is the last uint16 of the special space.
+        return self._u16(blknos * self.block_size + self.block_size - 2)
+
+
+def _check_page_types(rel: RelationFile, blknos: Int64Array, expected: int) -> None:
+    page_types = rel.page_types(blknos)
+    if (bad := page_types != expected).any():
+        i = int(np.flatnonzero(bad)[0])
+        raise ValueError(
+            f"block {blknos[i]} has BRIN page type {page_types[i]:#x}, "
+            f"expected {expected:#x}. Is this a BRIN index relation file?"
+        )
+
+
+def read_meta(rel: RelationFile) -> BrinMeta:
+    _check_page_types(rel, np.array([0]), BRIN_PAGETYPE_META)
+    magic, _version, pages_per_range, last_revmap_page = rel._u32(
+        PAGE_HEADER_SIZE + np.arange(4) * 4
+    ).tolist()
+    if magic != BRIN_META_MAGIC:
+        raise ValueError(f"bad BRIN meta page magic {magic:#x}")
+    return BrinMeta(pages_per_range, last_revmap_page)
+
+
+def read_revmap(rel: RelationFile, meta: BrinMeta) -> tuple[Int64Array, Int64Array]:
+    """Returns (range index, tuple item pointer) of each summarized range.
+    Item pointers are encoded as block * 2**16 + offset number."""
+    revmap_pages = np.arange(1, meta.last_revmap_page + 1)
+    _check_page_types(rel, revmap_pages, BRIN_PAGETYPE_REVMAP)
+    per_page = (rel.block_size - PAGE_HEADER_SIZE - SPECIAL_SIZE) // ITEM_POINTER_SIZE
+    addrs = (
+        revmap_pages[:, None] * rel.block_size
+        + PAGE_HEADER_SIZE
+        + np.arange(per_page) * ITEM_POINTER_SIZE
+    ).ravel()
+    # ItemPointerData: block hi, block lo, offset number (uint16s).
+    tids = rel.read(addrs, ITEM_POINTER_SIZE).view("<u2").astype(np.int64)
+    block = tids[:, 0] << 16 | tids[:, 1]
+    offset = tids[:, 2]
+    valid = (block != INVALID_BLOCK_NUMBER) & (block != 0) & (offset != 0)
+    range_idx = np.flatnonzero(valid)
+    return range_idx, block[valid] << 16 | offset[valid]
+
+
+def _bits(rel: RelationFile, addrs: Int64Array, bit: Int64Array) -> BoolArray:
+    byte = rel.read(addrs + bit // 8, 1)[:, 0].astype(np.int64)
+    is_set: BoolArray = (byte >> (bit % 8)) & 1 == 1
+    return is_set
+
+
+def read_tuples(
+    rel: RelationFile,
+    tids: Int64Array,
+    attnum: int = 1,
+    natts: Optional[int] = None,
+) -> tuple[Int64Array, Int64Array, Int64Array, BoolArray]:
+    """Decode the BrinTuples at the given item pointers. Returns heap blknum,
+    min and max (epoch microseconds) of column attnum, and a mask of tuples
+    that have values (not placeholders, empty or all-null ranges)."""
+    block, offset = tids >> 16, tids & 0xFFFF
+    _check_page_types(rel, np.unique(block), BRIN_PAGETYPE_REGULAR)
+    page_addr = block * rel.block_size
+    item_ids = rel._u32(page_addr + PAGE_HEADER_SIZE + (offset - 1) * ITEM_ID_SIZE)
+    lp_off, lp_flags, lp_len = (
+        item_ids & 0x7FFF,
+        (item_ids >> 15) & 0x3,
+        (item_ids >> 17) & 0x7FFF,
+    )
+    if (lp_flags != LP_NORMAL).any():
+        raise ValueError("revmap points to an unused line pointer")
+    tuple_addr = page_addr + lp_off
+    blknum = rel._u32(tuple_addr)
+    info = rel.read(tuple_addr + 4, 1)[:, 0].astype(np.int64)
+    data_offset = info & BRIN_OFFSET_MASK
+    has_nulls = info & BRIN_NULLS_MASK != 0
+    if natts is None:
+        # without nulls, the data is just min and max of each column.
+        no_nulls = np.flatnonzero(~has_nulls)
+        if len(no_nulls) == 0:
+            raise ValueError("can't infer number of indexed columns, pass natts")
+        i = no_nulls[0]
+        natts = int(lp_len[i] - data_offset[i]) // (2 * TIMESTAMP_SIZE)
+    if not 1 <= attnum <= natts:
+        raise ValueError(f"attnum {attnum} out of range for {natts} columns")
+
+    # nulls bitmap: natts "allnulls" bits then natts "hasnulls" bits.
+    bitmap_addr = tuple_addr + SIZE_OF_BRIN_TUPLE
+    stored_before = np.zeros(len(tids), np.int64)
+    for att in range(attnum - 1):
+        all_nulls = has_nulls & _bits(rel, bitmap_addr, np.full(len(tids), att))
+        stored_before += ~all_nulls
+    all_nulls = has_nulls & _bits(rel, bitmap_addr, np.full(len(tids), attnum - 1))
+    value_addr = tuple_addr + data_offset + stored_before * 2 * TIMESTAMP_SIZE
+    valid = ~all_nulls & (info & (BRIN_PLACEHOLDER_MASK | BRIN_EMPTY_RANGE_MASK) == 0)
+    value_addr = np.where(valid, value_addr, tuple_addr)
+    start = rel._i64(value_addr) + POSTGRES_EPOCH_MICROS
+    end = rel._i64(value_addr + TIMESTAMP_SIZE) + POSTGRES_EPOCH_MICROS
+    return blknum, start, end, valid
+
+
+def read_relation_file(
+    path: str, attnum: int = 1, natts: Optional[int] = None
+) -> BlockRangeArray:
+    """Read summarized block ranges of a BRIN minmax timestamp index from its
+    relation file(s), sorted by blknum. natts (number of indexed columns) is
+    inferred if not given."""
+    with RelationFile(path) as rel:
+        meta = read_meta(rel)
+        range_idx, tids = read_revmap(rel, meta)
+        if len(tids) == 0:
+            return BlockRangeArray.empty()
+        blknum, start, end, valid = read_tuples(rel, tids, attnum, natts)
+    expected_blknum = range_idx * meta.pages_per_range
+    if (bad := blknum != expected_blknum).any():
+        i = int(np.flatnonzero(bad)[0])
+        raise ValueError(
+            f"revmap entry for blknum {expected_blknum[i]} points to a tuple "
+            f"for blknum {blknum[i]}"
+        )
+    return BlockRangeArray(blknum[valid], start[valid], end[valid])
+
+
+# %%
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    p = argparse.ArgumentParser()
+    p.add_argument(
+        "-i",
+        dest="input",
+        required=True,
+        help="copy of the BRIN index relation file (first segment)",
+    )
+    p.add_argument("-o", dest="output", required=True, help="output CSV")
+    p.add_argument("-attnum", type=int, default=1, help="indexed column number")
+    p.add_argument(
+        "-natts", type=int, help="number of indexed columns (default: inferred)"
+    )
+    args = p.parse_args()
+    brs = read_relation_file(args.input, args.attnum, args.natts)
+    logging.info(f"decoded {len(brs)} block ranges, writing {args.output}...")
+    write_csv_file(brs, args.output)
+    logging.info("done✨")
@@ -0,0 +1,129 @@
+import os
+import struct
+from datetime import datetime
+from typing import Optional
+
+import pytest
+
+from brin_lib import to_micros
+from brin_parser import parse_csv_file, write_csv_file
+from brin_relfile import (
+    BRIN_META_MAGIC,
+    BRIN_NULLS_MASK,
+    BRIN_PAGETYPE_META,
+    BRIN_PAGETYPE_REGULAR,
+    BRIN_PAGETYPE_REVMAP,
+    BRIN_PLACEHOLDER_MASK,
+    read_relation_file,
+)
+
+BLCKSZ = 8192
+PG_EPOCH = datetime(2000, 1, 1)
+
+
+def _page(page_type: int, contents: bytes = b"", items: list[bytes] = []) -> bytes:
+    """Synthesize a page image: header, line pointers, items, special space."""
+    page = bytearray(BLCKSZ)
+    page[24 : 24 + len(contents)] = contents
+    upper = BLCKSZ - 8
+    for i, item in enumerate(items):
+        upper = (upper - len(item)) & ~7
+        page[upper : upper + len(item)] = item
+        # lp_off, lp_flags=LP_NORMAL, lp_len
+        struct.pack_into("<I", page, 24 + 4 * i, upper | 1 << 15 | len(item) << 17)
+    lower = 24 + 4 * len(items) if items else 24 + len(contents)
+    struct.pack_into("<HHHH", page, 12, lower, upper, BLCKSZ - 8, BLCKSZ | 4)
+    struct.pack_into("<H", page, BLCKSZ - 2, page_type)
+    return bytes(page)
+
+
+def _pg_ts(dt: datetime) -> int:
+    return to_micros(dt) - to_micros(PG_EPOCH)
+
+
+def _tuple(
+    blknum: int,
+    values: list[Optional[tuple[datetime, datetime]]],
+    placeholder: bool = False,
+) -> bytes:
+    """BrinTuple for a minmax index, values[i] is None for all-null columns."""
+    info = BRIN_PLACEHOLDER_MASK if placeholder else 0
+    bitmap = b""
+    if any(v is None for v in values):
+        info |= BRIN_NULLS_MASK
+        all_nulls = sum(1 << i for i, v in enumerate(values) if v is None)
+        bitmap = all_nulls.to_bytes((2 * len(values) + 7) // 8, "little")
+    hoff = (5 + len(bitmap) + 7) & ~7
+    data = b"".join(struct.pack("<qq", _pg_ts(v[0]), _pg_ts(v[1])) for v in values if v)
+    header = struct.pack("<IB", blknum, info | hoff) + bitmap
+    return header + b"\0" * (hoff - len(header)) + data
+
+
+def _tid(block: int, offset: int) -> bytes:
+    return struct.pack("<HHH", block >> 16, block & 0xFFFF, offset)
+
+
+T = [datetime(2021, 4, 1, h, 30, 15, 500000) for h in range(10)]
+
+
+def _write_relation(dirname: str) -> str:
+    """2 indexed columns, 128 pages per range. Split over 2 segments files of 2
+    blocks each: meta, revmap | regular, regular."""
+    meta = _page(BRIN_PAGETYPE_META, struct.pack("<IIII", BRIN_META_MAGIC, 1, 128, 1))
+    revmap = _page(
+        BRIN_PAGETYPE_REVMAP,
+        _tid(2, 1)  # range 0
+        + _tid(0xFFFFFFFF, 0)  # range 1: not summarized
+        + _tid(2, 2)  # range 2
+        + _tid(2, 3)  # range 3
+        + _tid(3, 1),  # range 4
+    )
+    regular1 = _page(
+        BRIN_PAGETYPE_REGULAR,
+        items=[
+            _tuple(0, [(T[0], T[1]), (T[5], T[6])]),
+            _tuple(256, [None, (T[2], T[3])]),
+            _tuple(384, [(T[0], T[9]), (T[0], T[9])], placeholder=True),
+        ],
+    )
+    regular2 = _page(BRIN_PAGETYPE_REGULAR, items=[_tuple(512, [(T[3], T[4])] * 2)])
+    path = os.path.join(dirname, "16384")
+    with open(path, "wb") as f:
+        f.write(meta + revmap)
+    with open(path + ".1", "wb") as f:
+        f.write(regular1 + regular2)
+    return path
+
+
+def test_read_relation_file(tmp_path: str) -> None:
+    path = _write_relation(tmp_path)
+    brs = read_relation_file(path)
+    assert list(brs.blknum) == [0, 512]
+    assert (brs[0].start, brs[0].end) == (T[0], T[1])
+    assert (brs[1].start, brs[1].end) == (T[3], T[4])
+    brs = read_relation_file(path, attnum=2)
+    assert list(brs.blknum) == [0, 256, 512]
+    assert (brs[1].start, brs[1].end) == (T[2], T[3])
+    with pytest.raises(ValueError):
+        read_relation_file(path, attnum=3)
+
+
+def test_read_relation_file_to_csv(tmp_path: str) -> None:
+    brs = read_relation_file(_write_relation(tmp_path))
+    csv_path = os.path.join(tmp_path, "brinexport_test.csv")
+    write_csv_file(brs, csv_path)
+    with open(csv_path) as f:
+        assert f.readline() == "blknum,value\n"
+        assert f.readline() == "0,{2021-04-01 00:30:15.5 .. 2021-04-01 01:30:15.5}\n"
+    # the CSV parser drops fractional seconds.
+    parsed = parse_csv_file(csv_path)
+    assert list(parsed.blknum) == [0, 512]
+    assert parsed[0].start == T[0].replace(microsecond=0)
+
+
+def test_read_relation_file_not_brin(tmp_path: str) -> None:
+    path = os.path.join(tmp_path, "16385")
+    with open(path, "wb") as f:
+        f.write(_page(0))
+    with pytest.raises(ValueError):
+        read_relation_file(path)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+"""Generate realistic synthetic BRIN exports, for testing and benchmarks.
+
+Block ranges are numbered like a real index (blknum = i * pages_per_range)
+and each holds range_span worth of rows, in one of these scenarios:
+
+- append: a perfectly append-only table, block ranges follow each other in
+  time without overlap.
+- jitter: append-only, but concurrent inserts and late commits stretch each
+  block range a little into its neighbors' time.
+- backfill: a bulk delete freed a run of old block ranges, which VACUUM made
+  available again and later inserts filled. Those block ranges keep their
+  old min but get a recent max (or are entirely recent, if fully deleted).
+- stack: like the README's 2020-01..03 example, a run of block ranges each
+  spanning most of a wide time window (eg a slow backfill loaded in
+  parallel), so queries in that window match all of them.
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+from datetime import datetime, timedelta
+from typing import Literal
+
+import numpy as np
+
+from brin_lib import BlockRangeArray, to_micros
+from brin_parser import write_csv_file
+
+Scenario = Literal["append", "jitter", "backfill", "stack"]
+SCENARIOS: tuple[Scenario, ...] = ("append", "jitter", "backfill", "stack")
+
+DEFAULT_FIRST = datetime(2020, 1, 1)
+DEFAULT_RANGE_SPAN = timedelta(hours=1)
+# fraction of block ranges affected in the backfill and stack scenarios.
+AFFECTED_FRACTION = 0.1
+
+
+def generate(
+    num_ranges: int,
+    scenario: Scenario = "jitter",
+    seed: int = 0,
+    pages_per_range: int = 128,
+    first: datetime = DEFAULT_FIRST,
+    range_span: timedelta = DEFAULT_RANGE_SPAN,
+) -> BlockRangeArray:
+    """A synthetic export of num_ranges block ranges, sorted by blknum."""
+    if scenario not in SCENARIOS:
+        raise ValueError(f"unknown scenario {scenario!r}, expected {SCENARIOS}")
+    rng = np.random.default_rng(seed)
+    span = range_span // timedelta(microseconds=1)
+    blknum = np.arange(num_ranges, dtype=np.int64) * pages_per_range
+    start = to_micros(first) + np.arange(num_ranges, dtype=np.int64) * span
+    end = start + span - 1
+    if scenario == "append" or num_ranges == 0:
+        return BlockRangeArray(blknum, start, end)
+
+    # every other scenario has some concurrent insert jitter.
+    start -= (rng.exponential(0.25, num_ranges) * span).astype(np.int64)
+    end += (rng.exponential(0.25, num_ranges) * span).astype(np.int64)
+    affected = max(int(num_ranges * AFFECTED_FRACTION), 1)
+    lo = int(rng.integers(0, num_ranges - affected + 1))
+    hi = lo + affected
+    last = int(end.max())
+    if scenario == "backfill":
+        # refilled in blknum order during the most recent tenth of the table's
+        # history. Half the freed block ranges still hold some old rows.
+        refill_start = last - (last - int(start.min())) // 10
+        new_start = np.linspace(refill_start, last, affected).astype(np.int64)
+        new_end = new_start + span - 1
+        fully_deleted = rng.random(affected) < 0.5
+        start[lo:hi] = np.where(fully_deleted, new_start, start[lo:hi])
+        end[lo:hi] = new_end
+    elif scenario == "stack":
+        # a window as long as the affected block ranges would normally
+        # cover, each block range spanning 60-100% of it.
+        window_start = int(start[lo])
+        window = affected * span
+        width = (rng.uniform(0.6, 1.0, affected) * window).astype(np.int64)
+        offset = (rng.random(affected) * (window - width)).astype(np.int64)
+        start[lo:hi] = window_start + offset
+        end[lo:hi] = start[lo:hi] + width
+    return BlockRangeArray(blknum, start, end)
+
+
+#%%
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    p = argparse.ArgumentParser()
+    p.add_argument("-n", dest="num_ranges", type=int, required=True)
+    p.add_argument("-scenario", choices=SCENARIOS, default="jitter")
+    p.add_argument("-seed", type=int, default=0)
+    p.add_argument("-ppr", dest="pages_per_range", type=int, default=128)
+    p.add_argument("-o", dest="output", required=True, help="output CSV")
+    args = p.parse_args()
+    brs = generate(args.num_ranges, args.scenario, args.seed, args.pages_per_range)
+    logging.info(f"writing {len(brs)} block ranges to {args.output}...")
+    write_csv_file(brs, args.output)
+    logging.info("done✨")
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from brin_overlap import depth_profile
+from brin_synth import AFFECTED_FRACTION, SCENARIOS, generate
+
+
+@pytest.mark.parametrize("scenario", SCENARIOS)
+def test_generate(scenario: str) -> None:
+    brs = generate(1000, scenario, seed=1)  # type: ignore
+    assert len(brs) == 1000
+    assert list(brs.blknum[:3]) == [0, 128, 256]
+    assert (brs.start <= brs.end).all()
+    again = generate(1000, scenario, seed=1)  # type: ignore
+    assert np.array_equal(brs.end, again.end)
+
+
+def test_generate_scenario_depth() -> None:
+    depth = {s: depth_profile(generate(1000, s)).max() for s in SCENARIOS}
+    assert depth["append"] == 1
+    assert 1 < depth["jitter"] < 10
+    # the affected block ranges all overlap each other.
+    affected = int(1000 * AFFECTED_FRACTION)
+    assert depth["backfill"] >= affected // 3
+    assert depth["stack"] >= affected // 2
+    assert len(generate(0, "stack")) == 0
+    with pytest.raises(ValueError):
+        generate(10, "nope")  # type: ignore
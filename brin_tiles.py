@@ -0,0 +1,356 @@
+"""Tile pyramid of a BrinOverlap, for panning and zooming in a browser.
+
+The world is time on the x axis and levels on the y axis (level 0 at the
+bottom, like brin_viz). The grid is fixed when a pyramid is first built, so
+appending block ranges only adds tiles: a zoom 0 tile covers span_us
+microseconds (tiles are aligned to the epoch) and level_rows levels (rows
+are counted up from level 0), and zoom z halves both z times. Tiles are
+tile_size pixels square, stored as <dir>/<z>/<x>/<y>.png, and rendered like
+brin_viz.raster, so a tile costs about its pixel count plus the block
+ranges in it. Tiles are rendered in parallel processes.
+
+A manifest records a digest of the block ranges of each level in each
+column of max zoom tiles (a "cell"). Rebuilding into the same directory
+only re-renders tiles covering cells whose digest changed (or everything,
+if the rendering options changed or blknums outgrew the color scale).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+from typing import Iterable, Optional, cast
+
+import numpy as np
+from dataclasses_json import dataclass_json
+from matplotlib import image as mpimg
+
+from brin_lib import BlockRangeArray, as_block_range_array, from_micros, to_micros
+from brin_overlap import (
+    BrinOverlap,
+    level_window,
+    read_overlap_binary,
+    write_overlap_binary,
+)
+from brin_viz import (
+    DEFAULT_COLORMAP,
+    Aggregate,
+    U8Array,
+    bin_pixels,
+    colorize,
+    colormap_rgb,
+)
+
+TILE_SIZE = 256
+DEFAULT_MAX_ZOOM = 5
+MANIFEST = "manifest.json"
+OVERLAP = "overlap.bro"  # copy of the overlap, memory mapped by workers
+VIEWER = "index.html"
+VIEWER_SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "brin_tiles.html")
+
+Tile = tuple[int, int, int]  # zoom, x, y
+
+
+def _pow2_at_least(n: int) -> int:
+    return 1 << max(n - 1, 0).bit_length()
+
+
+@dataclass_json
+@dataclass(frozen=True)
+class TileGrid:
+    """Tile coordinates, kept across rebuilds (see the module docstring)."""
+
+    tile_size: int
+    span_us: int  # time covered by a zoom 0 tile, a power of 2
+    level_rows: int  # levels in a zoom 0 tile, a power of 2
+    blknum_scale: int  # colors scale blknums 0..blknum_scale
+
+    @staticmethod
+    def fit(bro: BrinOverlap, max_zoom: int, tile_size: int) -> TileGrid:
+        """A grid where bro spans about one zoom 0 tile."""
+        span = to_micros(bro.max_val) - to_micros(bro.min_val) + 1
+        return TileGrid(
+            tile_size=tile_size,
+            # max zoom tiles span a whole number of microseconds.
+            span_us=_pow2_at_least(max(span, 1 << max_zoom)),
+            level_rows=_pow2_at_least(len(bro.levels)),
+            # unlike svg(), colors don't span min..max_blknum: that changes
+            # with every append and would recolor every tile. Rounding up to
+            # a power of 2 leaves room for appends (a fresh pyramid uses at
+            # least half the colormap), and as the scale doubles when it's
+            # outgrown, the whole pyramid is re-rendered only log2 times as
+            # the table grows.
+            blknum_scale=_pow2_at_least(bro.max_blknum + 1),
+        )
+
+    def times(self, zoom: int, x: int) -> tuple[int, int]:
+        """Epoch microseconds [t0, t1] drawn in tile column x."""
+        span = self.span_us >> zoom
+        return x * span, (x + 1) * span
+
+    def levels(self, zoom: int, y: int) -> tuple[int, int]:
+        """Levels [lo, hi) drawn in tile row y. Row 0 holds level 0."""
+        n = 1 << zoom
+        lo = y * self.level_rows // n
+        hi = -(-(y + 1) * self.level_rows // n)  # ceil
+        return lo, max(hi, lo + 1)
+
+    def columns(self, zoom: int, start_us: int, end_us: int) -> range:
+        """Tile columns drawing a block range from start_us to end_us (a
+        block range touching a tile's edge is drawn in it)."""
+        span = self.span_us >> zoom
+        return range((start_us - 1) // span, end_us // span + 1)
+
+    def rows(self, zoom: int, lo: int, hi: int) -> range:
+        """Tile rows drawing any of the levels [lo, hi)."""
+        n = 1 << zoom
+        return range(lo * n // self.level_rows, -(-hi * n // self.level_rows))
+
+
+@dataclass_json
+@dataclass
+class Manifest:
+    max_zoom: int
+    colormap: Optional[str]
+    agg: str
+    grid: TileGrid
+    # extents, for the viewer.
+    min_us: int  # epoch microseconds
+    max_us: int
+    min_blknum: int
+    max_blknum: int
+    num_levels: int
+    # "level/column" -> digest of the block ranges drawn in that max zoom
+    # tile column, see cell_digests.
+    cell_digests: dict[str, str] = field(default_factory=dict)
+
+    def same_layout(self, other: Manifest) -> bool:
+        """Whether tiles of unchanged cells can be reused."""
+        return (self.max_zoom, self.colormap, self.agg, self.grid) == (
+            other.max_zoom,
+            other.colormap,
+            other.agg,
+            other.grid,
+        )
+
+    def tiles(self) -> list[Tile]:
+        """Tiles within the extents (some may be empty)."""
+        return [
+            (zoom, x, y)
+            for zoom in range(self.max_zoom + 1)
+            for x in self.grid.columns(zoom, self.min_us, self.max_us)
+            for y in self.grid.rows(zoom, 0, self.num_levels)
+        ]
+
+
+def cell_digests(
+    levels: list[BlockRangeArray], grid: TileGrid, max_zoom: int
+) -> dict[str, str]:
+    """Digests of the block ranges of each level drawn in each max zoom
+    tile column, keyed "level/column". Cells with no block ranges are left
+    out."""
+    res = {}
+    span = grid.span_us >> max_zoom
+    for i, level in enumerate(levels):
+        if len(level) == 0:
+            continue
+        # levels are sorted by start and end, so a column's block ranges
+        # are a slice.
+        first_col = (level.start - 1) // span
+        last_col = level.end // span
+        cols = np.arange(first_col[0], last_col[-1] + 1)
+        lo = np.searchsorted(last_col, cols)
+        hi = np.searchsorted(first_col, cols, side="right")
+        for col, a, b in zip(cols.tolist(), lo.tolist(), hi.tolist()):
+            if a < b:
+                h = hashlib.blake2b(digest_size=16)
+                for arr in (level.blknum, level.start, level.end):
+                    h.update(np.ascontiguousarray(arr[a:b]).tobytes())
+                res[f"{i}/{col}"] = h.hexdigest()
+    return res
+
+
+def render_tile(
+    bro: BrinOverlap,
+    tile: Tile,
+    grid: TileGrid,
+    colormap: Optional[str] = DEFAULT_COLORMAP,
+    agg: Aggregate = "mean",
+) -> Optional[U8Array]:
+    """RGB image of the tile, or None if no block range is in it."""
+    zoom, x, y = tile
+    size = grid.tile_size
+    t0, t1 = grid.times(zoom, x)
+    lo, hi = grid.levels(zoom, y)
+    hi = min(hi, len(bro.levels))
+    parts, level_idx = [], []
+    for i in range(lo, hi):
+        part = level_window(bro.levels[i], from_micros(t0), from_micros(t1), "overlap")
+        parts.append(as_block_range_array(part))
+        level_idx.append(np.full(len(part), i, np.int64))
+    brs = BlockRangeArray.concatenate(parts)
+    if len(brs) == 0:
+        return None
+    level = np.concatenate(level_idx)
+    # pixel rows of the world, counted up from level 0.
+    levels_per_row = grid.level_rows / (size << zoom)
+    bottom = y * size
+    if hi - lo > size:
+        # more levels than pixel rows: levels sharing a row are aggregated.
+        row = ((level + 0.5) / levels_per_row).astype(np.int64) - bottom
+        pixels = bin_pixels(brs, np.clip(row, 0, size - 1), size, size, t0, t1, agg)
+    else:
+        # a row per level, then each pixel row shows the level at its center.
+        by_level = bin_pixels(brs, level - lo, hi - lo, size, t0, t1, agg)
+        row_levels = ((bottom + np.arange(size) + 0.5) * levels_per_row).astype(
+            np.int64
+        )
+        pixels = by_level[np.clip(row_levels, lo, hi - 1) - lo]
+        pixels[row_levels >= hi] = np.nan  # above the last level
+    # image rows go top down.
+    scale = replace(bro, min_blknum=0, max_blknum=grid.blknum_scale)
+    return colorize(pixels[::-1], scale, colormap_rgb(colormap))
+
+
+def tile_path(out_dir: str, tile: Tile) -> str:
+    zoom, x, y = tile
+    return os.path.join(out_dir, str(zoom), str(x), f"{y}.png")
+
+
+def dirty_tiles(manifest: Manifest, changed: Iterable[str]) -> list[Tile]:
+    """Tiles drawing any of the changed cells ("level/column" keys)."""
+    grid, max_zoom = manifest.grid, manifest.max_zoom
+    res: set[Tile] = set()
+    for key in changed:
+        level, col = (int(s) for s in key.split("/"))
+        for zoom in range(max_zoom + 1):
+            x = col >> (max_zoom - zoom)
+            res.update((zoom, x, y) for y in grid.rows(zoom, level, level + 1))
+    return sorted(res)
+
+
+@dataclass
+class _WorkerState:
+    bro: BrinOverlap
+    out_dir: str
+    manifest: Manifest
+
+
+_state: Optional[_WorkerState] = None  # per worker process, see _init_worker
+
+
+def _init_worker(out_dir: str, manifest: Manifest) -> None:
+    global _state
+    bro = read_overlap_binary(os.path.join(out_dir, OVERLAP))
+    _state = _WorkerState(bro, out_dir, manifest)
+
+
+def _write_tiles(tiles: list[Tile]) -> int:
+    """Render and write tiles, removing stale files of empty ones. Returns
+    the number of non-empty tiles."""
+    assert _state is not None, "_init_worker not called"
+    m = _state.manifest
+    written = 0
+    for tile in tiles:
+        path = tile_path(_state.out_dir, tile)
+        img = render_tile(_state.bro, tile, m.grid, m.colormap, cast(Aggregate, m.agg))
+        if img is None:
+            if os.path.exists(path):
+                os.remove(path)
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        mpimg.imsave(path, img)
+        written += 1
+    return written
+
+
+def _read_manifest(out_dir: str) -> Optional[Manifest]:
+    path = os.path.join(out_dir, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        try:
+            manifest: Manifest = Manifest.from_json(f.read())  # type: ignore
+        except KeyError:
+            return None  # written by an older version
+    return manifest
+
+
+def build_pyramid(
+    bro: BrinOverlap,
+    out_dir: str,
+    max_zoom: int = DEFAULT_MAX_ZOOM,
+    tile_size: int = TILE_SIZE,
+    colormap: Optional[str] = DEFAULT_COLORMAP,
+    agg: Aggregate = "mean",
+    workers: Optional[int] = None,
+) -> int:
+    """Write the tile pyramid and viewer to out_dir. Returns the number of
+    tiles rendered."""
+    levels = [as_block_range_array(level) for level in bro.levels]
+    old = _read_manifest(out_dir)
+    grid = TileGrid.fit(bro, max_zoom, tile_size)
+    if (
+        old is not None
+        and old.grid.tile_size == tile_size
+        and old.grid.span_us >= 1 << max_zoom
+        and bro.max_blknum <= old.grid.blknum_scale
+    ):
+        grid = old.grid
+    manifest = Manifest(
+        max_zoom=max_zoom,
+        colormap=colormap,
+        agg=agg,
+        grid=grid,
+        min_us=to_micros(bro.min_val),
+        max_us=to_micros(bro.max_val),
+        min_blknum=bro.min_blknum,
+        max_blknum=bro.max_blknum,
+        num_levels=len(levels),
+        cell_digests=cell_digests(levels, grid, max_zoom),
+    )
+    if old is not None and old.same_layout(manifest):
+        old_cells, new_cells = old.cell_digests, manifest.cell_digests
+        changed = [
+            key
+            for key in old_cells.keys() | new_cells.keys()
+            if old_cells.get(key) != new_cells.get(key)
+        ]
+        tiles = dirty_tiles(manifest, changed)
+        logging.info(f"{len(changed)} cells changed, {len(tiles)} tiles to render")
+    else:
+        for zoom in range(max(max_zoom, old.max_zoom if old else 0) + 1):
+            shutil.rmtree(os.path.join(out_dir, str(zoom)), ignore_errors=True)
+        tiles = manifest.tiles()
+        logging.info(f"rendering all {len(tiles)} tiles")
+
+    os.makedirs(out_dir, exist_ok=True)
+    # if interrupted, the next build can't tell which tiles are up to date.
+    if old is not None:
+        os.remove(os.path.join(out_dir, MANIFEST))
+    overlap_path = os.path.join(out_dir, OVERLAP)
+    if tiles or not os.path.exists(overlap_path):
+        write_overlap_binary(bro, overlap_path)
+    shutil.copyfile(VIEWER_SRC, os.path.join(out_dir, VIEWER))
+
+    workers = workers or os.cpu_count() or 1
+    # interleave tiles so each batch mixes cheap and expensive zooms.
+    batches = [tiles[i :: workers * 4] for i in range(min(len(tiles), workers * 4))]
+    if workers == 1:
+        _init_worker(out_dir, manifest)
+        written = sum(_write_tiles(batch) for batch in batches)
+    else:
+        with ProcessPoolExecutor(
+            workers, initializer=_init_worker, initargs=(out_dir, manifest)
+        ) as executor:
+            written = sum(executor.map(_write_tiles, batches))
+    logging.info(f"wrote {written} non-empty tiles")
+
+    # written last, so an interrupted build is redone next time.
+    with open(os.path.join(out_dir, MANIFEST), "w") as f:
+        f.write(manifest.to_json())  # type: ignore
+    return len(tiles)
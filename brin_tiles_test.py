@@ -0,0 +1,183 @@
+import os
+from dataclasses import replace
+from datetime import datetime, timedelta
+
+import pytest
+
+from brin_lib import BlockRange, from_micros, to_micros
+from brin_overlap import BrinOverlap, compute_overlap, update_overlap
+from brin_parser import parse_csv_file
+from brin_synth import generate
+from brin_tiles import (
+    MANIFEST,
+    VIEWER,
+    Manifest,
+    TileGrid,
+    build_pyramid,
+    dirty_tiles,
+    render_tile,
+    tile_path,
+)
+
+
+@pytest.mark.parametrize("num_levels,level_rows", [(1, 1), (3, 4), (8, 8), (5, 64)])
+def test_tile_grid_levels(num_levels: int, level_rows: int) -> None:
+    grid = TileGrid(32, 1 << 20, level_rows, 1)
+    for zoom in range(8):
+        drawn: set[int] = set()
+        for y in grid.rows(zoom, 0, num_levels):
+            lo, hi = grid.levels(zoom, y)
+            assert 0 <= lo < hi <= level_rows and lo < num_levels
+            drawn.update(range(lo, min(hi, num_levels)))
+            # rows() is the inverse of levels().
+            for level in range(lo, hi):
+                assert y in grid.rows(zoom, level, level + 1)
+        assert drawn == set(range(num_levels))
+    # bottom row holds level 0.
+    assert grid.levels(3, 0)[0] == 0
+
+
+def test_tile_grid_columns() -> None:
+    grid = TileGrid(32, 1 << 20, 1, 1)
+    assert grid.times(2, -1) == (-(1 << 18), 0)
+    assert grid.columns(2, 1, (1 << 18) - 1) == range(0, 1)
+    # touching a tile's edge draws in it.
+    assert grid.columns(2, 0, 1 << 18) == range(-1, 2)
+
+
+SPAN = 1 << 33  # us, about 143 minutes
+
+
+def _ts(minutes: int) -> datetime:
+    # at the start of a zoom 0 tile of SPAN.
+    base = to_micros(datetime(2021, 1, 1)) // SPAN * SPAN
+    return from_micros(base) + timedelta(minutes=minutes)
+
+
+def test_render_tile() -> None:
+    # level 0 in the first 40 minutes, level 1 from 60 to 100.
+    bro = BrinOverlap(
+        _ts(0),
+        _ts(100),
+        0,
+        128,
+        [[BlockRange(0, _ts(0), _ts(40))], [BlockRange(128, _ts(60), _ts(100))]],
+    )
+    x = to_micros(_ts(0)) // SPAN
+    grid = TileGrid(16, SPAN, 2, 256)
+    img = render_tile(bro, (0, x, 0), grid, colormap=None)
+    assert img is not None and img.shape == (16, 16, 3)
+    # level 1 on top, from 42% to 70% of the tile's time.
+    assert list(img[0, 8]) == [211, 211, 211]
+    assert list(img[0, 0]) == [255, 255, 255]
+    assert list(img[15, 0]) == [211, 211, 211]
+    assert list(img[15, 8]) == [255, 255, 255]
+    # zoom 1: bottom right (level 0, second half of time) is empty.
+    assert render_tile(bro, (1, 2 * x + 1, 0), grid) is None
+    assert render_tile(bro, (1, 2 * x, 0), grid) is not None
+    assert render_tile(bro, (0, x + 1, 0), grid) is None
+    # rows above the last level are empty.
+    img = render_tile(bro, (0, x, 0), TileGrid(16, SPAN, 4, 256), colormap=None)
+    assert img is not None
+    assert (img[:8] == 255).all()
+    assert list(img[15, 0]) == [211, 211, 211]
+
+
+def _bro() -> BrinOverlap:
+    return compute_overlap(parse_csv_file("testdata/brinexport_test_overlaps.csv"))
+
+
+def _manifest(out_dir: str) -> Manifest:
+    with open(os.path.join(out_dir, MANIFEST)) as f:
+        manifest: Manifest = Manifest.from_json(f.read())  # type: ignore
+    return manifest
+
+
+def _tile_files(out_dir: str) -> dict[str, bytes]:
+    res = {}
+    for dirpath, _, files in os.walk(out_dir):
+        for f in files:
+            if f.endswith(".png"):
+                path = os.path.join(dirpath, f)
+                with open(path, "rb") as fp:
+                    res[os.path.relpath(path, out_dir)] = fp.read()
+    return res
+
+
+def _assert_same_as_fresh(bro: BrinOverlap, out_dir: str, fresh_dir: str) -> None:
+    """out_dir has the same tiles as a fresh build with out_dir's grid."""
+    manifest = _manifest(out_dir)
+    os.makedirs(fresh_dir)
+    with open(os.path.join(fresh_dir, MANIFEST), "w") as f:
+        # no digests: the same grid, but every tile is dirty.
+        f.write(replace(manifest, cell_digests={}).to_json())  # type: ignore
+    build_pyramid(bro, fresh_dir, manifest.max_zoom, manifest.grid.tile_size, workers=1)
+    assert _tile_files(out_dir) == _tile_files(fresh_dir)
+
+
+def test_build_pyramid_incremental(tmp_path: str) -> None:
+    out_dir = os.path.join(tmp_path, "tiles")
+    bro = _bro()
+    num_tiles = build_pyramid(bro, out_dir, max_zoom=2, tile_size=32, workers=1)
+    manifest = _manifest(out_dir)
+    assert num_tiles == len(manifest.tiles())
+    assert os.path.exists(os.path.join(out_dir, VIEWER))
+    num_files = len(_tile_files(out_dir))
+    assert 0 < num_files <= num_tiles
+
+    # nothing changed.
+    assert build_pyramid(bro, out_dir, max_zoom=2, tile_size=32, workers=1) == 0
+
+    # change one block range of the top level.
+    top = list(bro.levels[-1])
+    br = top[0]
+    top[0] = BlockRange(br.blknum, br.start + timedelta(seconds=1), br.end)
+    levels = [list(level) for level in bro.levels[:-1]] + [top]
+    bro2 = BrinOverlap(bro.min_val, bro.max_val, bro.min_blknum, bro.max_blknum, levels)
+    expected = dirty_tiles(
+        manifest,
+        [k for k in manifest.cell_digests if k.startswith(f"{len(levels) - 1}/")],
+    )
+    assert 0 < len(expected) < num_tiles
+    num_dirty = build_pyramid(bro2, out_dir, max_zoom=2, tile_size=32, workers=1)
+    assert 0 < num_dirty <= len(expected)
+    _assert_same_as_fresh(bro2, out_dir, os.path.join(tmp_path, "fresh"))
+
+    # different options re-render everything.
+    assert build_pyramid(bro2, out_dir, max_zoom=1, tile_size=32, workers=1) == len(
+        _manifest(out_dir).tiles()
+    )
+    assert not os.path.exists(os.path.join(out_dir, "2"))
+
+
+def test_build_pyramid_append(tmp_path: str) -> None:
+    # a daily refresh: new block ranges at the end of the table and of time.
+    brs = generate(2000, "jitter")
+    bro = compute_overlap(brs[:1500])
+    out_dir = os.path.join(tmp_path, "tiles")
+    build_pyramid(bro, out_dir, max_zoom=3, tile_size=32, workers=1)
+    grid = _manifest(out_dir).grid
+
+    bro2 = update_overlap(bro, brs)
+    assert bro2.max_val > bro.max_val and bro2.max_blknum > bro.max_blknum
+    num_dirty = build_pyramid(bro2, out_dir, max_zoom=3, tile_size=32, workers=1)
+    manifest = _manifest(out_dir)
+    assert manifest.grid == grid
+    assert 0 < num_dirty < len(manifest.tiles()) // 2
+    _assert_same_as_fresh(bro2, out_dir, os.path.join(tmp_path, "fresh"))
+
+    # outgrowing the color scale re-renders everything.
+    bro3 = update_overlap(bro2, generate(3000, "jitter"))
+    num_tiles = build_pyramid(bro3, out_dir, max_zoom=3, tile_size=32, workers=1)
+    assert _manifest(out_dir).grid.blknum_scale > grid.blknum_scale
+    assert num_tiles == len(_manifest(out_dir).tiles())
+
+
+def test_build_pyramid_parallel(tmp_path: str) -> None:
+    bro = _bro()
+    serial, parallel = os.path.join(tmp_path, "a"), os.path.join(tmp_path, "b")
+    build_pyramid(bro, serial, max_zoom=2, tile_size=32, workers=1)
+    build_pyramid(bro, parallel, max_zoom=2, tile_size=32, workers=2)
+    files = _tile_files(serial)
+    assert files and files == _tile_files(parallel)
+    assert any(os.path.exists(tile_path(serial, t)) for t in _manifest(serial).tiles())
@@ -1,14 +1,27 @@
 #%%
 import logging
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Literal, Optional, TextIO, Union
 
 import drawSvg as draw
+import numpy as np
+import numpy.typing as npt
 from matplotlib import cm, colors
+from matplotlib import image as mpimg
 
-from brin_lib import BlockRange
+from brin_lib import (
+    BlockRange,
+    BlockRangeArray,
+    BlockRanges,
+    Int64Array,
+    as_block_range_array,
+    to_micros,
+)
 from brin_overlap import BrinOverlap
 
+Float64Array = npt.NDArray[np.float64]
+U8Array = npt.NDArray[np.uint8]
+
 DEFAULT_WIDTH = 5000
 DEFAULT_BLOCK_HEIGHT = 8
 DEFAULT_COLORMAP = "RdYlGn"
@@ -71,10 +84,9 @@ def _round_start_time(start: datetime, interval: timedelta) -> datetime:
     if interval >= timedelta(days=1):
         return datetime(start.year, start.month, start.day, tzinfo=start.tzinfo)
     if interval >= timedelta(hours=3):
-        nearest_3rd_hour = round(start.hour / 6) * 6
-        return datetime(
-            start.year, start.month, start.day, nearest_3rd_hour, tzinfo=start.tzinfo
-        )
+        # truncate like the other cases: rounding up could give hour 24.
+        hour = start.hour // 6 * 6
+        return datetime(start.year, start.month, start.day, hour, tzinfo=start.tzinfo)
     if interval >= timedelta(hours=1):
         return datetime(
             start.year,
@@ -109,6 +121,49 @@ def _auto_num_ticks(canvas_width: float) -> int:
     return max(num_ticks, 3)
 
 
+def _ticks(
+    bro: BrinOverlap, canvas_width: float, num_ticks: Optional[int]
+) -> list[datetime]:
+    if num_ticks is None:
+        return _auto_datetime_range(
+            bro.min_val, bro.max_val, _auto_num_ticks(canvas_width)
+        )
+    return _even_datetime_range(bro.min_val, bro.max_val, num_ticks)
+
+
+def _tick_text(datetime_range: list[datetime]) -> list[list[str]]:
+    """Two line labels, with the date only shown when it changes."""
+    res = []
+    prev_date = None
+    for dt in datetime_range:
+        res.append(
+            [
+                "" if prev_date == dt.date() else dt.strftime("%Y-%m-%d"),
+                dt.strftime("%H:%M"),
+            ]
+        )
+        prev_date = dt.date()
+    return res
+
+
+def colormap_lut(colormap: Optional[str]) -> list[str]:
+    """Hex colors of every entry of the colormap. Entry
+    min(int(p * len(lut)), len(lut) - 1) is the color of cmap(p)."""
+    if not colormap:
+        return ["lightgrey"]
+    cmap = cm.get_cmap(colormap)
+    return [colors.to_hex(c) for c in cmap(np.arange(cmap.N))]
+
+
+def _color_idx(
+    blknum: Union[Int64Array, Float64Array], bro: BrinOverlap, lut_size: int
+) -> Int64Array:
+    blknum_range = max(bro.max_blknum - bro.min_blknum, 1)
+    p = (blknum - bro.min_blknum) / blknum_range
+    idx: Int64Array = np.clip((p * lut_size).astype(np.int64), 0, lut_size - 1)
+    return idx
+
+
 def svg(
     bro: BrinOverlap,
     outfile: Optional[str] = None,
@@ -154,32 +209,17 @@ def svg(
         return res
 
     # draw block ranges
-    cmap = cm.get_cmap(colormap) if colormap else None
+    lut = colormap_lut(colormap)
     for num_level, level in enumerate(bro.levels):
         for br in level:
             p = _br_frac(br.blknum, bro.min_blknum, bro.max_blknum)
-            color = colors.to_hex(cmap(p)) if cmap else "lightgrey"
+            color = lut[min(int(p * len(lut)), len(lut) - 1)]
             r = draw.Rectangle(*xywh(br, num_level), fill=color, stroke="black")
             d.append(r)
 
     # draw time ticks
-    if num_ticks is None:
-        datetime_range = _auto_datetime_range(
-            bro.min_val, bro.max_val, _auto_num_ticks(canvas_width)
-        )
-    else:
-        datetime_range = _even_datetime_range(bro.min_val, bro.max_val, num_ticks)
-    prev_date = None
-    for dt in datetime_range:
-        # text = []
-        # if prev_date != dt.date():
-        #     text.append(dt.strftime("%Y-%m-%d"))
-        # text.append(dt.strftime("%H:%M"))
-        text = [
-            "" if prev_date == dt.date() else dt.strftime("%Y-%m-%d"),
-            dt.strftime("%H:%M"),
-        ]
-        prev_date = dt.date()
+    datetime_range = _ticks(bro, canvas_width, num_ticks)
+    for dt, text in zip(datetime_range, _tick_text(datetime_range)):
         x = interpx(dt) + CANVAS_MARGIN
         # y = font size because multi-line string.
         d.append(draw.Text(text, DATE_FONT_SIZE, x, DATE_FONT_SIZE, center=True))
@@ -191,3 +231,242 @@ def svg(
         print(f"saving to {outfile}")
         d.saveSvg(outfile)
     return d
+
+
+# Streaming SVG writer. Same picture as svg(), in drawSvg's coordinates (y
+# grows up, so y values are negated), but written to the file one level at a
+# time instead of building a Drawing of every element. Geometry and colors
+# are computed with numpy per level, and with coalesce=True all same colored
+# block ranges of a level share one <path> element.
+
+
+def _num(v: float) -> str:
+    return f"{v:.2f}".rstrip("0").rstrip(".")
+
+
+def _write_level(
+    f: TextIO,
+    level: BlockRanges,
+    num_level: int,
+    bro: BrinOverlap,
+    lut: list[str],
+    canvas_width: float,
+    block_height: float,
+    coalesce: bool,
+) -> None:
+    brs = as_block_range_array(level)
+    if len(brs) == 0:
+        return
+    min_us = to_micros(bro.min_val)
+    val_range = max(to_micros(bro.max_val) - min_us, 1)
+    x = (brs.start - min_us) / val_range * canvas_width
+    w = (brs.end - min_us) / val_range * canvas_width - x
+    # same as xywh in svg().
+    xs = [_num(v) for v in (x + CANVAS_MARGIN).tolist()]
+    ws = [_num(v) for v in np.maximum(2, w - HGAP).tolist()]
+    h = _num(block_height - VGAP)
+    y = _num(-(num_level * block_height + CANVAS_MARGIN + block_height - VGAP))
+    color_idx = _color_idx(brs.blknum, bro, len(lut))
+    if not coalesce:
+        for xi, wi, ci in zip(xs, ws, color_idx.tolist()):
+            f.write(
+                f'<rect x="{xi}" y="{y}" width="{wi}" height="{h}" '
+                f'fill="{lut[ci]}" stroke="black" />\n'
+            )
+        return
+    order = np.argsort(color_idx, kind="stable")
+    bounds = np.flatnonzero(np.diff(color_idx[order])) + 1
+    for group in np.split(order, bounds):
+        d = "".join(f"M{xs[i]} {y}h{ws[i]}v{h}h-{ws[i]}z" for i in group.tolist())
+        color = lut[color_idx[group[0]]]
+        f.write(f'<path d="{d}" fill="{color}" stroke="black" />\n')
+
+
+def write_svg(
+    bro: BrinOverlap,
+    f: TextIO,
+    width: float = DEFAULT_WIDTH,
+    block_height: float = DEFAULT_BLOCK_HEIGHT,
+    num_ticks: Optional[int] = None,
+    colormap: Optional[str] = DEFAULT_COLORMAP,
+    coalesce: bool = True,
+) -> None:
+    full_width = width
+    full_height = block_height * len(bro.levels) + CANVAS_MARGIN * 2
+    canvas_width = full_width - CANVAS_MARGIN * 2
+    canvas_height = full_height - CANVAS_MARGIN * 2
+    w, h = _num(full_width), _num(full_height)
+    f.write(
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<svg xmlns="http://www.w3.org/2000/svg" '
+        f'width="{w}" height="{h}" viewBox="0 -{h} {w} {h}">\n'
+    )
+    # border around block range rectangles
+    f.write(
+        f'<rect x="{_num(CANVAS_MARGIN)}" y="{_num(-CANVAS_MARGIN - canvas_height)}" '
+        f'width="{_num(canvas_width)}" height="{_num(canvas_height)}" '
+        'fill="none" stroke="black" stroke-width="2" />\n'
+    )
+    lut = colormap_lut(colormap)
+    for num_level, level in enumerate(bro.levels):
+        _write_level(
+            f, level, num_level, bro, lut, canvas_width, block_height, coalesce
+        )
+
+    # time ticks
+    datetime_range = _ticks(bro, canvas_width, num_ticks)
+    val_range = bro.max_val - bro.min_val
+    for dt, (line1, line2) in zip(datetime_range, _tick_text(datetime_range)):
+        x = _num((dt - bro.min_val) / val_range * canvas_width + CANVAS_MARGIN)
+        f.write(
+            f'<text x="{x}" y="-{DATE_FONT_SIZE}" font-size="{DATE_FONT_SIZE}" '
+            f'text-anchor="middle"><tspan x="{x}" dy="-0.1em">{line1}</tspan>'
+            f'<tspan x="{x}" dy="1em">{line2}</tspan></text>\n'
+        )
+        y0, y1 = _num(-CANVAS_MARGIN), _num(-CANVAS_MARGIN + TICK_LENGTH)
+        f.write(f'<path d="M{x},{y0} L{x},{y1}" stroke="black" />\n')
+    f.write("</svg>\n")
+
+
+def svg_stream(
+    bro: BrinOverlap,
+    outfile: str,
+    width: float = DEFAULT_WIDTH,
+    block_height: float = DEFAULT_BLOCK_HEIGHT,
+    num_ticks: Optional[int] = None,
+    colormap: Optional[str] = DEFAULT_COLORMAP,
+    coalesce: bool = True,
+) -> None:
+    """Like svg(), but much faster and smaller output for big indexes."""
+    print(f"saving to {outfile}")
+    with open(outfile, "w") as f:
+        write_svg(bro, f, width, block_height, num_ticks, colormap, coalesce)
+
+
+# Raster renderer. When there are more block ranges than pixels, vector
+# output is mostly sub-pixel rectangles. Instead, bin block ranges into a
+# grid of level rows by time columns and color each pixel by the min or
+# mean blknum of the block ranges covering it. Block ranges on a level don't
+# overlap, so each level row covers at most width + (number of block ranges)
+# pixels, and the cost is about O(image size + number of block ranges).
+
+Aggregate = Literal["mean", "min"]
+AGGREGATES = ("mean", "min")
+BACKGROUND = (255, 255, 255)
+NO_COLORMAP_COLOR = (211, 211, 211)  # lightgrey, like svg()
+
+
+def _pixel_spans(
+    col_start: Int64Array, col_end: Int64Array
+) -> tuple[Int64Array, Int64Array]:
+    """Expand column spans [col_start, col_end) into (span index, column)
+    pairs for every covered pixel."""
+    lengths = col_end - col_start
+    owner = np.repeat(np.arange(len(lengths)), lengths)
+    run_start = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    cols: Int64Array = col_start[owner] + np.arange(len(owner)) - run_start
+    return owner, cols
+
+
+def bin_pixels(
+    brs: BlockRangeArray,
+    row: Int64Array,
+    rows: int,
+    width: int,
+    start_us: int,
+    end_us: int,
+    agg: Aggregate = "mean",
+) -> Float64Array:
+    """Aggregated blknum of each pixel, shape (rows, width), NaN where no
+    block range is drawn. row is each block range's row, and the columns
+    span start_us..end_us."""
+    if agg not in AGGREGATES:
+        raise ValueError(f"unknown aggregate {agg!r}, expected {AGGREGATES}")
+    val_range = max(end_us - start_us, 1)
+    x0 = (brs.start - start_us) / val_range * width
+    x1 = (brs.end - start_us) / val_range * width
+    col_start = np.clip(np.floor(x0).astype(np.int64), 0, width - 1)
+    # every block range covers at least one pixel.
+    col_end = np.clip(np.ceil(x1).astype(np.int64), col_start + 1, width)
+    owner, cols = _pixel_spans(col_start, col_end)
+    pixel = row[owner] * width + cols
+    blknum = brs.blknum[owner].astype(np.float64)
+    grid = np.full(rows * width, np.nan)
+    if agg == "min":
+        np.fmin.at(grid, pixel, blknum)
+    else:
+        total = np.bincount(pixel, blknum, minlength=rows * width)
+        count = np.bincount(pixel, minlength=rows * width)
+        covered = count > 0
+        grid[covered] = total[covered] / count[covered]
+    return grid.reshape(rows, width)
+
+
+def raster_grid(
+    bro: BrinOverlap, width: int, rows: int, agg: Aggregate = "mean"
+) -> Float64Array:
+    """bin_pixels of the whole overlap. Row 0 is level 0. If there are more
+    levels than rows, consecutive levels share a row."""
+    num_levels = len(bro.levels)
+    level_lens = np.array([len(level) for level in bro.levels], np.int64)
+    row = np.repeat(np.arange(num_levels) * rows // max(num_levels, 1), level_lens)
+    start_us, end_us = to_micros(bro.min_val), to_micros(bro.max_val)
+    return bin_pixels(
+        bro.block_ranges_by_level(), row, rows, width, start_us, end_us, agg
+    )
+
+
+def colorize(grid: Float64Array, bro: BrinOverlap, lut: U8Array) -> U8Array:
+    """RGB image of a bin_pixels grid, colored relative to bro's blknums."""
+    covered = ~np.isnan(grid)
+    color_idx = _color_idx(np.where(covered, grid, 0), bro, len(lut))
+    img: U8Array = np.where(
+        covered[..., None], lut[color_idx], np.array(BACKGROUND, np.uint8)
+    ).astype(np.uint8)
+    return img
+
+
+def colormap_rgb(colormap: Optional[str]) -> U8Array:
+    """Like colormap_lut, as an (N, 3) array of RGB values."""
+    if not colormap:
+        return np.array([NO_COLORMAP_COLOR], np.uint8)
+    cmap = cm.get_cmap(colormap)
+    rgb: U8Array = np.round(cmap(np.arange(cmap.N))[:, :3] * 255).astype(np.uint8)
+    return rgb
+
+
+def raster(
+    bro: BrinOverlap,
+    width: int = DEFAULT_WIDTH,
+    block_height: int = DEFAULT_BLOCK_HEIGHT,
+    colormap: Optional[str] = DEFAULT_COLORMAP,
+    agg: Aggregate = "mean",
+    max_height: Optional[int] = None,
+) -> U8Array:
+    """RGB image of shape (height, width, 3), level 0 at the bottom like
+    svg(). Each level row is block_height pixels tall, with a gap pixel
+    between rows. If the image would be taller than max_height, levels are
+    binned into fewer rows."""
+    rows = len(bro.levels)
+    if max_height is not None:
+        rows = max(min(rows, max_height // block_height), 1)
+    img = colorize(raster_grid(bro, width, rows, agg), bro, colormap_rgb(colormap))
+    # each row block_height pixels tall, top row is the last level.
+    img = np.repeat(img[::-1], block_height, axis=0)
+    if block_height > 2:
+        img[block_height - 1 :: block_height] = BACKGROUND
+    return img
+
+
+def raster_png(
+    bro: BrinOverlap,
+    outfile: str,
+    width: int = DEFAULT_WIDTH,
+    block_height: int = DEFAULT_BLOCK_HEIGHT,
+    colormap: Optional[str] = DEFAULT_COLORMAP,
+    agg: Aggregate = "mean",
+    max_height: Optional[int] = None,
+) -> None:
+    print(f"saving to {outfile}")
+    img = raster(bro, width, block_height, colormap, agg, max_height)
+    mpimg.imsave(outfile, img)
@@ -0,0 +1,135 @@
+import io
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+from matplotlib import cm, colors
+from matplotlib import image as mpimg
+
+from brin_lib import BlockRange
+from brin_overlap import (
+    BrinOverlap,
+    compute_overlap,
+    read_overlap_binary,
+    write_overlap_binary,
+)
+from brin_parser import parse_csv_file
+from brin_viz import (
+    _round_start_time,
+    colormap_lut,
+    raster,
+    raster_grid,
+    raster_png,
+    svg,
+    write_svg,
+)
+
+NS = "{http://www.w3.org/2000/svg}"
+
+
+def test_colormap_lut() -> None:
+    lut = colormap_lut("RdYlGn")
+    cmap = cm.get_cmap("RdYlGn")
+    for p in [0.0, 0.001, 0.25, 0.5, 0.999, 1.0]:
+        assert lut[min(int(p * len(lut)), len(lut) - 1)] == colors.to_hex(cmap(p))
+    assert colormap_lut(None) == ["lightgrey"]
+
+
+def test_round_start_time_late_evening() -> None:
+    start = datetime(2019, 12, 31, 23, 49, 48)
+    rounded = _round_start_time(start, timedelta(hours=3))
+    assert rounded == datetime(2019, 12, 31, 18)
+
+
+def _rects(svg_text: str) -> list[tuple[float, float, float, float, str]]:
+    root = ET.fromstring(svg_text)
+    return [
+        (
+            round(float(r.get("x", 0)), 2),
+            round(float(r.get("y", 0)), 2),
+            round(float(r.get("width", 0)), 2),
+            round(float(r.get("height", 0)), 2),
+            r.get("fill", ""),
+        )
+        for r in root.iter(f"{NS}rect")
+    ]
+
+
+@pytest.mark.parametrize("colormap", ["RdYlGn", None])
+def test_write_svg_matches_drawsvg(colormap: str) -> None:
+    bro = compute_overlap(parse_csv_file("testdata/brinexport_test_overlaps.csv"))
+    expected = svg(bro, width=600, colormap=colormap).asSvg()
+    f = io.StringIO()
+    write_svg(bro, f, width=600, colormap=colormap, coalesce=False)
+    assert _rects(f.getvalue()) == _rects(expected)
+
+
+def test_write_svg_coalesce(tmp_path: str) -> None:
+    bro = compute_overlap(
+        parse_csv_file("examples/brinexport_large_example_201903_to_202005.csv")
+    )
+    # levels as arrays, like a memory mapped .bro file.
+    path = f"{tmp_path}/overlap.bro"
+    write_overlap_binary(bro, path)
+    bro = read_overlap_binary(path)
+    num_ranges = sum(len(level) for level in bro.levels)
+    f = io.StringIO()
+    write_svg(bro, f, coalesce=True)
+    root = ET.fromstring(f.getvalue())
+    # just the border rect, block ranges are subpaths.
+    assert len(list(root.iter(f"{NS}rect"))) == 1
+    paths = [p.get("d", "") for p in root.iter(f"{NS}path")]
+    assert sum(d.count("M") for d in paths) >= num_ranges
+    assert len(paths) < num_ranges
+
+
+def _ts(minutes: int) -> datetime:
+    return datetime(2021, 1, 1) + timedelta(minutes=minutes)
+
+
+def _raster_bro() -> BrinOverlap:
+    # 100 minutes over 10 pixels, so 10 minutes per pixel.
+    return BrinOverlap(
+        _ts(0),
+        _ts(100),
+        0,
+        400,
+        [
+            [
+                BlockRange(0, _ts(0), _ts(20)),
+                BlockRange(100, _ts(20), _ts(23)),
+                BlockRange(300, _ts(24), _ts(29)),
+            ],
+            [BlockRange(400, _ts(50), _ts(100))],
+        ],
+    )
+
+
+def test_raster_grid() -> None:
+    bro = _raster_bro()
+    grid = raster_grid(bro, width=10, rows=2, agg="mean")
+    assert list(grid[0, :3]) == [0, 0, 200]
+    assert np.isnan(grid[0, 3:]).all()
+    assert np.isnan(grid[1, :5]).all()
+    assert list(grid[1, 5:]) == [400] * 5
+    assert raster_grid(bro, width=10, rows=2, agg="min")[0, 2] == 100
+    # levels binned into one row.
+    grid = raster_grid(bro, width=10, rows=1, agg="min")
+    assert list(grid[0, [0, 2, 5]]) == [0, 100, 400]
+
+
+def test_raster(tmp_path: str) -> None:
+    bro = _raster_bro()
+    img = raster(bro, width=10, block_height=4, colormap=None)
+    assert img.shape == (8, 10, 3)
+    # level 0 at the bottom, gap pixel rows between levels.
+    assert list(img[6, 0]) == [211, 211, 211]
+    assert list(img[6, 9]) == [255, 255, 255]
+    assert list(img[7, 0]) == [255, 255, 255]
+    assert list(img[0, 9]) == [211, 211, 211]
+    img = raster(bro, width=10, block_height=4, max_height=5)
+    assert img.shape == (4, 10, 3)
+    path = f"{tmp_path}/viz.png"
+    raster_png(bro, path, width=10)
+    assert mpimg.imread(path).shape[:2] == (16, 10)
@@ -0,0 +1,197 @@
+"""Estimate how much heap data a workload of time range queries reads."""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+import numpy as np
+import numpy.typing as npt
+
+from brin_lib import (
+    BlockRangeArray,
+    BlockRanges,
+    Int64Array,
+    as_block_range_array,
+    from_micros,
+    to_micros,
+)
+
+Float64Array = npt.NDArray[np.float64]
+
+DEFAULT_PAGES_PER_RANGE = 128  # Postgres default
+DEFAULT_BLOCK_SIZE = 8192  # bytes, Postgres default
+
+_DURATION_REX = re.compile(r"^(?P<num>\d+(?:\.\d+)?)(?P<unit>s|m|h|d|w)$")
+_DURATION_UNITS = {
+    "s": timedelta(seconds=1),
+    "m": timedelta(minutes=1),
+    "h": timedelta(hours=1),
+    "d": timedelta(days=1),
+    "w": timedelta(weeks=1),
+}
+
+
+def parse_duration(s: str) -> timedelta:
+    """Parse durations like "30m", "1h", "1d"."""
+    if (match := _DURATION_REX.match(s.strip())) is None:
+        raise ValueError(f"failed to parse duration (eg 1h, 1d): {s}")
+    return float(match["num"]) * _DURATION_UNITS[match["unit"]]
+
+
+@dataclass(eq=False)
+class Workload:
+    """Query time windows [start, end], inclusive, in epoch microseconds."""
+
+    start: Int64Array
+    end: Int64Array
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    @staticmethod
+    def from_windows(
+        windows: Iterable[tuple[datetime, Optional[datetime]]],
+    ) -> Workload:
+        """Windows as (start, end) pairs. end=None is a point query."""
+        starts, ends = [], []
+        for start, end in windows:
+            starts.append(to_micros(start))
+            ends.append(to_micros(start if end is None else end))
+        return Workload(np.array(starts, np.int64), np.array(ends, np.int64))
+
+    @staticmethod
+    def every(span: timedelta, first: datetime, last: datetime) -> Workload:
+        """Back to back windows of length span covering first..last, aligned
+        to multiples of span since the epoch (so 1d windows are whole days)."""
+        span_us = span // timedelta(microseconds=1)
+        if span_us <= 0:
+            raise ValueError(f"window span must be positive, got {span}")
+        first_us = to_micros(first) // span_us * span_us
+        starts = np.arange(first_us, to_micros(last) + 1, span_us, dtype=np.int64)
+        return Workload(starts, starts + span_us - 1)
+
+    @staticmethod
+    def every_over(span: timedelta, block_ranges: BlockRanges) -> Workload:
+        """Workload.every over the full time span of the block ranges."""
+        brs = as_block_range_array(block_ranges)
+        if len(brs) == 0:
+            return Workload(np.empty(0, np.int64), np.empty(0, np.int64))
+        return Workload.every(
+            span, from_micros(brs.start.min()), from_micros(brs.end.max())
+        )
+
+
+def count_matching(brs: BlockRangeArray, workload: Workload) -> Int64Array:
+    """Number of block ranges overlapping each window. A block range
+    overlaps [qs, qe] unless it ends before qs or starts after qe, and (since
+    start <= end) those two cases never both hold, so the count is a pair of
+    binary searches per window."""
+    starts, ends = np.sort(brs.start), np.sort(brs.end)
+    started = np.searchsorted(starts, workload.end, side="right")
+    ended_before = np.searchsorted(ends, workload.start, side="left")
+    return (started - ended_before).astype(np.int64)
+
+
+def data_fraction(brs: BlockRangeArray, workload: Workload) -> Float64Array:
+    """Estimated number of block ranges' worth of rows in each window,
+    assuming each block range's rows are spread evenly over its time span.
+
+    This is F(end) - F(start) for the piecewise linear F(t) = sum over block
+    ranges of the fraction of its span before t, evaluated with prefix sums
+    over the sorted start and end times."""
+    # shift times to keep the float math precise.
+    origin = int(brs.start.min()) if len(brs) else 0
+    start = (brs.start - origin).astype(np.float64)
+    end = (brs.end - origin).astype(np.float64)
+    width = end - start
+    zero_width = width == 0
+    inv = np.where(zero_width, 0.0, 1.0 / np.where(zero_width, 1.0, width))
+
+    def prefix(times: Float64Array) -> tuple[Float64Array, Float64Array, Float64Array]:
+        order = np.argsort(times, kind="stable")
+        cum_inv = np.concatenate(([0.0], np.cumsum(inv[order])))
+        cum_t_inv = np.concatenate(([0.0], np.cumsum((times * inv)[order])))
+        return times[order], cum_inv, cum_t_inv
+
+    sorted_starts, start_inv, start_t_inv = prefix(start)
+    sorted_ends, end_inv, end_t_inv = prefix(end)
+    points = np.sort(start[zero_width])
+
+    def cumulative(t: Float64Array) -> Float64Array:
+        i = np.searchsorted(sorted_starts, t, side="right")
+        j = np.searchsorted(sorted_ends, t, side="right")
+        ramp = (t * start_inv[i] - start_t_inv[i]) - (t * end_inv[j] - end_t_inv[j])
+        return ramp + np.searchsorted(points, t, side="right")
+
+    qs = (workload.start - origin).astype(np.float64)
+    qe = (workload.end - origin).astype(np.float64)
+    # qs - 1: windows are inclusive, so count zero width ranges at qs.
+    return np.maximum(cumulative(qe) - cumulative(qs - 1), 0.0)
+
+
+@dataclass(eq=False)
+class WorkloadCost:
+    """Per-window cost of a workload against an index. ideal is the number of
+    block ranges a perfectly ordered, non-overlapping index would need to
+    read for the same rows."""
+
+    workload: Workload
+    matching: Int64Array
+    ideal: Int64Array
+    pages_per_range: int = DEFAULT_PAGES_PER_RANGE
+    block_size: int = DEFAULT_BLOCK_SIZE
+
+    @property
+    def range_bytes(self) -> int:
+        return self.pages_per_range * self.block_size
+
+    def bytes_read(self) -> Int64Array:
+        return self.matching * self.range_bytes
+
+    def excess(self) -> Int64Array:
+        return self.matching - self.ideal
+
+    def excess_bytes(self) -> Int64Array:
+        return self.excess() * self.range_bytes
+
+    def summary(self) -> dict[str, float]:
+        if len(self.workload) == 0:
+            return {"windows": 0}
+        total_read = float(self.bytes_read().sum())
+        total_excess = float(self.excess_bytes().sum())
+        return {
+            "windows": len(self.workload),
+            "matching_mean": float(self.matching.mean()),
+            "matching_p50": float(np.percentile(self.matching, 50)),
+            "matching_p99": float(np.percentile(self.matching, 99)),
+            "matching_max": int(self.matching.max()),
+            "excess_mean": float(self.excess().mean()),
+            "excess_max": int(self.excess().max()),
+            "total_mb_read": total_read / 1e6,
+            "total_excess_mb": total_excess / 1e6,
+            "excess_fraction": total_excess / total_read if total_read else 0.0,
+        }
+
+
+def simulate(
+    block_ranges: BlockRanges,
+    workload: Workload,
+    pages_per_range: int = DEFAULT_PAGES_PER_RANGE,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+) -> WorkloadCost:
+    brs = as_block_range_array(block_ranges)
+    matching = count_matching(brs, workload)
+    fraction = data_fraction(brs, workload)
+    # rows that fill part of a block range still cost the whole range.
+    ideal = np.minimum(np.ceil(fraction - 1e-9).astype(np.int64), matching)
+    return WorkloadCost(workload, matching, ideal, pages_per_range, block_size)
+
+
+def format_summary(summary: dict[str, float]) -> str:
+    return "\n".join(
+        f"{k:>16}: {v:,.2f}" if isinstance(v, float) else f"{k:>16}: {v:,}"
+        for k, v in summary.items()
+    )
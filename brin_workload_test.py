@@ -0,0 +1,82 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from brin_lib import BlockRange, BlockRangeArray
+from brin_workload import (
+    Workload,
+    count_matching,
+    data_fraction,
+    parse_duration,
+    simulate,
+)
+from bro_relevant_blocks import filter_dt
+
+ts = datetime.fromtimestamp
+
+
+def test_parse_duration() -> None:
+    assert parse_duration("1h") == timedelta(hours=1)
+    assert parse_duration("30m") == timedelta(minutes=30)
+    assert parse_duration("1.5d") == timedelta(hours=36)
+    with pytest.raises(ValueError):
+        parse_duration("1 fortnight")
+
+
+def test_workload_every_aligned() -> None:
+    first, last = datetime(2020, 1, 1, 13), datetime(2020, 1, 3, 2)
+    workload = Workload.every(timedelta(days=1), first, last)
+    assert len(workload) == 3
+    windows = Workload.from_windows([(datetime(2020, 1, 1), datetime(2020, 1, 2))])
+    assert workload.start[0] == windows.start[0]
+    assert workload.end[0] == windows.end[0] - 1
+
+
+def test_count_matching_matches_filter_dt() -> None:
+    rng = random.Random(0)
+    brs = []
+    for i in range(300):
+        start = rng.randint(0, 1000)
+        brs.append(BlockRange(i, ts(start), ts(start + rng.randint(0, 50))))
+    windows = [(ts(a), ts(a + rng.randint(0, 100))) for a in range(-50, 1100, 7)]
+    counts = count_matching(
+        BlockRangeArray.from_block_ranges(brs), Workload.from_windows(windows)
+    )
+    assert list(counts) == [len(filter_dt(brs, a, b)) for a, b in windows]
+
+
+def test_data_fraction() -> None:
+    brs = BlockRangeArray.from_block_ranges(
+        [
+            BlockRange(0, ts(0), ts(100)),
+            BlockRange(1, ts(50), ts(150)),
+            BlockRange(2, ts(120), ts(120)),  # zero width
+        ]
+    )
+    workload = Workload.from_windows(
+        [(ts(0), ts(100)), (ts(25), ts(75)), (ts(100), ts(200)), (ts(300), None)]
+    )
+    fraction = data_fraction(brs, workload)
+    assert fraction == pytest.approx([1.5, 0.75, 1.5, 0.0], abs=1e-6)
+
+
+def test_simulate_ideal_index_has_no_excess() -> None:
+    # back to back block ranges, each covering 1 hour.
+    hour = timedelta(hours=1)
+    t0 = datetime(2020, 1, 1)
+    brs = [
+        BlockRange(i, t0 + i * hour, t0 + (i + 1) * hour - hour / 3600)
+        for i in range(48)
+    ]
+    cost = simulate(brs, Workload.every_over(timedelta(hours=4), brs))
+    assert list(cost.matching) == [4] * 12
+    assert list(cost.excess()) == [0] * 12
+    assert cost.summary()["total_excess_mb"] == 0
+    # 12 block ranges spanning everything: their rows are 1 block range worth
+    # per window, but every window has to read all 12.
+    wide = brs + [BlockRange(48 + i, t0, t0 + 48 * hour) for i in range(12)]
+    cost = simulate(wide, Workload.every_over(timedelta(hours=4), wide))
+    assert list(cost.matching[:12]) == [16] * 12
+    assert list(cost.excess()[:12]) == [11] * 12
+    assert cost.bytes_read()[0] == 16 * 128 * 8192
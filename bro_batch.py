@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+"""Analyze a directory (or manifest) of exports with a shared worker pool."""
+
+import argparse
+import json
+import logging
+import os
+import sys
+
+import brin_overlap
+from brin_batch import (
+    DEFAULT_LARGE_MB,
+    RENDERERS,
+    SUMMARY_CSV,
+    SUMMARY_JSON,
+    BatchOptions,
+    find_jobs,
+    format_summary,
+    run_batch,
+    write_summary,
+)
+from brin_profile import add_profile_args, profiler_from_args
+from brin_workload import parse_duration
+
+#%%
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    p = argparse.ArgumentParser()
+    p.add_argument(
+        "-i",
+        dest="input",
+        required=True,
+        help="directory of export CSVs (searched recursively, maybe compressed), "
+        "or a manifest file listing one export path per line",
+    )
+    p.add_argument(
+        "-o",
+        dest="output",
+        required=True,
+        help="output directory: one subdirectory of artifacts per export, "
+        "plus summary.csv and summary.json",
+    )
+    p.add_argument("-workers", type=int, help="worker processes (default: CPU count)")
+    p.add_argument(
+        "-max-large",
+        dest="max_large",
+        type=int,
+        default=1,
+        help="how many large exports may be analyzed at once",
+    )
+    p.add_argument(
+        "-large-mb",
+        dest="large_mb",
+        type=float,
+        default=DEFAULT_LARGE_MB,
+        help="exports of at least this many MB (on disk) count as large",
+    )
+    p.add_argument(
+        "-engine",
+        choices=brin_overlap.ENGINES,
+        default="first_fit",
+        help="level assignment",
+    )
+    p.add_argument(
+        "-renderer",
+        choices=RENDERERS,
+        default="raster",
+        help="visualization: stream (SVG) or raster (PNG, bounded size)",
+    )
+    p.add_argument("-noviz", action="store_true", help="skip the visualization")
+    p.add_argument("-nohist", action="store_true", help="skip the span histogram")
+    p.add_argument("-k", type=int, default=3, help="worst windows to report")
+    p.add_argument(
+        "-window",
+        type=parse_duration,
+        default="1d",
+        help="length of the worst windows (eg 1h, 1d)",
+    )
+    add_profile_args(p)
+    args = p.parse_args()
+    profiler = profiler_from_args(args)
+
+    if args.max_large < 1:
+        p.error("-max-large must be at least 1")
+    jobs = find_jobs(args.input, args.output)
+    if not jobs:
+        p.error(f"no exports found in {args.input}")
+    os.makedirs(args.output, exist_ok=True)
+    options = BatchOptions(
+        out_dir=args.output,
+        engine=args.engine,
+        renderer=args.renderer,
+        top_k=args.k,
+        window=args.window,
+        viz=not args.noviz,
+        hist=not args.nohist,
+    )
+    logging.info(f"analyzing {len(jobs)} exports...")
+    with profiler.stage("batch") as stage:
+        rows = run_batch(
+            jobs,
+            options,
+            workers=args.workers,
+            max_large=args.max_large,
+            large_bytes=int(args.large_mb * 10**6),
+        )
+        stage.items = len(jobs)
+    with open(os.path.join(args.output, SUMMARY_CSV), "w", newline="") as f:
+        write_summary(rows, f)
+    with open(os.path.join(args.output, SUMMARY_JSON), "w") as f:
+        json.dump(rows, f, indent=2)
+    print(format_summary(rows))
+    profiler.save()
+    failed = sum(row["status"] != "ok" for row in rows)
+    if failed:
+        logging.error(f"{failed} of {len(rows)} failed")
+        sys.exit(1)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+"""Report what changed between two exports of the same BRIN index."""
+
+import argparse
+import json
+import logging
+from datetime import timedelta
+from typing import Optional
+
+import brin_filenames
+from brin_diff import diff_exports, diff_report, format_report, write_changes
+from brin_lib import BlockRangeArray
+from brin_overlap import read_overlap
+from brin_cache import parse_csv_cached
+from brin_profile import add_profile_args, profiler_from_args
+from brin_workload import parse_duration
+
+
+def read_block_ranges(path: str, attnum: Optional[int] = None) -> BlockRangeArray:
+    lower = path.lower()
+    if lower.endswith(".json") or lower.endswith(brin_filenames.OVERLAP_BINARY_EXT):
+        return read_overlap(path).block_ranges()
+    return parse_csv_cached(path, attnum=attnum)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    p = argparse.ArgumentParser()
+    p.add_argument(
+        "-old",
+        required=True,
+        help="older export CSV, or cached BrinOverlap (JSON or .bro)",
+    )
+    p.add_argument("-new", required=True, help="newer export, same formats as -old")
+    p.add_argument(
+        "-k", dest="top_k", type=int, default=5, help="number of worsened windows"
+    )
+    p.add_argument(
+        "-window",
+        type=parse_duration,
+        default=timedelta(days=1),
+        help="length of the query windows compared (eg 1h, 1d)",
+    )
+    p.add_argument("-json", action="store_true", help="print report as JSON")
+    p.add_argument("-o", dest="output", help="output CSV of every changed block range")
+    p.add_argument(
+        "-attnum",
+        type=int,
+        help="column to compare, for multi-column exports",
+    )
+    add_profile_args(p)
+    args = p.parse_args()
+    profiler = profiler_from_args(args)
+
+    with profiler.stage("parse") as stage:
+        old = read_block_ranges(args.old, args.attnum)
+        new = read_block_ranges(args.new, args.attnum)
+        stage.items = len(old) + len(new)
+    with profiler.stage("diff") as stage:
+        report = diff_report(old, new, args.top_k, args.window)
+        stage.items = len(old) + len(new)
+    print(json.dumps(report) if args.json else format_report(report))
+    if args.output:
+        logging.info(f"writing changed block ranges to {args.output}...")
+        with profiler.stage("serialize"), open(args.output, "w", newline="") as f:
+            write_changes(diff_exports(old, new), f)
+    profiler.save()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+"""Report where in blknum order the table's insertion order broke down."""
+
+import argparse
+import json
+import sys
+from typing import Optional
+
+from matplotlib import pyplot as plt
+
+from brin_cache import parse_csv_cached
+from brin_disorder import (
+    DEFAULT_WINDOW,
+    DisorderSeries,
+    disorder_series,
+    rank_correlation,
+    write_series,
+)
+from brin_profile import add_profile_args, profiler_from_args
+
+
+def plot_series(series: DisorderSeries, outfile: Optional[str]) -> None:
+    fig, axes = plt.subplots(3, 1, sharex=True, figsize=(10, 8))
+    x = series.first_blknum
+    axes[0].plot(x, series.correlation)
+    axes[0].set_ylabel("rank correlation")
+    axes[0].set_ylim(-1.05, 1.05)
+    axes[1].plot(x, series.backwards / series.num_ranges)
+    axes[1].set_ylabel("fraction backwards")
+    axes[2].plot(x, series.median_span_secs / 3600)
+    axes[2].set_ylabel("median span (hours)")
+    axes[2].set_xlabel("blknum")
+    fig.suptitle("block range disorder by blknum")
+    if outfile:
+        fig.savefig(outfile)
+
+
+def format_worst(series: DisorderSeries, k: int) -> str:
+    lines = ["worst windows (lowest correlation):"]
+    for i in series.worst(k).tolist():
+        lines.append(
+            f"  blknum {series.first_blknum[i]:>12}..{series.last_blknum[i]:<12} "
+            f"corr {series.correlation[i]:6.3f}  "
+            f"backwards {series.backwards[i]:>6}/{series.num_ranges[i]}  "
+            f"median span {series.median_span_secs[i] / 3600:,.1f}h"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument(
+        "-i",
+        dest="input",
+        required=True,
+        help="input CSV (maybe compressed, - for stdin)",
+    )
+    p.add_argument(
+        "-window",
+        type=int,
+        default=DEFAULT_WINDOW,
+        help="number of block ranges per window",
+    )
+    p.add_argument(
+        "-k", dest="top_k", type=int, default=5, help="number of worst windows"
+    )
+    p.add_argument("-o", dest="output", help="output CSV of the per-window series")
+    p.add_argument("-plot", help="output image of the series (eg disorder.png)")
+    p.add_argument("-json", action="store_true", help="print summary as JSON")
+    p.add_argument(
+        "-fail-corr",
+        type=float,
+        help="exit with status 1 if any window's correlation is below this",
+    )
+    p.add_argument("-attnum", type=int, help="column of a multi-column export")
+    add_profile_args(p)
+    args = p.parse_args()
+    profiler = profiler_from_args(args)
+
+    with profiler.stage("parse") as stage:
+        brs = parse_csv_cached(args.input, attnum=args.attnum)
+        stage.items = len(brs)
+    with profiler.stage("disorder") as stage:
+        series = disorder_series(brs, args.window)
+        summary = {"correlation": round(rank_correlation(brs), 4)}
+        summary.update(series.summary())
+        stage.items = len(brs)
+    if args.json:
+        print(json.dumps(summary))
+    else:
+        print("\n".join(f"{k:>20}: {v}" for k, v in summary.items()))
+        print(format_worst(series, args.top_k))
+    if args.output:
+        print(f"writing series to {args.output}")
+        with profiler.stage("serialize"), open(args.output, "w", newline="") as f:
+            write_series(series, f)
+    if args.plot:
+        with profiler.stage("render"):
+            plot_series(series, args.plot)
+    profiler.save()
+    if args.fail_corr is not None and (series.correlation < args.fail_corr).any():
+        sys.exit(1)
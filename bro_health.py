@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+"""Print a compact overlap health report for monitoring."""
+
+import argparse
+import json
+import sys
+from datetime import timedelta
+from typing import Any
+
+import brin_filenames
+from brin_lib import BlockRanges, as_block_range_array, from_micros
+from brin_overlap import depth_profile, read_overlap
+from brin_cache import parse_csv_cached_by_attnum
+from brin_parser import DEFAULT_ATTNUM, select_attnum
+from brin_profile import add_profile_args, profiler_from_args
+from brin_workload import parse_duration
+
+
+def health_report(
+    block_ranges: BlockRanges, top_k: int = 5, window: timedelta = timedelta(days=1)
+) -> dict[str, Any]:
+    brs = as_block_range_array(block_ranges)
+    profile = depth_profile(brs)
+    report: dict[str, Any] = {"block_ranges": len(brs)}
+    if len(brs) == 0:
+        return report
+    report.update(
+        {
+            "min_val": from_micros(brs.start.min()).isoformat(),
+            "max_val": from_micros(brs.end.max()).isoformat(),
+            "depth_max": profile.max(),
+            "depth_mean": round(profile.mean(), 2),
+            "depth_p50": profile.percentile(50),
+            "depth_p99": profile.percentile(99),
+            "worst_windows": [
+                {"start": start.isoformat(), "end": end.isoformat(), "depth": depth}
+                for start, end, depth in profile.worst_windows(top_k, window)
+            ],
+        }
+    )
+    return report
+
+
+def format_report(report: dict[str, Any]) -> str:
+    lines = [f"block ranges: {report['block_ranges']}"]
+    if report["block_ranges"]:
+        lines += [
+            f"span: {report['min_val']} .. {report['max_val']}",
+            f"depth: max {report['depth_max']} p99 {report['depth_p99']} "
+            f"p50 {report['depth_p50']} mean {report['depth_mean']}",
+            "worst windows (max depth):",
+        ]
+        lines += [
+            f"  {w['depth']:6d}  {w['start']} .. {w['end']}"
+            for w in report["worst_windows"]
+        ]
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument(
+        "-i",
+        dest="input",
+        required=True,
+        help="input CSV, or cached BrinOverlap (JSON or .bro)",
+    )
+    p.add_argument(
+        "-k", dest="top_k", type=int, default=5, help="number of worst windows"
+    )
+    p.add_argument(
+        "-window",
+        type=parse_duration,
+        default=timedelta(days=1),
+        help="length of the worst windows (eg 1h, 1d)",
+    )
+    p.add_argument("-json", action="store_true", help="print report as JSON")
+    p.add_argument(
+        "-fail-p99",
+        type=int,
+        help="exit with status 1 if the p99 depth is above this value",
+    )
+    p.add_argument(
+        "-attnum",
+        type=int,
+        help="column of a multi-column export (default: report every column)",
+    )
+    add_profile_args(p)
+    args = p.parse_args()
+    profiler = profiler_from_args(args)
+
+    lower = args.input.lower()
+    with profiler.stage("parse") as stage:
+        if lower.endswith(".json") or lower.endswith(brin_filenames.OVERLAP_BINARY_EXT):
+            by_attnum = {DEFAULT_ATTNUM: read_overlap(args.input).block_ranges()}
+        else:
+            by_attnum = parse_csv_cached_by_attnum(args.input)
+            if args.attnum is not None:
+                by_attnum = {args.attnum: select_attnum(by_attnum, args.attnum)}
+        stage.items = sum(len(brs) for brs in by_attnum.values())
+    with profiler.stage("depth") as stage:
+        reports = {
+            attnum: health_report(brs, args.top_k, args.window)
+            for attnum, brs in by_attnum.items()
+        }
+        stage.items = sum(len(brs) for brs in by_attnum.values())
+    if len(reports) == 1:
+        (report,) = reports.values()
+        print(json.dumps(report) if args.json else format_report(report))
+    elif args.json:
+        print(json.dumps({"attnums": {str(a): r for a, r in reports.items()}}))
+    else:
+        print(
+            "\n".join(
+                f"=> attnum {attnum}\n{format_report(report)}"
+                for attnum, report in reports.items()
+            )
+        )
+    profiler.save()
+    if args.fail_p99 is not None and any(
+        report.get("depth_p99", 0) > args.fail_p99 for report in reports.values()
+    ):
+        sys.exit(1)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+"""Predict levels, depth and heap reads at coarser pages_per_range values."""
+
+import argparse
+import json
+import sys
+from datetime import timedelta
+
+from brin_cache import parse_csv_cached
+from brin_ppr import DEFAULT_FACTORS, format_report, what_if
+from brin_profile import add_profile_args, profiler_from_args
+from brin_workload import (
+    DEFAULT_BLOCK_SIZE,
+    DEFAULT_PAGES_PER_RANGE,
+    Workload,
+    parse_duration,
+)
+from bro_relevant_blocks import parse_date_queries
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument(
+        "-i",
+        dest="input",
+        required=True,
+        help="input CSV (maybe compressed, - for stdin)",
+    )
+    p.add_argument(
+        "-k",
+        dest="factors",
+        type=int,
+        nargs="+",
+        default=DEFAULT_FACTORS,
+        help="candidate multiples of the current pages_per_range",
+    )
+    p.add_argument(
+        "-ppr",
+        dest="pages_per_range",
+        type=int,
+        default=DEFAULT_PAGES_PER_RANGE,
+        help="current pages_per_range of the index",
+    )
+    p.add_argument(
+        "-bs",
+        dest="block_size",
+        type=int,
+        default=DEFAULT_BLOCK_SIZE,
+        help="block size in bytes",
+    )
+    group = p.add_mutually_exclusive_group()
+    group.add_argument(
+        "-windows",
+        help="file of query windows, one per line: 'start,end' or a single "
+        "datetime for a point query. Use - for stdin.",
+    )
+    group.add_argument(
+        "-every",
+        type=parse_duration,
+        default=timedelta(days=1),
+        help="query every window of this length (eg 1h, 1d) over the index "
+        "(default: 1d)",
+    )
+    p.add_argument("-attnum", type=int, help="column of a multi-column export")
+    p.add_argument("-json", action="store_true", help="print report as JSON")
+    add_profile_args(p)
+    args = p.parse_args()
+    profiler = profiler_from_args(args)
+
+    with profiler.stage("parse") as stage:
+        brs = parse_csv_cached(args.input, attnum=args.attnum)
+        stage.items = len(brs)
+    if args.windows == "-":
+        workload = Workload.from_windows(parse_date_queries(sys.stdin))
+    elif args.windows is not None:
+        with open(args.windows) as f:
+            workload = Workload.from_windows(parse_date_queries(f))
+    else:
+        workload = Workload.every_over(args.every, brs)
+    with profiler.stage("simulate") as stage:
+        report = what_if(
+            brs, workload, args.factors, args.pages_per_range, args.block_size
+        )
+        stage.items = len(brs)
+    print(json.dumps(report) if args.json else format_report(report))
+    profiler.save()
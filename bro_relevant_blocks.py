@@ -5,11 +5,22 @@
 #%%
 import argparse
 import math
+import sys
 from datetime import datetime
-from typing import Optional
+from typing import Iterable, Iterator, Optional, Union
 
-from brin_lib import BlockRange, overlaps_dates
-from brin_parser import parse_csv_file
+import brin_filenames
+from brin_index import BlockRangeIndex
+from brin_lib import (
+    BlockRange,
+    BlockRangeArray,
+    BlockRanges,
+    as_block_range_array,
+    overlaps_dates,
+)
+from brin_cache import parse_csv_cached_by_attnum
+from brin_parser import DEFAULT_ATTNUM, select_attnum
+from brin_profile import add_profile_args, profiler_from_args
 
 
 def block_range_matches(
@@ -23,9 +34,12 @@ def block_range_matches(
 
 
 def filter_dt(
-    block_ranges: list[BlockRange], dt: datetime, dt_end: Optional[datetime]
-) -> list[BlockRange]:
-    return [br for br in block_ranges if block_range_matches(br, dt, dt_end)]
+    block_ranges: BlockRanges, dt: datetime, dt_end: Optional[datetime]
+) -> BlockRangeArray:
+    """Vectorized block_range_matches over all block ranges."""
+    brs = as_block_range_array(block_ranges)
+    # a point search is an overlap search with a zero-width range.
+    return brs[brs.date_mask("overlap", dt, dt if dt_end is None else dt_end)]
 
 
 def br_with_span(br: BlockRange) -> str:
@@ -36,10 +50,32 @@ def br_with_span(br: BlockRange) -> str:
     return f"BR({br.blknum}, {t(br.start)}..{t(br.end)})  {span}"
 
 
+def parse_date_queries(
+    lines: Iterable[str],
+) -> Iterator[tuple[datetime, Optional[datetime]]]:
+    """Parse lines of "datetime" or "datetime,datetime" (a range search).
+    Blank lines and # comments are skipped."""
+    for line in lines:
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        dt, _, dt_end = line.partition(",")
+        yield (
+            datetime.fromisoformat(dt.strip()),
+            datetime.fromisoformat(dt_end.strip()) if dt_end else None,
+        )
+
+
 def stats(
-    brs: list[BlockRange], dt: datetime, dt_end: Optional[datetime], num_rows: int
+    brs: Union[BlockRanges, BlockRangeIndex],
+    dt: datetime,
+    dt_end: Optional[datetime],
+    num_rows: int,
 ) -> None:
-    rel_brs = filter_dt(brs, dt, dt_end)
+    if isinstance(brs, BlockRangeIndex):
+        rel_brs = brs.query(dt, dt_end)
+    else:
+        rel_brs = filter_dt(brs, dt, dt_end)
     print(
         f"num relevant block ranges: {len(rel_brs)}. {len(rel_brs)/len(brs)*100:.1f}% (of {len(brs)})"
     )
@@ -59,10 +95,14 @@ def stats(
 #%%
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("-i", dest="input", required=True, help="input CSV")
     parser.add_argument(
-        "-d",
+        "-i",
+        dest="input",
         required=True,
+        help="input CSV, or interval index saved with -save-index",
+    )
+    parser.add_argument(
+        "-d",
         dest="datetime",
         type=datetime.fromisoformat,
         help="datetime value to search for",
@@ -73,6 +113,16 @@ if __name__ == "__main__":
         type=datetime.fromisoformat,
         help="if given, do a range/between search from -d to -d2",
     )
+    parser.add_argument(
+        "-dates",
+        help="file with many searches, one per line: a datetime, or "
+        "'datetime,datetime' for a range search. Use - for stdin.",
+    )
+    parser.add_argument(
+        "-save-index",
+        action="store_true",
+        help="when reading a CSV, save its interval index for reuse with -i",
+    )
     parser.add_argument(
         "-n",
         dest="num_rows",
@@ -80,6 +130,57 @@ if __name__ == "__main__":
         type=int,
         help="number of block ranges to show",
     )
+    parser.add_argument(
+        "-attnum",
+        type=int,
+        help="column of a multi-column export (default: search every column)",
+    )
+    add_profile_args(parser)
     args = parser.parse_args()
-    brs = parse_csv_file(args.input)
-    stats(brs, args.datetime, args.datetime_end, args.num_rows)
+    profiler = profiler_from_args(args)
+    if args.datetime is None and args.dates is None:
+        parser.error("at least one of -d or -dates is required")
+    if args.datetime_end is not None and args.datetime is None:
+        parser.error("-d2 requires -d")
+
+    with profiler.stage("parse"):
+        if args.input.lower().endswith(brin_filenames.INDEX_EXT):
+            indexes = {DEFAULT_ATTNUM: BlockRangeIndex.load(args.input)}
+            multi_column = False
+        else:
+            by_attnum = parse_csv_cached_by_attnum(args.input)
+            # the saved index's name is the same with or without -attnum.
+            multi_column = len(by_attnum) > 1
+            if args.attnum is not None:
+                by_attnum = {args.attnum: select_attnum(by_attnum, args.attnum)}
+            indexes = {
+                attnum: BlockRangeIndex.build(brs) for attnum, brs in by_attnum.items()
+            }
+    if args.save_index and not args.input.lower().endswith(brin_filenames.INDEX_EXT):
+        index_path = brin_filenames.index_from_brinexport_csv(args.input)
+        with profiler.stage("serialize"):
+            for attnum, index in indexes.items():
+                path = index_path
+                if multi_column:
+                    path = brin_filenames.with_attnum(index_path, attnum)
+                print(f"saving index to {path}")
+                index.save(path)
+
+    queries = []
+    if args.datetime is not None:
+        queries.append((args.datetime, args.datetime_end))
+    if args.dates == "-":
+        queries.extend(parse_date_queries(sys.stdin))
+    elif args.dates is not None:
+        with open(args.dates) as f:
+            queries.extend(parse_date_queries(f))
+    with profiler.stage("filter") as stage:
+        for dt, dt_end in queries:
+            if len(queries) > 1:
+                print(f"=> {dt}" if dt_end is None else f"=> {dt} .. {dt_end}")
+            for attnum, index in indexes.items():
+                if len(indexes) > 1:
+                    print(f"attnum {attnum}:")
+                stats(index, dt, dt_end, args.num_rows)
+        stage.items = len(queries) * len(indexes)
+    profiler.save()
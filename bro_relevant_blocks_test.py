@@ -1,7 +1,7 @@
 from datetime import datetime
 
 from brin_lib import BlockRange
-from bro_relevant_blocks import block_range_matches
+from bro_relevant_blocks import block_range_matches, filter_dt, parse_date_queries
 
 ts = datetime.fromtimestamp
 
@@ -27,3 +27,27 @@ def test_block_range_matches_range() -> None:
     assert block_range_matches(br, ts(18), ts(21))
     # block contained by range
     assert block_range_matches(br, ts(5), ts(25))
+
+
+def test_filter_dt_matches_block_range_matches() -> None:
+    brs = [
+        BlockRange(1, ts(10), ts(20)),
+        BlockRange(2, ts(15), ts(30)),
+        BlockRange(3, ts(25), ts(40)),
+    ]
+    for dt, dt_end in [(ts(15), None), (ts(21), None), (ts(18), ts(26))]:
+        expected = [br for br in brs if block_range_matches(br, dt, dt_end)]
+        assert filter_dt(brs, dt, dt_end).to_block_ranges() == expected
+
+
+def test_parse_date_queries() -> None:
+    lines = [
+        "2020-01-01 12:00",
+        "",
+        "# comment",
+        "2020-01-01, 2020-01-02T06:00  # range",
+    ]
+    assert list(parse_date_queries(lines)) == [
+        (datetime(2020, 1, 1, 12), None),
+        (datetime(2020, 1, 1), datetime(2020, 1, 2, 6)),
+    ]
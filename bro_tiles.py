@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+"""Build a tile pyramid of BRIN overlaps and serve it with an HTML viewer."""
+
+import argparse
+import functools
+import logging
+import os
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import brin_filenames
+import brin_overlap
+from brin_cache import parse_csv_cached
+from brin_profile import add_profile_args, profiler_from_args
+from brin_tiles import DEFAULT_MAX_ZOOM, TILE_SIZE, build_pyramid
+from brin_viz import AGGREGATES, DEFAULT_COLORMAP
+
+
+def serve(directory: str, port: int) -> None:
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=directory)
+    with ThreadingHTTPServer(("localhost", port), handler) as server:
+        logging.info(
+            f"serving {directory} at http://localhost:{port}/ (ctrl-c to stop)"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+#%%
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    p = argparse.ArgumentParser()
+    p.add_argument(
+        "-i",
+        dest="input",
+        help="input CSV of brin page items OR input JSON/.bro of BrinOverlap data. "
+        "If omitted, just serve an existing pyramid.",
+    )
+    p.add_argument("-o", dest="output", required=True, help="tile directory")
+    p.add_argument(
+        "-z",
+        dest="max_zoom",
+        type=int,
+        default=DEFAULT_MAX_ZOOM,
+        help="deepest zoom level (about 2**z by 2**z tiles)",
+    )
+    p.add_argument("-tile", type=int, default=TILE_SIZE, help="tile size in pixels")
+    group = p.add_mutually_exclusive_group()
+    group.add_argument("-c", dest="colormap", default=DEFAULT_COLORMAP)
+    group.add_argument(
+        "-nc", action="store_const", const=None, dest="colormap", help="no colors"
+    )
+    p.add_argument("-agg", choices=AGGREGATES, default="mean")
+    p.add_argument(
+        "-engine",
+        choices=brin_overlap.ENGINES,
+        default="first_fit",
+        help="level assignment for CSV input",
+    )
+    p.add_argument(
+        "-workers",
+        type=int,
+        help="overlap and tile rendering processes (default: CPU count)",
+    )
+    p.add_argument("-serve", action="store_true", help="serve the viewer afterwards")
+    p.add_argument("-port", type=int, default=8000)
+    p.add_argument(
+        "-attnum",
+        type=int,
+        help="with CSV input: the column to show, for multi-column exports",
+    )
+    add_profile_args(p)
+    args = p.parse_args()
+    profiler = profiler_from_args(args)
+
+    if args.input is not None:
+        if brin_filenames.is_export_csv(args.input):
+            logging.info("reading input CSV...")
+            with profiler.stage("parse") as stage:
+                brs = parse_csv_cached(args.input, attnum=args.attnum)
+                stage.items = len(brs)
+            logging.info("computing overlap...")
+            with profiler.stage("overlap") as stage:
+                overlap = brin_overlap.compute_overlap(brs, args.engine, args.workers)
+                stage.items = len(brs)
+        else:
+            with profiler.stage("parse"):
+                overlap = brin_overlap.read_overlap(args.input)
+        with profiler.stage("render") as stage:
+            stage.items = build_pyramid(
+                overlap,
+                args.output,
+                max_zoom=args.max_zoom,
+                tile_size=args.tile,
+                colormap=args.colormap,
+                agg=args.agg,
+                workers=args.workers,
+            )
+        profiler.save()
+        logging.info("done✨")
+    elif not args.serve:
+        p.error("nothing to do, pass -i and/or -serve")
+    if args.serve:
+        if not os.path.exists(os.path.join(args.output, "manifest.json")):
+            p.error(f"no tile pyramid in {args.output}, build one with -i")
+        serve(args.output, args.port)
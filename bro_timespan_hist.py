@@ -11,19 +11,20 @@ from typing import Optional
 from matplotlib import pyplot as plt
 
 import brin_filenames
-from brin_lib import BlockRange
-from brin_parser import parse_csv_file
+from brin_lib import BlockRanges, as_block_range_array
+from brin_cache import parse_csv_cached
+from brin_profile import add_profile_args, profiler_from_args
 
 
 def plot_span_hist(
-    brs: list[BlockRange],
+    brs: BlockRanges,
     outfile: Optional[str],
     log: bool,
     xlim: Optional[float],
     ylim: Optional[float],
 ) -> None:
-    deltas = (br.end - br.start for br in brs)
-    hours = [d.total_seconds() / 3600 for d in deltas]
+    arr = as_block_range_array(brs)
+    hours = (arr.end - arr.start) / (3600 * 1e6)
     plt.hist(hours, 50, log=log)
     plt.title("distribution of block range time spans")
     plt.xlabel("block range end - start (hours)")
@@ -38,7 +39,12 @@ def plot_span_hist(
 #%%
 if __name__ == "__main__":
     p = argparse.ArgumentParser()
-    p.add_argument("-i", dest="input", required=True, help="input path to CSV")
+    p.add_argument(
+        "-i",
+        dest="input",
+        required=True,
+        help="input path to CSV (maybe compressed, - for stdin)",
+    )
     p.add_argument("-o", dest="output", help="output path for histogram")
     p.add_argument(
         "-after",
@@ -50,12 +56,27 @@ if __name__ == "__main__":
     )
     p.add_argument("-x", dest="xlim", type=float, help="set x limit")
     p.add_argument("-y", dest="ylim", type=float, help="set y limit")
+    p.add_argument(
+        "-attnum",
+        type=int,
+        help="column of a multi-column export",
+    )
+    add_profile_args(p)
     args = p.parse_args()
+    profiler = profiler_from_args(args)
 
     logging.basicConfig(level=logging.INFO)
-    brs = parse_csv_file(args.input, start=args.after)
+    with profiler.stage("parse") as stage:
+        brs = parse_csv_cached(args.input, attnum=args.attnum)
+        stage.items = len(brs)
+    with profiler.stage("filter") as stage:
+        brs = brs.filter_dates("overlap", args.after, None)
+        stage.items = len(brs)
     outfile = args.output or brin_filenames.timespan_hist_from_brinexport_csv(
         args.input, args.after
     )
     logging.info(f"writing timespan histogram to {outfile}")
-    plot_span_hist(brs, outfile, args.log, args.xlim, args.ylim)
+    with profiler.stage("render") as stage:
+        plot_span_hist(brs, outfile, args.log, args.xlim, args.ylim)
+        stage.items = len(brs)
+    profiler.save()
@@ -9,8 +9,20 @@ from typing import Literal, NamedTuple, Optional, cast
 
 import brin_filenames
 import brin_overlap
-import brin_parser
-from brin_viz import DEFAULT_WIDTH, DEFAULT_COLORMAP, svg
+from brin_cache import parse_csv_cached_by_attnum
+from brin_parser import select_attnum
+from brin_profile import Profiler, add_profile_args, profiler_from_args
+from brin_viz import (
+    AGGREGATES,
+    DEFAULT_WIDTH,
+    DEFAULT_COLORMAP,
+    Aggregate,
+    raster_png,
+    svg,
+    svg_stream,
+)
+
+RENDERERS = ("drawsvg", "stream", "raster")
 
 
 def _v_to_level(i: int) -> int:
@@ -20,53 +32,139 @@ def _v_to_level(i: int) -> int:
 class Args(NamedTuple):
     input: str
     after: Optional[datetime]
+    before: Optional[datetime]
+    min_blknum: Optional[int]
+    max_blknum: Optional[int]
     overlap: Optional[bool]
     output: Optional[str]
     width: float
     num_ticks: Optional[int]
     colormap: Optional[str]
+    engine: brin_overlap.Engine
+    bin: bool
+    renderer: Literal["stream", "drawsvg", "raster"]
+    agg: Aggregate
+    max_height: Optional[int]
+    attnum: Optional[int]
+    workers: Optional[int]
     v: Literal[1, 2, 3]
+    profile: Optional[str]
+    cprofile: Optional[str]
+    tracemalloc: Optional[str]
 
 
 def main(args: Args) -> None:
     logging.basicConfig(level=_v_to_level(args.v))
+    profiler = profiler_from_args(args)
+    run(args, profiler)
+    profiler.save()
+
 
+def run(args: Args, profiler: Profiler) -> None:
     outfile = args.output
-    if args.input.lower().endswith("csv"):
-        if outfile is None:
-            outfile = brin_filenames.viz_svg_from_brinexport_csv(args.input, args.after)
+    ext = ".png" if args.renderer == "raster" else ".svg"
+    window = (args.after, args.before, args.min_blknum, args.max_blknum)
+    has_window = any(w is not None for w in window)
+    # By default, use "within" for smaller viz's when filtering by date.
+    match_type: Literal["overlap", "within"] = "overlap" if args.overlap else "within"
+    if brin_filenames.is_export_csv(args.input):
         logging.info("reading input CSV...")
-        # By default, use "within" for smaller viz's when filtering with -after.
-        match_type: Literal["overlap", "within"] = (
-            "overlap" if args.overlap else "within"
-        )
-        block_ranges = brin_parser.parse_csv_file(
-            args.input, start=args.after, match_type=match_type
-        )
+        with profiler.stage("parse") as stage:
+            by_attnum = parse_csv_cached_by_attnum(args.input)
+            block_ranges = select_attnum(by_attnum, args.attnum)
+            stage.items = len(block_ranges)
+        # outputs are named like brin_overlap.py's for the column.
+        attnum = args.attnum if len(by_attnum) > 1 else None
+        if outfile is None:
+            outfile = brin_filenames.viz_svg_from_brinexport_csv(
+                args.input, args.after, ext, *window[1:]
+            )
+            if attnum is not None:
+                outfile = brin_filenames.with_attnum(outfile, attnum)
+        with profiler.stage("filter") as stage:
+            block_ranges = block_ranges.filter_dates(
+                match_type, args.after, args.before
+            ).filter_blknums(args.min_blknum, args.max_blknum)
+            stage.items = len(block_ranges)
         logging.info("computing overlap...")
-        overlap = brin_overlap.compute_overlap(block_ranges)
-        if args.after is None:
-            overlap_path = brin_filenames.overlap_json_from_brinexport_csv(args.input)
+        with profiler.stage("overlap") as stage:
+            overlap = brin_overlap.compute_overlap(
+                block_ranges, args.engine, args.workers
+            )
+            stage.items = len(block_ranges)
+        # the overlap cache is named after the input, so not for stdin.
+        if not has_window and args.input != brin_filenames.STDIN:
+            if args.bin:
+                overlap_path = brin_filenames.overlap_bin_from_brinexport_csv(
+                    args.input
+                )
+            else:
+                overlap_path = brin_filenames.overlap_json_from_brinexport_csv(
+                    args.input
+                )
+            if attnum is not None:
+                overlap_path = brin_filenames.with_attnum(overlap_path, attnum)
             logging.info(f"(saving overlap to {overlap_path}...)")
-            brin_overlap.write_overlap_file(overlap, overlap_path)
-    elif args.input.lower().endswith("json"):
-        if args.after is not None:
-            raise ValueError("-after only valid for raw CSV input")
-        if outfile is None:
-            outfile = brin_filenames.viz_svg_from_overlap_json(args.input)
-        logging.info("reading input JSON...")
-        overlap = brin_overlap.read_overlap_file(args.input)
+            with profiler.stage("serialize") as stage:
+                brin_overlap.write_overlap(overlap, overlap_path)
+                stage.items = len(block_ranges)
     else:
-        raise ValueError(f"-i input file <{args.input}> must be csv or json")
+        if args.input.lower().endswith("json"):
+            if outfile is None:
+                outfile = brin_filenames.viz_svg_from_overlap_json(
+                    args.input, ext, *window
+                )
+            logging.info("reading input JSON...")
+            with profiler.stage("parse"):
+                overlap = brin_overlap.read_overlap_file(args.input)
+        elif args.input.lower().endswith(brin_filenames.OVERLAP_BINARY_EXT):
+            if outfile is None:
+                outfile = brin_filenames.viz_svg_from_overlap_bin(
+                    args.input, ext, *window
+                )
+            logging.info("reading input binary overlap...")
+            with profiler.stage("parse"):
+                overlap = brin_overlap.read_overlap_binary(args.input)
+        else:
+            raise ValueError(f"-i input file <{args.input}> must be csv, json or bro")
+        if has_window:
+            # cached levels are reused as is, no need to recompute them.
+            with profiler.stage("filter"):
+                overlap = overlap.window(
+                    args.after, args.before, match_type, *window[2:]
+                )
 
-    logging.info("rendering SVG...")
-    svg(
-        overlap,
-        outfile=outfile,
-        width=args.width,
-        num_ticks=args.num_ticks,
-        colormap=args.colormap,
-    )
+    num_ranges = sum(len(level) for level in overlap.levels)
+    with profiler.stage("render") as stage:
+        if args.renderer == "raster":
+            logging.info("rendering PNG...")
+            raster_png(
+                overlap,
+                outfile,
+                width=int(args.width),
+                colormap=args.colormap,
+                agg=args.agg,
+                max_height=args.max_height,
+            )
+        elif args.renderer == "stream":
+            logging.info("rendering SVG...")
+            svg_stream(
+                overlap,
+                outfile,
+                width=args.width,
+                num_ticks=args.num_ticks,
+                colormap=args.colormap,
+            )
+        else:
+            logging.info("rendering SVG...")
+            svg(
+                overlap,
+                outfile=outfile,
+                width=args.width,
+                num_ticks=args.num_ticks,
+                colormap=args.colormap,
+            )
+        stage.items = num_ranges
     logging.info("done✨")
 
 
@@ -76,25 +174,41 @@ if __name__ == "__main__":
         "-i",
         dest="input",
         required=True,
-        help="input CSV of brin page items OR input JSON of BrinOverlap data",
+        help="input CSV of brin page items (maybe compressed, - for stdin) OR "
+        "input JSON/.bro of BrinOverlap data",
     )
     parser.add_argument(
         "-after",
         type=datetime.fromisoformat,
-        help="Only show BRs after this point. Only applicable for CSV input.",
+        help="Only show BRs after this point.",
+    )
+    parser.add_argument(
+        "-before",
+        type=datetime.fromisoformat,
+        help="Only show BRs before this point.",
+    )
+    parser.add_argument(
+        "-min-blk", dest="min_blknum", type=int, help="Only show BRs from this blknum."
+    )
+    parser.add_argument(
+        "-max-blk",
+        dest="max_blknum",
+        type=int,
+        help="Only show BRs up to this blknum (inclusive).",
     )
     parser.add_argument(
         "-overlap",
         action="store_true",
-        help="Makes -after 'inclusive' - returns blocks that include partial data.",
+        help="Makes -after/-before 'inclusive' - returns blocks that include "
+        "partial data.",
     )
-    parser.add_argument("-o", dest="output", help="output SVG file")
+    parser.add_argument("-o", dest="output", help="output SVG (or PNG) file")
     parser.add_argument(
         "-w",
         dest="width",
         type=float,
         default=DEFAULT_WIDTH,
-        help="width of SVG",
+        help="width of SVG (or PNG, in pixels)",
     )
     parser.add_argument(
         "-t",
@@ -116,10 +230,57 @@ if __name__ == "__main__":
         dest="colormap",
         help="disable coloring",
     )
+    parser.add_argument(
+        "-engine",
+        choices=brin_overlap.ENGINES,
+        default="first_fit",
+        help="level assignment for CSV input: first_fit keeps levels in blknum "
+        "order, sweep packs block ranges into the fewest possible levels",
+    )
+    parser.add_argument(
+        "-bin",
+        action="store_true",
+        help="save the overlap cache in the binary .bro format instead of JSON "
+        "(much smaller and faster to load)",
+    )
+    parser.add_argument(
+        "-renderer",
+        choices=RENDERERS,
+        default="drawsvg",
+        help="drawsvg is the original renderer; stream writes the SVG as it "
+        "goes, merging same colored block ranges into one path per level (much "
+        "faster, smaller output, but overlapping block ranges may stack "
+        "differently); raster writes a PNG, coloring each pixel by the blknums "
+        "of the block ranges in it (for huge indexes)",
+    )
+    parser.add_argument(
+        "-agg",
+        choices=AGGREGATES,
+        default="mean",
+        help="with -renderer raster: color pixels by the mean or min blknum",
+    )
+    parser.add_argument(
+        "-max-h",
+        dest="max_height",
+        type=int,
+        help="with -renderer raster: max image height, levels are merged to fit",
+    )
+    parser.add_argument(
+        "-attnum",
+        type=int,
+        help="with CSV input: the column to show, for multi-column exports",
+    )
+    parser.add_argument(
+        "-workers",
+        type=int,
+        help="with CSV input: processes for the first_fit engine (default: CPU "
+        "count)",
+    )
     parser.add_argument(
         "-v", type=int, default=1, choices=[0, 1, 2], help="logging verbosity"
     )
+    add_profile_args(parser)
     args = cast(Args, parser.parse_args())
-    if args.overlap and args.after is None:
-        raise ValueError("must include -after if passing -overlap")
+    if args.overlap and args.after is None and args.before is None:
+        raise ValueError("must include -after or -before if passing -overlap")
     main(args)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+"""Simulate the heap data read by a workload of time range queries."""
+
+import argparse
+import csv
+import sys
+from typing import TextIO
+
+import brin_filenames
+from brin_lib import from_micros
+from brin_cache import parse_csv_cached_by_attnum
+from brin_parser import select_attnum
+from brin_workload import (
+    DEFAULT_BLOCK_SIZE,
+    DEFAULT_PAGES_PER_RANGE,
+    Workload,
+    WorkloadCost,
+    format_summary,
+    parse_duration,
+    simulate,
+)
+from brin_profile import add_profile_args, profiler_from_args
+from bro_relevant_blocks import parse_date_queries
+
+
+def write_costs(cost: WorkloadCost, f: TextIO) -> None:
+    writer = csv.writer(f)
+    writer.writerow(
+        ["start", "end", "matching_ranges", "ideal_ranges", "mb_read", "excess_mb"]
+    )
+    rows = zip(
+        cost.workload.start.tolist(),
+        cost.workload.end.tolist(),
+        cost.matching.tolist(),
+        cost.ideal.tolist(),
+        cost.bytes_read().tolist(),
+        cost.excess_bytes().tolist(),
+    )
+    for start, end, matching, ideal, read, excess in rows:
+        writer.writerow(
+            [
+                from_micros(start).isoformat(),
+                from_micros(end).isoformat(),
+                matching,
+                ideal,
+                f"{read / 1e6:.1f}",
+                f"{excess / 1e6:.1f}",
+            ]
+        )
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument(
+        "-i",
+        dest="input",
+        required=True,
+        help="input CSV (maybe compressed, - for stdin)",
+    )
+    group = p.add_mutually_exclusive_group(required=True)
+    group.add_argument(
+        "-windows",
+        help="file of query windows, one per line: 'start,end' or a single "
+        "datetime for a point query. Use - for stdin.",
+    )
+    group.add_argument(
+        "-every",
+        type=parse_duration,
+        help="query every window of this length (eg 1h, 1d) over the index",
+    )
+    p.add_argument(
+        "-ppr",
+        dest="pages_per_range",
+        type=int,
+        default=DEFAULT_PAGES_PER_RANGE,
+        help="pages_per_range of the index",
+    )
+    p.add_argument(
+        "-bs",
+        dest="block_size",
+        type=int,
+        default=DEFAULT_BLOCK_SIZE,
+        help="block size in bytes",
+    )
+    p.add_argument("-o", dest="output", help="output CSV of per-window costs")
+    p.add_argument(
+        "-attnum",
+        type=int,
+        help="column of a multi-column export (default: simulate every column, "
+        "with -o saving each to its own _attnumN CSV)",
+    )
+    add_profile_args(p)
+    args = p.parse_args()
+    profiler = profiler_from_args(args)
+
+    with profiler.stage("parse") as stage:
+        by_attnum = parse_csv_cached_by_attnum(args.input)
+        if args.attnum is not None:
+            by_attnum = {args.attnum: select_attnum(by_attnum, args.attnum)}
+        stage.items = sum(len(brs) for brs in by_attnum.values())
+    windows = None
+    if args.windows == "-":
+        windows = Workload.from_windows(parse_date_queries(sys.stdin))
+    elif args.windows is not None:
+        with open(args.windows) as f:
+            windows = Workload.from_windows(parse_date_queries(f))
+    for attnum, brs in by_attnum.items():
+        # -every covers each column's own time span.
+        workload = Workload.every_over(args.every, brs) if windows is None else windows
+        with profiler.stage("simulate") as stage:
+            cost = simulate(brs, workload, args.pages_per_range, args.block_size)
+            stage.items = len(workload)
+        if len(by_attnum) > 1:
+            print(f"=> attnum {attnum}")
+        print(format_summary(cost.summary()))
+        if args.output:
+            output = args.output
+            if len(by_attnum) > 1:
+                output = brin_filenames.with_attnum(output, attnum)
+            print(f"writing per-window costs to {output}")
+            with profiler.stage("serialize") as stage, open(
+                output, "w", newline=""
+            ) as f:
+                write_costs(cost, f)
+                stage.items = len(workload)
+    profiler.save()